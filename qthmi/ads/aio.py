@@ -0,0 +1,229 @@
+"""Asyncio client for ADS devices.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+The :py:class:`AsyncADSConnector` offers the API of
+:py:class:`qthmi.ads.connector.ADSConnector` as coroutines for services
+running on asyncio. The ADS router of pyads multiplexes concurrent requests
+over one AMS connection, but accepts only one pending request per port. So
+the blocking calls are run in a pool of worker threads with a private port
+each and up to ``max_inflight`` requests are in flight at the same time
+without blocking the event loop. Errors are raised as
+:py:class:`ConnectionError` like by the blocking connector.
+
+Values of on-change notifications are received with ``async for``.
+
+Sample code::
+
+>>> async with AsyncADSConnector(pyads.AmsAddr("5.20.31.1.1.1"), 851) as plc:
+>>>     speed = await plc.read_from_plc("MAIN.fSpeed", pyads.PLCTYPE_LREAL)
+>>>     values = await plc.read_list_from_plc(items)
+>>>     async for position in plc.subscribe("MAIN.fPos", pyads.PLCTYPE_LREAL):
+>>>         print(position)
+
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, List, Optional, Sequence, Tuple
+
+import pyads
+from qthmi.main.connector import ConnectionError
+from .batch import MAX_SUM_REQUESTS, decode
+from .connector import ADDRESS_TYPE, ADSConnector
+from .gui import VALUE_TYPE
+from .notification import notification_attrib, sample_data
+from .ports import (
+    ADSError, PrivatePorts, add_device_notification, del_device_notification
+)
+from .symbols import CACHE_DIR
+
+
+#: default maximum number of concurrent requests
+MAX_INFLIGHT = 8
+
+
+class AsyncADSConnector:
+    """Asyncio connector for the ADS device.
+
+    :param pyads.AmsAddr ams_addr: address of the ADS device, defaults to
+        the local address
+    :param int port: port of the ADS device, defaults to PORT_SPS1 (801)
+    :param str symbol_cache: directory of the symbol table cache
+    :param int max_inflight: maximum number of concurrent requests
+
+    :ivar ADSConnector connector: blocking connector sending the requests,
+        sharing its symbol table, handles and circuit breaker
+
+    """
+
+    def __init__(
+        self,
+        ams_addr: pyads.AmsAddr = None,
+        port: int = None,
+        symbol_cache: Optional[str] = CACHE_DIR,
+        max_inflight: int = MAX_INFLIGHT,
+    ) -> None:
+        self.connector = ADSConnector(ams_addr, port, symbol_cache)
+        self.max_inflight = max_inflight
+        self._ports = PrivatePorts()
+        self._executor: Optional[ThreadPoolExecutor] = ThreadPoolExecutor(
+            max_inflight, thread_name_prefix="AsyncADSConnector",
+            initializer=self._ports.open,
+        )
+
+    @property
+    def ams_addr(self) -> pyads.AmsAddr:
+        """Address of the ADS device."""
+        return self.connector.ams_addr
+
+    async def __aenter__(self) -> "AsyncADSConnector":
+        return self
+
+    async def __aexit__(
+        self, exc_type: object, exc_value: object, tb: object
+    ) -> None:
+        await self.close()
+
+    async def _call(self, function: Callable[..., Any], *args: Any) -> Any:
+        if self._executor is None:
+            raise ConnectionError("Connector is closed")
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(function, *args)
+        )
+
+    async def close(self) -> None:
+        """Finish pending requests, release the handles and the port."""
+        if self._executor is None:
+            return
+        executor, self._executor = self._executor, None
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(executor, self.connector.close)
+        await loop.run_in_executor(None, executor.shutdown)
+        self._ports.close()
+
+    async def read_from_plc(
+        self, address: ADDRESS_TYPE, datatype: Any
+    ) -> VALUE_TYPE:
+        """Read value from the plc.
+
+        :param address: memory address or symbol name
+        :param datatype: ``c`` datatype, a PLCTYPE constant
+
+        """
+        return await self._call(self.connector.read_from_plc, address, datatype)
+
+    async def write_to_plc(
+        self, address: ADDRESS_TYPE, value: VALUE_TYPE, datatype: Any
+    ) -> None:
+        """Write value to the plc.
+
+        :param address: memory address or symbol name
+        :param value: value to be written
+        :param datatype: ``c`` datatype, a PLCTYPE constant
+
+        """
+        await self._call(self.connector.write_to_plc, address, value, datatype)
+
+    async def read_list_from_plc(
+        self, items: Sequence[Tuple[ADDRESS_TYPE, Any]]
+    ) -> List[VALUE_TYPE]:
+        """Read several values from the plc with ADS sum read requests.
+
+        The items are read with one sum read request per
+        :py:data:`qthmi.ads.batch.MAX_SUM_REQUESTS` items, all of them in
+        flight at the same time.
+
+        :param items: list of (address or symbol name, datatype) tuples
+        :return: list of values in the order of the items
+
+        """
+        chunks = await asyncio.gather(*(
+            self._call(
+                self.connector.read_list_from_plc,
+                items[start:start + MAX_SUM_REQUESTS],
+            )
+            for start in range(0, len(items), MAX_SUM_REQUESTS)
+        ))
+        return [value for chunk in chunks for value in chunk]
+
+    async def write_list_to_plc(
+        self, items: Sequence[Tuple[ADDRESS_TYPE, VALUE_TYPE, Any]]
+    ) -> None:
+        """Write several values to the plc with ADS sum write requests.
+
+        The items are written with one sum write request per
+        :py:data:`qthmi.ads.batch.MAX_SUM_REQUESTS` items, all of them in
+        flight at the same time.
+
+        :param items: list of (address or symbol name, value, datatype) tuples
+
+        """
+        await asyncio.gather(*(
+            self._call(
+                self.connector.write_list_to_plc,
+                items[start:start + MAX_SUM_REQUESTS],
+            )
+            for start in range(0, len(items), MAX_SUM_REQUESTS)
+        ))
+
+    async def subscribe(
+        self,
+        address: ADDRESS_TYPE,
+        datatype: Any,
+        cycle_time: int = 100,
+        max_delay: int = 100,
+        coalesce: bool = True,
+    ) -> AsyncIterator[VALUE_TYPE]:
+        """Receive the values of an on-change notification.
+
+        The notification is deleted when the iteration is left.
+
+        :param address: memory address or symbol name
+        :param datatype: ``c`` datatype, a PLCTYPE constant
+        :param int cycle_time: cycle time in ms the ADS device checks for changes
+        :param int max_delay: maximum delay in ms before a notification is sent
+        :param bool coalesce: if True only the latest of the values arrived
+            since the last iteration is returned
+
+        Sample code::
+
+        >>> async for value in connector.subscribe("MAIN.bAlarm", pyads.PLCTYPE_BOOL):
+        >>>     if value:
+        >>>         await notify_operator()
+
+        """
+        loop = asyncio.get_running_loop()
+        samples: "asyncio.Queue[bytes]" = asyncio.Queue()
+        group, offset = await self._call(self.connector._locate, address, datatype)
+
+        def callback(notification: Any) -> None:
+            # invoked in the thread of the ADS router, keep it short
+            loop.call_soon_threadsafe(samples.put_nowait, sample_data(notification)[1])
+
+        port = self.connector.port
+        if port is None:
+            raise ConnectionError("Connector is closed")
+        try:
+            handle = await self._call(
+                add_device_notification, port, self.ams_addr, group, offset,
+                notification_attrib(datatype, cycle_time, max_delay), callback,
+            )
+        except ADSError as e:
+            raise ConnectionError(
+                "Subscribing to address %s (ErrorCode %i)" % (address, e.err_code)
+            )
+
+        try:
+            while True:
+                raw = await samples.get()
+                while coalesce and not samples.empty():
+                    raw = samples.get_nowait()
+                yield decode(datatype, memoryview(raw))
+        finally:
+            try:
+                await self._call(
+                    del_device_notification, port, self.ams_addr, handle
+                )
+            except (ADSError, ConnectionError):
+                pass
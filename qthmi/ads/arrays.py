@@ -0,0 +1,225 @@
+"""Mappers for plc arrays and structures.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+An :py:class:`ADSArrayMapper` or :py:class:`ADSStructMapper` reads a whole
+ARRAY or STRUCT with one request instead of one mapper per element. The
+value is a numpy object viewing the receive buffer without a copy, see
+:py:class:`qthmi.ads.codecs.NumpyCodec`. The mappers work with all
+collections of mappers, e.g. :py:class:`qthmi.ads.batch.ADSPollGroup`.
+
+Single elements or fields are written without rewriting the whole block.
+Symbols accessed by a variable handle have no address to add the offset of
+the element to, the whole block is rewritten with the element replaced
+then. That requires the value to be read before.
+
+"""
+from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
+
+import numpy as np
+import pyads
+from pyads.constants import ADSIGRP_SYM_VALBYHND
+from qthmi.main.widgets import HMIObject
+from .codecs import write_value
+from .gui import ADSMapper, VALUE_TYPE
+from .ports import ADSError
+
+
+#: gui objects of a block mapper, a mapping assigns gui objects to single
+#: elements or fields
+GUI_OBJECTS_TYPE = Union[List[HMIObject], Mapping[Any, HMIObject]]
+
+
+class ADSBlockMapper(ADSMapper):
+    """Base class of mappers for values described by a numpy dtype.
+
+    :param plcAddress: plc address or symbol name
+    :param dtype: numpy dtype of the value, little endian
+    :param guiObjects: list of gui objects showing the whole value or a
+        mapping of element index or field name to gui object
+
+    Further keyword arguments are passed to :py:class:`ADSMapper`.
+
+    If the gui objects are given as mapping ``mapAdsToGui`` is called with
+    the value of the assigned element or field only.
+
+    """
+
+    def __init__(
+        self,
+        plcAddress: Union[int, str],
+        dtype: Any,
+        guiObjects: GUI_OBJECTS_TYPE,
+        hint: str = None,
+        **kwargs: Any
+    ) -> None:
+        self.dtype = np.dtype(dtype)
+        self.keyObjects: Dict[Any, HMIObject] = {}
+        if isinstance(guiObjects, Mapping):
+            self.keyObjects = dict(guiObjects)
+            guiObjects = list(guiObjects.values())
+        super(ADSBlockMapper, self).__init__(
+            plcAddress, self.dtype, guiObjects, hint, **kwargs  # type: ignore
+        )
+
+    def showValue(self, value: VALUE_TYPE) -> None:
+        if not self.keyObjects:
+            super(ADSBlockMapper, self).showValue(value)
+            return
+        for key, o in self.keyObjects.items():
+            self.mapAdsToGui(o, value[key])  # type: ignore
+
+    def hasChanged(self, value: VALUE_TYPE) -> bool:
+        last = self._shownValue
+        return last is None or value.tobytes() != last.tobytes()  # type: ignore
+
+    def _writePart(
+        self,
+        adsAdr: pyads.AmsAddr,
+        offset: int,
+        dtype: np.dtype,
+        value: Any,
+        block: Optional[np.ndarray],
+    ) -> None:
+        """Write a part of the value and store the changed block.
+
+        :param offset: byte offset of the part in the block
+        :param dtype: numpy dtype of the part
+        :param value: value of the part
+        :param block: current value with the part replaced, None if the value
+            has not been read yet
+
+        """
+        address = self.plcAdr + offset
+        if self.indexGroup == ADSIGRP_SYM_VALBYHND:
+            # the address is a handle of the whole variable
+            if block is None:
+                raise Exception(
+                    "error writing on %s. the value has not been read yet" %
+                    self.symbol
+                )
+            address, value, dtype = self.plcAdr, block, self.dtype
+        try:
+            write_value(adsAdr, self.indexGroup, address, value, dtype)
+        except ADSError as e:
+            raise Exception(
+                "error writing on address %i. error number %i" %
+                (address, e.err_code)
+            )
+        if block is not None:
+            self.currentValue = block
+
+
+class ADSArrayMapper(ADSBlockMapper):
+    """Mapper for a plc ARRAY.
+
+    The value is a numpy array of the given shape.
+
+    :param plcAddress: plc address or symbol name
+    :param elementType: numpy dtype of an element, e.g. ``"<f4"`` for REAL
+    :param shape: number of elements or shape of multi-dimensional arrays
+    :param guiObjects: list of gui objects showing the whole array or a
+        mapping of element index to gui object
+
+    Sample code::
+
+    >>> mapper = ADSArrayMapper("MAIN.aTemperatures", "<f4", 1000, [plot])
+    >>> mapper.read(adsAdr)
+    >>> mapper.writeElement(adsAdr, 10, 25.0)
+
+    """
+
+    def __init__(
+        self,
+        plcAddress: Union[int, str],
+        elementType: Any,
+        shape: Union[int, Tuple[int, ...]],
+        guiObjects: GUI_OBJECTS_TYPE,
+        hint: str = None,
+        **kwargs: Any
+    ) -> None:
+        self.elementType = np.dtype(elementType)
+        super(ADSArrayMapper, self).__init__(
+            plcAddress, np.dtype((self.elementType, shape)), guiObjects,
+            hint, **kwargs
+        )
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        """Shape of the array."""
+        return self.dtype.shape
+
+    def writeElement(
+        self, adsAdr: pyads.AmsAddr, index: Union[int, Tuple[int, ...]],
+        value: Any
+    ) -> None:
+        """Write a single element of the array.
+
+        :param qthmi.ads.constants.AmsAdr adsAdr: address to the ADS device
+        :param index: index of the element, a tuple for multi-dimensional
+            arrays
+        :param value: value to be written
+
+        """
+        if not isinstance(index, tuple):
+            index = (index,)
+        position = int(np.ravel_multi_index(index, self.shape))
+        current: Any = None
+        if self.currentValue is not None:
+            # a copy keeps the value shown last unchanged for hasChanged
+            current = self.currentValue.copy()  # type: ignore
+            current[index] = value  # type: ignore
+        self._writePart(
+            adsAdr, position * self.elementType.itemsize, self.elementType,
+            value, current
+        )
+
+
+class ADSStructMapper(ADSBlockMapper):
+    """Mapper for a plc STRUCT.
+
+    The value is a numpy structured scalar, its fields are accessed by name
+    like ``value["fActPos"]``. The field offsets of the dtype need to match
+    the packing of the plc, use ``align=True`` or explicit offsets for
+    TwinCAT 3 structures.
+
+    :param plcAddress: plc address or symbol name
+    :param dtype: numpy structured dtype, e.g.
+        ``np.dtype([("bEnable", "?"), ("fActPos", "<f8")], align=True)``
+    :param guiObjects: list of gui objects showing the whole structure or a
+        mapping of field name to gui object
+
+    Sample code::
+
+    >>> mapper = ADSStructMapper("MAIN.stAxis", dtype,
+    >>>                          {"fActPos": posLabel, "bEnable": checkBox})
+    >>> mapper.read(adsAdr)
+    >>> mapper.writeField(adsAdr, "bEnable", True)
+
+    """
+
+    def field(self, name: str) -> Any:
+        """Return the current value of a field.
+
+        :param str name: name of the field
+
+        """
+        if self.currentValue is None:
+            return None
+        return self.currentValue[name]  # type: ignore
+
+    def writeField(self, adsAdr: pyads.AmsAddr, name: str, value: Any) -> None:
+        """Write a single field of the structure.
+
+        :param qthmi.ads.constants.AmsAdr adsAdr: address to the ADS device
+        :param str name: name of the field
+        :param value: value to be written
+
+        """
+        dtype, offset = self.dtype.fields[name][:2]
+        current: Any = None
+        if self.currentValue is not None:
+            current = np.array(self.currentValue, self.dtype)
+            current[name] = value
+            current = current[()]
+        self._writePart(adsAdr, offset, dtype, value, current)
@@ -0,0 +1,471 @@
+"""Batched access to ADS devices by means of ADS sum commands.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+An ADS sum command bundles many single read or write requests in one ADS
+round-trip. Instead of sending one request per :py:class:`ADSMapper` a
+screen with hundreds of mappers only needs a handful of requests per
+refresh cycle.
+
+"""
+import struct
+import time
+from typing import Any, Iterable, List, Optional, Sequence, Tuple, Union
+
+import pyads
+from pyads.utils import platform_is_linux
+from qthmi.main.connector import ConnectionError
+from . import metrics
+from .codecs import byte_buffer, get_codec
+from .gui import ADSMapper, VALUE_TYPE
+from .ports import ADSError, ads_read_write
+from .quality import ERR_SYMBOL_NOT_FOUND
+
+
+ADSIGRP_SUMUP_READ = 0xF080  #: ADS sum read request
+ADSIGRP_SUMUP_WRITE = 0xF081  #: ADS sum write request
+
+#: maximum number of sub-requests per sum command as recommended by Beckhoff
+MAX_SUM_REQUESTS = 500
+
+#: error code of the items of a sum request that failed as a whole, e.g.
+#: because the connection is lost, the ADS code of an internal error
+ERR_REQUEST_FAILED = 0x1
+
+#: maximum size of the data of a sum read response in bytes, error codes
+#: included, larger sum reads are split. The ADS router of pyads on Linux
+#: (AdsLib) receives responses into a frame of 4096 bytes and drops larger
+#: ones with "Frame to long", the 8 bytes of result and length of the ADS
+#: read response leave 4088 bytes of data. Set it to None for routers
+#: without this limit, e.g. TwinCAT on Windows.
+MAX_SUM_RESPONSE: Optional[int] = 4088 if platform_is_linux() else None
+
+#: a sub-request of a sum command: (index group, index offset, length)
+REQUEST_TYPE = Tuple[int, int, int]
+
+
+def index_group(datatype: Any) -> int:
+    """Return the index group of the memory area for the given datatype.
+
+    :param datatype: ``c`` datatype, a PLCTYPE constant
+
+    """
+    return (pyads.INDEXGROUP_MEMORYBIT
+            if datatype == pyads.PLCTYPE_BOOL
+            else pyads.INDEXGROUP_MEMORYBYTE)
+
+
+def data_size(datatype: Any) -> int:
+    """Return the number of bytes needed for a value of the given datatype.
+
+    :param datatype: ``c`` datatype, a PLCTYPE constant
+
+    """
+    return get_codec(datatype).size
+
+
+def decode(datatype: Any, data: memoryview) -> VALUE_TYPE:
+    """Convert raw bytes received from the plc to a Python value.
+
+    :param datatype: ``c`` datatype, a PLCTYPE constant
+    :param memoryview data: raw bytes of the value
+
+    """
+    return get_codec(datatype).decode(data)
+
+
+def encode(datatype: Any, value: VALUE_TYPE) -> bytes:
+    """Convert a Python value to the raw bytes sent to the plc.
+
+    :param datatype: ``c`` datatype, a PLCTYPE constant
+    :param value: value to convert
+
+    """
+    return get_codec(datatype).encode(value)
+
+
+def sum_read(
+    adr: pyads.AmsAddr, requests: Sequence[REQUEST_TYPE]
+) -> List[Tuple[int, memoryview]]:
+    """Read several memory areas with one ADS sum read request.
+
+    If the response would exceed :py:data:`MAX_SUM_RESPONSE` the requests
+    are split into several sum reads. A single request larger than the limit
+    is sent on its own.
+
+    :param pyads.AmsAddr adr: address of the ADS device
+    :param requests: list of (index group, index offset, length) tuples,
+        at most :py:data:`MAX_SUM_REQUESTS` items
+    :return: list of (error code, data) tuples in the order of the requests,
+        the data is a view on the shared response buffer
+
+    """
+    if MAX_SUM_RESPONSE is not None and len(requests) > 1:
+        size = 0
+        for i, (_, _, length) in enumerate(requests):
+            size += 4 + length
+            if size > MAX_SUM_RESPONSE and i > 0:
+                return (
+                    _sum_read(adr, requests[:i])
+                    + sum_read(adr, requests[i:])
+                )
+    return _sum_read(adr, requests)
+
+
+def _sum_read(
+    adr: pyads.AmsAddr, requests: Sequence[REQUEST_TYPE]
+) -> List[Tuple[int, memoryview]]:
+    count = len(requests)
+    header = struct.pack(
+        "<%iI" % (3 * count), *(i for request in requests for i in request)
+    )
+    read_size = 4 * count + sum(request[2] for request in requests)
+
+    args = (
+        adr, ADSIGRP_SUMUP_READ, count, byte_buffer(read_size),
+        header, byte_buffer(len(header))
+    )
+    if metrics.enabled:
+        response = metrics.registry.measure(
+            adr, ADSIGRP_SUMUP_READ, read_size, len(header),
+            ads_read_write, *args
+        )
+    else:
+        response = ads_read_write(*args)
+    buffer = memoryview(response).cast("B")
+    errors = struct.unpack_from("<%iI" % count, buffer)
+
+    result = []
+    offset = 4 * count
+    for err, (_, _, length) in zip(errors, requests):
+        result.append((err, buffer[offset:offset + length]))
+        offset += length
+    return result
+
+
+def sum_write(
+    adr: pyads.AmsAddr, requests: Sequence[Tuple[int, int, bytes]]
+) -> List[int]:
+    """Write several memory areas with one ADS sum write request.
+
+    :param pyads.AmsAddr adr: address of the ADS device
+    :param requests: list of (index group, index offset, data) tuples,
+        at most :py:data:`MAX_SUM_REQUESTS` items
+    :return: list of error codes in the order of the requests
+
+    """
+    count = len(requests)
+    header = struct.pack(
+        "<%iI" % (3 * count),
+        *(i for ig, io, data in requests for i in (ig, io, len(data)))
+    )
+    payload = header + b"".join(data for _, _, data in requests)
+
+    args = (
+        adr, ADSIGRP_SUMUP_WRITE, count, byte_buffer(4 * count),
+        payload, byte_buffer(len(payload))
+    )
+    if metrics.enabled:
+        response = metrics.registry.measure(
+            adr, ADSIGRP_SUMUP_WRITE, 4 * count, len(payload),
+            ads_read_write, *args
+        )
+    else:
+        response = ads_read_write(*args)
+    return list(struct.unpack_from("<%iI" % count, memoryview(response).cast("B")))
+
+
+class ADSPollGroup:
+    """Collection of mappers that are read in ADS sum requests.
+
+    All mappers of the group are read with one sum read request per
+    :py:data:`MAX_SUM_REQUESTS` mappers. The response is split and the value
+    of each mapper is shown by :py:meth:`ADSMapper.update`. Mappers that
+    could not be read are marked bad by :py:meth:`ADSMapper.markBad`.
+    Mappers whose symbol name has not been resolved yet are not read, they
+    are marked bad with :py:data:`qthmi.ads.quality.ERR_SYMBOL_NOT_FOUND`.
+
+    :param mappers: mappers belonging to the group
+    :param int max_requests: maximum number of mappers per sum request
+    :param dispatcher: :py:class:`qthmi.ads.dispatch.GuiDispatcher`
+        showing the values in batches, None to show them immediately
+
+    :ivar float fetched: time of the last :py:meth:`fetch`, ``time.time``,
+        used as timestamp of the values
+    :ivar failed: (mapper, error code) tuples of the mappers that could not
+        be read by the last :py:meth:`dispatch`
+
+    Sample code::
+
+    >>> group = ADSPollGroup([mapper1, mapper2, mapper3])
+    >>> group.read(adsAdr)
+
+    When working with an :py:class:`qthmi.ads.connector.ADSConnector` pass
+    its ``ams_addr`` or use ``ADSConnector.read_list_from_plc``.
+
+    """
+
+    def __init__(
+        self,
+        mappers: Iterable[ADSMapper] = (),
+        max_requests: int = MAX_SUM_REQUESTS,
+        dispatcher: Any = None,
+    ) -> None:
+        self.mappers: List[ADSMapper] = list(mappers)
+        self.max_requests = max_requests
+        self.dispatcher = dispatcher
+        self.fetched: Optional[float] = None
+        self.failed: List[Tuple[ADSMapper, int]] = []
+
+    def add(self, mapper: ADSMapper) -> None:
+        """Add a mapper to the group.
+
+        :param ADSMapper mapper: mapper to add
+
+        """
+        self.mappers.append(mapper)
+
+    def remove(self, mapper: ADSMapper) -> None:
+        """Remove a mapper from the group.
+
+        :param ADSMapper mapper: mapper to remove
+
+        """
+        self.mappers.remove(mapper)
+
+    def fetch(self, adsAdr: pyads.AmsAddr) -> List[Tuple[int, VALUE_TYPE]]:
+        """Read the values of all mappers without showing them.
+
+        This does not touch the gui objects and may be called from any
+        thread, the result is shown by :py:meth:`dispatch`.
+
+        :param pyads.AmsAddr adsAdr: address to the ADS device
+        :return: list of (error code, value) tuples in the order of the mappers
+
+        """
+        results: List[Tuple[int, VALUE_TYPE]] = []
+        for start in range(0, len(self.mappers), self.max_requests):
+            chunk = self.mappers[start:start + self.max_requests]
+            requests = [
+                (m.indexGroup, m.plcAdr, m.codec.size)
+                for m in chunk if m.plcAdr is not None
+            ]
+            try:
+                responses = iter(sum_read(adsAdr, requests) if requests else ())
+            except ADSError as e:
+                raise ConnectionError(
+                    "Sum reading %i mappers (ErrorCode %i)" %
+                    (len(chunk), e.err_code)
+                )
+
+            for mapper in chunk:
+                if mapper.plcAdr is None:
+                    results.append((ERR_SYMBOL_NOT_FOUND, None))
+                    continue
+                err, data = next(responses)
+                results.append(
+                    (err, None) if err else (0, mapper.codec.decode(data))
+                )
+        self.fetched = time.time()
+        return results
+
+    def dispatch(
+        self, results: Sequence[Tuple[int, VALUE_TYPE]], timestamp: float = None
+    ) -> List[VALUE_TYPE]:
+        """Show the result of :py:meth:`fetch` on the gui objects.
+
+        The values are passed to the dispatcher of the group if it has one.
+        Mappers that could not be read are marked bad and listed in
+        :py:attr:`failed`, the other mappers are updated normally.
+
+        :param results: list of (error code, value) tuples
+        :param float timestamp: time the values have been read, by default
+            the time of the last :py:meth:`fetch`
+        :return: list of values in the order of the mappers, None for mappers
+            that could not be read
+
+        """
+        if timestamp is None:
+            timestamp = self.fetched
+        values: List[VALUE_TYPE] = []
+        failed: List[Tuple[ADSMapper, int]] = []
+        updates: List[Tuple[ADSMapper, VALUE_TYPE]] = []
+        for mapper, (err, value) in zip(self.mappers, results):
+            if err:
+                failed.append((mapper, err))
+            else:
+                updates.append((mapper, value))
+            values.append(value)
+
+        if self.dispatcher is None:
+            for mapper, err in failed:
+                mapper.markBad(err)
+            for mapper, value in updates:
+                mapper.update(value, timestamp)
+        else:
+            for mapper, err in failed:
+                self.dispatcher.submit_error(mapper, err)
+            self.dispatcher.submit_many(updates, timestamp)
+        self.failed = failed
+        return values
+
+    def mark_bad(self, error: int = 0) -> None:
+        """Mark all mappers bad, e.g. if the sum read request failed.
+
+        :param int error: ADS error code, 0 if unknown
+
+        """
+        self.failed = [(mapper, error) for mapper in self.mappers]
+        if self.dispatcher is None:
+            for mapper in self.mappers:
+                mapper.markBad(error)
+        else:
+            for mapper in self.mappers:
+                self.dispatcher.submit_error(mapper, error)
+
+    def read(self, adsAdr: pyads.AmsAddr) -> List[VALUE_TYPE]:
+        """Read the values of all mappers and show them on the gui objects.
+
+        :param pyads.AmsAddr adsAdr: address to the ADS device
+        :return: list of values in the order of the mappers, None for mappers
+            that could not be read
+
+        """
+        return self.dispatch(self.fetch(adsAdr))
+
+
+class ADSWriteBatch:
+    """Queue of write requests that are sent in ADS sum write requests.
+
+    Writes are collected with :py:meth:`write` and :py:meth:`write_to_plc`
+    and sent with one sum write request per :py:data:`MAX_SUM_REQUESTS`
+    items by :py:meth:`flush`. Used as a context manager the batch is
+    flushed when the block is left without an exception.
+
+    :param pyads.AmsAddr adsAdr: address to the ADS device
+    :param int max_requests: maximum number of items per sum request
+
+    :ivar errors: list of (mapper or address, error code) tuples of the
+        items that failed in the last flush
+    :ivar codes: error codes of all items of the last flush in the order
+        they were queued, also set if the flush raised
+
+    Sample code::
+
+    >>> with ADSWriteBatch(adsAdr) as batch:
+    >>>     for mapper, value in recipe:
+    >>>         batch.write(mapper, value)
+
+    """
+
+    def __init__(
+        self, adsAdr: pyads.AmsAddr, max_requests: int = MAX_SUM_REQUESTS
+    ) -> None:
+        self.adsAdr = adsAdr
+        self.max_requests = max_requests
+        self.errors: List[Tuple[Union[ADSMapper, int], int]] = []
+        self.codes: List[int] = []
+        self._pending: List[
+            Tuple[Optional[ADSMapper], int, int, VALUE_TYPE, Any]
+        ] = []
+
+    def __enter__(self) -> "ADSWriteBatch":
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        if exc_type is None:
+            self.flush()
+        else:
+            self._pending = []
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def write(self, mapper: ADSMapper, value: VALUE_TYPE) -> None:
+        """Queue writing a value to the plc address of a mapper.
+
+        The ``currentValue`` of the mapper is set when the value has been
+        written successfully.
+
+        :param ADSMapper mapper: mapper to write
+        :param value: value to be written
+
+        """
+        self._pending.append(
+            (mapper, mapper.indexGroup, mapper.plcAdr, value, mapper.plcDataType)
+        )
+
+    def write_to_plc(
+        self, address: int, value: VALUE_TYPE, datatype: Any, group: int = None
+    ) -> None:
+        """Queue writing a value to a plc address.
+
+        :param int address: memory address
+        :param value: value to be written
+        :param datatype: ``c`` datatype, a PLCTYPE constant
+        :param int group: index group, by default the plc memory area
+
+        """
+        if group is None:
+            group = index_group(datatype)
+        self._pending.append((None, group, address, value, datatype))
+
+    def flush(self) -> List[int]:
+        """Send all queued writes to the plc.
+
+        All items are sent even if some of them fail. The failed items are
+        stored in :py:attr:`errors` and a :py:class:`ConnectionError` for the
+        first one is raised afterwards. If a sum request fails as a whole its
+        items get the code :py:data:`ERR_REQUEST_FAILED`, the following
+        requests are sent anyway and the error of the first failed request is
+        raised.
+
+        :return: list of error codes in the order the items were queued
+
+        """
+        pending, self._pending = self._pending, []
+        self.errors = []
+        self.codes = codes = []
+        failure: Optional[ConnectionError] = None
+
+        for start in range(0, len(pending), self.max_requests):
+            chunk = pending[start:start + self.max_requests]
+            try:
+                results = self._send([item[1:] for item in chunk])
+            except ConnectionError as e:
+                failure = failure or e
+                results = [ERR_REQUEST_FAILED] * len(chunk)
+            for (mapper, _, address, value, _), err in zip(chunk, results):
+                codes.append(err)
+                if err:
+                    self.errors.append((mapper or address, err))
+                elif mapper is not None:
+                    mapper.currentValue = value
+
+        if failure is not None:
+            raise failure
+        if self.errors:
+            target, err = self.errors[0]
+            address = target.plcAdr if isinstance(target, ADSMapper) else target
+            raise ConnectionError(
+                "Writing on address %i (ErrorCode %i)" % (address, err)
+            )
+        return codes
+
+    def _send(
+        self, items: Sequence[Tuple[int, int, VALUE_TYPE, Any]]
+    ) -> List[int]:
+        """Write (index group, offset, value, datatype) items in one request.
+
+        :return: list of error codes in the order of the items
+
+        """
+        try:
+            return sum_write(self.adsAdr, [
+                (group, address, encode(datatype, value))
+                for group, address, value, datatype in items
+            ])
+        except ADSError as e:
+            raise ConnectionError(
+                "Sum writing %i values (ErrorCode %i)" % (len(items), e.err_code)
+            )
@@ -0,0 +1,203 @@
+"""Circuit breaker for unreachable ADS devices.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+When a plc goes offline every request waits for the full ADS timeout. After
+a number of consecutive connection failures the :py:class:`CircuitBreaker`
+opens and all further requests fail immediately with
+:py:class:`CircuitOpenError`. A background thread with a private port probes
+the device with exponential backoff, the breaker is half-open while a probe
+is running and closes as soon as the device answers again.
+
+Only requests sent by :py:meth:`CircuitBreaker.call` are guarded. The poll
+methods taking the address of the device, like
+:py:meth:`qthmi.ads.cache.ValueCache.poll`,
+:py:meth:`qthmi.ads.table.TagTable.poll` and
+:py:meth:`qthmi.ads.batch.ADSPollGroup.read`, send their requests directly.
+Call them through the breaker of the connector or pass the breaker to the
+:py:class:`qthmi.ads.scheduler.PollScheduler`::
+
+>>> connector.breaker.call(cache.poll, connector.ams_addr)
+
+"""
+import threading
+from typing import Any, Callable, Optional
+
+import pyads
+from qthmi.main.connector import ConnectionError
+from .ports import PrivatePorts, ads_read_state
+
+
+#: ADS error codes indicating that the device is not reachable
+CONNECTION_ERRORS = frozenset([
+    0x6,  # target port not found
+    0x7,  # target machine not found
+    0x745,  # timeout elapsed
+    0x748,  # ads port not opened
+    0x754,  # invalid response received
+    10060,  # connection timed out
+    10061,  # connection refused
+    10065,  # no route to host
+])
+
+
+class CircuitOpenError(ConnectionError):
+    """Request rejected because the ADS device is not reachable."""
+
+
+def is_connection_failure(error: Optional[BaseException]) -> bool:
+    """Check if an error was caused by an unreachable ADS device.
+
+    The error itself and the errors it was raised from are searched for an
+    ADS error with one of the :py:data:`CONNECTION_ERRORS`.
+
+    :param Exception error: raised error
+
+    """
+    while error is not None:
+        if getattr(error, "err_code", None) in CONNECTION_ERRORS:
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class CircuitBreaker:
+    """Circuit breaker for the requests to an ADS device.
+
+    :param probe: function checking if the device is reachable, raises an
+        exception if not
+    :param int failure_threshold: number of consecutive connection failures
+        opening the breaker
+    :param float backoff: delay in seconds before the first probe
+    :param float max_backoff: maximum delay in seconds between two probes
+
+    :ivar int failures: number of consecutive connection failures
+
+    The delay between two probes is doubled after each failed probe up to
+    ``max_backoff``. Requests are rejected while the breaker is open or
+    half-open, i.e. while a probe is running.
+
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(
+        self,
+        probe: Callable[[], Any],
+        failure_threshold: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+    ) -> None:
+        self.probe = probe
+        self.failure_threshold = failure_threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failures = 0
+
+        self._state = self.CLOSED
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def state(self) -> str:
+        """Current state, :py:attr:`CLOSED`, :py:attr:`OPEN` or
+        :py:attr:`HALF_OPEN`."""
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """True if requests are rejected."""
+        return self._state != self.CLOSED
+
+    def check(self) -> None:
+        """Raise :py:class:`CircuitOpenError` if the breaker is not closed."""
+        if self._state != self.CLOSED:
+            raise CircuitOpenError(
+                "Device not reachable, %i consecutive failures" % self.failures
+            )
+
+    def call(self, function: Callable[..., Any], *args: Any) -> Any:
+        """Call a function sending requests to the ADS device.
+
+        :param function: function to call
+        :param args: arguments of the function
+        :return: return value of the function
+
+        """
+        self.check()
+        try:
+            result = function(*args)
+        except Exception as e:
+            if is_connection_failure(e):
+                self.failure()
+            raise
+        self.success()
+        return result
+
+    def success(self) -> None:
+        """Record a successful request."""
+        self.failures = 0
+
+    def failure(self) -> None:
+        """Record a connection failure, open the breaker at the threshold."""
+        with self._lock:
+            self.failures += 1
+            if self._state != self.CLOSED or self.failures < self.failure_threshold:
+                return
+            self._state = self.OPEN
+            self._stop = threading.Event()
+            self._thread = threading.Thread(
+                target=self._probe_loop, args=(self._stop,),
+                name="CircuitBreaker", daemon=True,
+            )
+            self._thread.start()
+
+    def reset(self) -> None:
+        """Close the breaker and stop probing."""
+        self._stop.set()
+        with self._lock:
+            self._state = self.CLOSED
+            self.failures = 0
+
+    def _probe_loop(self, stop: threading.Event) -> None:
+        # the probes must not wait for the requests on the shared port
+        ports = PrivatePorts()
+        ports.open()
+        try:
+            delay = self.backoff
+            while not stop.wait(delay):
+                self._set_state(stop, self.HALF_OPEN)
+                try:
+                    self.probe()
+                except Exception:
+                    self._set_state(stop, self.OPEN)
+                    delay = min(delay * 2, self.max_backoff)
+                    continue
+                self._set_state(stop, self.CLOSED)
+                return
+        finally:
+            ports.close()
+
+    def _set_state(self, stop: threading.Event, state: str) -> None:
+        # a reset during the probe wins
+        with self._lock:
+            if stop.is_set():
+                return
+            self._state = state
+            if state == self.CLOSED:
+                self.failures = 0
+
+
+def probe_device(adr: pyads.AmsAddr) -> Callable[[], Any]:
+    """Return a probe function reading the state of an ADS device.
+
+    The probe thread of the breaker has a private port, so the probe does
+    not use the port shared with the gui thread.
+
+    :param pyads.AmsAddr adr: address of the ADS device
+
+    """
+    return lambda: ads_read_state(adr)
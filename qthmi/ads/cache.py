@@ -0,0 +1,374 @@
+"""Read-through cache of plc values shared by mappers and connectors.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+Several screens often show the same plc value with mappers of their own.
+The :py:class:`ValueCache` keeps one entry per (target, index group,
+offset, datatype), so all mappers and connectors reading the value within
+the time to live of the entry share one request. Mappers are attached to
+the entries by reference counting, :py:meth:`ValueCache.poll` reads the
+expired entries of all attached mappers with ADS sum read requests and an
+entry is dropped when its last mapper is detached. Written values update
+the cache immediately.
+
+Mappers only share the cache if they are attached or read with
+``ADSMapper.read(adsAdr, cache)``, a plain ``ADSMapper.read`` always sends
+a request.
+
+Sample code::
+
+>>> cache = ValueCache(ttl=0.1)
+>>> connector = ADSConnector(adr, 851, cache=cache)
+>>> for mapper in screen.mappers:
+>>>     cache.attach(mapper, connector.ams_addr)
+>>> timer.timeout.connect(lambda: cache.poll(connector.ams_addr))
+
+"""
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+import pyads
+from qthmi.main.connector import ConnectionError
+from .batch import MAX_SUM_REQUESTS, data_size, decode, sum_read
+from .codecs import read_value, write_value
+from .gui import VALUE_TYPE
+from .metrics import target_key
+from .ports import ADSError
+
+
+#: key of a cache entry: (target, index group, offset, datatype)
+KEY_TYPE = Tuple[str, int, int, Any]
+
+if TYPE_CHECKING:
+    from typing import Protocol
+
+    class CachedMapper(Protocol):
+        """Object attached to the cache, e.g. a :py:class:`qthmi.ads.gui.ADSMapper`."""
+
+        plcAdr: int
+        plcDataType: Any
+
+        @property
+        def indexGroup(self) -> int:
+            ...
+
+        def update(
+            self, value: VALUE_TYPE, timestamp: Optional[float] = None
+        ) -> None:
+            ...
+
+        def markBad(self, error: int = 0) -> None:
+            ...
+
+
+class CacheEntry:
+    """Cached value of a plc address.
+
+    :ivar value: last value read or written
+    :ivar float time: time of the value, ``time.monotonic``, None if the
+        value has not been read yet
+    :ivar float ttl: time to live of the value in seconds
+    :ivar int refs: number of attached mappers and acquired references
+    :ivar mappers: mappers updated with the value
+
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.value: VALUE_TYPE = None
+        self.time: Optional[float] = None
+        self.ttl = ttl
+        self.refs = 0
+        self.mappers: List["CachedMapper"] = []
+        self.lock = threading.Lock()
+
+    def fresh(self, now: float) -> bool:
+        """Return True if the value has not expired.
+
+        :param float now: current time, ``time.monotonic``
+
+        """
+        return self.time is not None and now - self.time < self.ttl
+
+
+class ValueCache:
+    """Cache of plc values with a time to live per entry.
+
+    All methods are thread-safe. Concurrent reads of an expired entry are
+    serialized, so only the first one sends a request.
+
+    :param float ttl: default time to live of the values in seconds
+
+    :ivar int hits: number of reads answered from the cache
+    :ivar int misses: number of reads sent to the plc
+
+    """
+
+    def __init__(self, ttl: float = 0.1) -> None:
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[KEY_TYPE, CacheEntry] = {}
+        self._lock = threading.Lock()
+        self._purged = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _entry(
+        self, key: KEY_TYPE, ttl: float = None, refs: int = 0
+    ) -> CacheEntry:
+        # the references are added with the same lock hold, else the new
+        # entry could be purged before
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = CacheEntry(
+                    self.ttl if ttl is None else ttl
+                )
+            elif ttl is not None:
+                entry.ttl = min(entry.ttl, ttl)
+            entry.refs += refs
+            return entry
+
+    def acquire(
+        self,
+        adr: pyads.AmsAddr,
+        group: int,
+        offset: int,
+        datatype: Any,
+        ttl: float = None,
+    ) -> CacheEntry:
+        """Add a reference to an entry, the entry is polled until released.
+
+        :param pyads.AmsAddr adr: address of the ADS device
+        :param int group: index group of the value
+        :param int offset: index offset of the value
+        :param datatype: ``c`` datatype, a PLCTYPE constant
+        :param float ttl: time to live in seconds, the shortest time to live
+            requested for an entry is used
+        :return: the entry
+
+        """
+        return self._entry((target_key(adr), group, offset, datatype), ttl, 1)
+
+    def release(
+        self, adr: pyads.AmsAddr, group: int, offset: int, datatype: Any
+    ) -> None:
+        """Remove a reference, the entry is dropped with the last reference.
+
+        :param pyads.AmsAddr adr: address of the ADS device
+        :param int group: index group of the value
+        :param int offset: index offset of the value
+        :param datatype: ``c`` datatype, a PLCTYPE constant
+
+        """
+        key = (target_key(adr), group, offset, datatype)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refs -= 1
+            if entry.refs <= 0:
+                del self._entries[key]
+
+    def attach(
+        self, mapper: "CachedMapper", adr: pyads.AmsAddr, ttl: float = None
+    ) -> None:
+        """Attach a mapper, it is updated by :py:meth:`poll`.
+
+        :param mapper: mapper to attach, an ADSMapper or any
+            object with its address attributes, ``update`` and ``markBad``
+        :param pyads.AmsAddr adr: address of the ADS device
+        :param float ttl: time to live of the value in seconds
+
+        """
+        entry = self.acquire(
+            adr, mapper.indexGroup, mapper.plcAdr, mapper.plcDataType, ttl
+        )
+        with self._lock:
+            entry.mappers.append(mapper)
+
+    def detach(self, mapper: "CachedMapper", adr: pyads.AmsAddr) -> None:
+        """Detach a mapper.
+
+        :param mapper: mapper to detach
+        :param pyads.AmsAddr adr: address of the ADS device
+
+        """
+        key = (target_key(adr), mapper.indexGroup, mapper.plcAdr, mapper.plcDataType)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or mapper not in entry.mappers:
+                return
+            entry.mappers.remove(mapper)
+        self.release(adr, mapper.indexGroup, mapper.plcAdr, mapper.plcDataType)
+
+    def get(
+        self,
+        adr: pyads.AmsAddr,
+        group: int,
+        offset: int,
+        datatype: Any,
+        ttl: float = None,
+    ) -> VALUE_TYPE:
+        """Return a value, read it from the plc if it has expired.
+
+        Values of addresses without references are cached for their time to
+        live as well.
+
+        :param pyads.AmsAddr adr: address of the ADS device
+        :param int group: index group of the value
+        :param int offset: index offset of the value
+        :param datatype: ``c`` datatype, a PLCTYPE constant
+        :param float ttl: time to live in seconds of a new entry
+        :raises ADSError: if the value could not be read
+
+        """
+        key = (target_key(adr), group, offset, datatype)
+        entry = self._entry(key, ttl)
+        with entry.lock:
+            if entry.fresh(time.monotonic()):
+                with self._lock:
+                    self.hits += 1
+                return entry.value
+            with self._lock:
+                self.misses += 1
+            value = read_value(adr, group, offset, datatype)
+            entry.value = value
+            entry.time = time.monotonic()
+        self._purge()
+        return value
+
+    def put(
+        self,
+        adr: pyads.AmsAddr,
+        group: int,
+        offset: int,
+        datatype: Any,
+        value: VALUE_TYPE,
+    ) -> None:
+        """Store a value written to the plc.
+
+        Only existing entries are updated.
+
+        :param pyads.AmsAddr adr: address of the ADS device
+        :param int group: index group of the value
+        :param int offset: index offset of the value
+        :param datatype: ``c`` datatype, a PLCTYPE constant
+        :param value: value written to the plc
+
+        """
+        entry = self._entries.get((target_key(adr), group, offset, datatype))
+        if entry is None:
+            return
+        with entry.lock:
+            entry.value = value
+            entry.time = time.monotonic()
+
+    def write(
+        self,
+        adr: pyads.AmsAddr,
+        group: int,
+        offset: int,
+        value: VALUE_TYPE,
+        datatype: Any,
+    ) -> None:
+        """Write a value to the plc and store it in the cache.
+
+        :param pyads.AmsAddr adr: address of the ADS device
+        :param int group: index group of the value
+        :param int offset: index offset of the value
+        :param value: value to be written
+        :param datatype: ``c`` datatype, a PLCTYPE constant
+        :raises ADSError: if the value could not be written
+
+        """
+        write_value(adr, group, offset, value, datatype)
+        self.put(adr, group, offset, datatype, value)
+
+    def invalidate(self, adr: pyads.AmsAddr = None) -> None:
+        """Expire all values, of one ADS device if given.
+
+        :param pyads.AmsAddr adr: address of the ADS device
+
+        """
+        target = None if adr is None else target_key(adr)
+        with self._lock:
+            for key, entry in self._entries.items():
+                if target is None or key[0] == target:
+                    entry.time = None
+
+    def poll(self, adr: pyads.AmsAddr) -> int:
+        """Read the expired entries with references and update their mappers.
+
+        The entries are read with one sum read request per
+        :py:data:`qthmi.ads.batch.MAX_SUM_REQUESTS` entries. The mappers of
+        entries that could not be read are marked bad, the other entries
+        are updated. The requests do not pass the circuit breaker of a
+        connector, see :py:mod:`qthmi.ads.breaker`.
+
+        :param pyads.AmsAddr adr: address of the ADS device
+        :return: number of entries read
+        :raises ConnectionError: if a sum read request failed, after the
+            remaining requests have been sent
+
+        """
+        target = target_key(adr)
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                (key, entry) for key, entry in self._entries.items()
+                if key[0] == target and entry.refs > 0 and not entry.fresh(now)
+            ]
+
+        error: Optional[ConnectionError] = None
+        for start in range(0, len(expired), MAX_SUM_REQUESTS):
+            chunk = expired[start:start + MAX_SUM_REQUESTS]
+            try:
+                results = sum_read(adr, [
+                    (group, offset, data_size(datatype))
+                    for (_, group, offset, datatype), _ in chunk
+                ])
+            except ADSError as e:
+                for _, entry in chunk:
+                    for mapper in list(entry.mappers):
+                        mapper.markBad(e.err_code)
+                if error is None:
+                    error = ConnectionError(
+                        "Sum reading %i addresses (ErrorCode %i)" %
+                        (len(chunk), e.err_code)
+                    )
+                continue
+
+            now = time.monotonic()
+            timestamp = time.time()
+            for ((_, _, _, datatype), entry), (err, data) in zip(chunk, results):
+                if err:
+                    for mapper in list(entry.mappers):
+                        mapper.markBad(err)
+                    continue
+                value = decode(datatype, data)
+                with entry.lock:
+                    entry.value = value
+                    entry.time = now
+                for mapper in list(entry.mappers):
+                    mapper.update(value, timestamp)
+        with self._lock:
+            self.misses += len(expired)
+        if error is not None:
+            raise error
+        return len(expired)
+
+    def _purge(self) -> None:
+        # drop expired entries without references, at most once per second
+        now = time.monotonic()
+        if now - self._purged < 1.0:
+            return
+        self._purged = now
+        with self._lock:
+            for key in [
+                key for key, entry in self._entries.items()
+                if entry.refs <= 0 and not entry.fresh(now)
+            ]:
+                del self._entries[key]
@@ -0,0 +1,195 @@
+"""Coalescing and rate limiting of writes from gui objects.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+Dragging a slider emits hundreds of signals per second. Writing every value
+floods the plc with requests. The :py:class:`ADSWriteCoalescer` keeps only
+the latest pending value per address and sends all pending values in one
+ADS sum write request per interval. Values that could not be written are
+retried until they are written or replaced by a newer value, so the last
+value always reaches the plc. Values that can never be written, because they
+do not fit the datatype or the symbol of the mapper is not resolved, are
+dropped and reported, the other values are sent anyway.
+
+"""
+import struct
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import pyads
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from .batch import MAX_SUM_REQUESTS, encode, index_group, sum_write
+from .gui import ADSMapper, VALUE_TYPE
+from .ports import ADSError
+
+
+#: key of a plc value: (index group, address, datatype)
+KEY_TYPE = Tuple[int, int, Any]
+
+
+class ADSWriteCoalescer(QObject):
+    """Write values to the plc at most once per interval.
+
+    Values written within the interval are collected, only the latest value
+    per address is kept. The first write starts the interval, at its end all
+    pending values are sent with one sum write request per
+    :py:data:`qthmi.ads.batch.MAX_SUM_REQUESTS` values. :py:meth:`flush`
+    sends the pending values immediately, e.g. when a slider is released.
+
+    If a value cannot be written it is retried after *retry_interval*
+    unless a newer value for the address has been written meanwhile. Values
+    that cannot be encoded and writes of mappers with unresolved symbols are
+    dropped, each is reported by :py:attr:`error`.
+
+    :param pyads.AmsAddr adsAdr: address to the ADS device
+    :param int interval: interval in ms between two sum write requests
+    :param int retry_interval: delay in ms before failed values are retried
+    :param QObject parent: parent object
+
+    :ivar int requested: number of values passed to :py:meth:`write`
+    :ivar int sent: number of values written to the plc
+
+    Sample code::
+
+    >>> coalescer = ADSWriteCoalescer(adsAdr, interval=50)
+    >>> coalescer.error.connect(statusBar.showMessage)
+    >>> slider.valueChanged.connect(lambda v: coalescer.write(mapper, v))
+    >>> slider.sliderReleased.connect(coalescer.flush)
+
+    """
+
+    error = pyqtSignal(str)
+
+    def __init__(
+        self,
+        adsAdr: pyads.AmsAddr,
+        interval: int = 50,
+        retry_interval: int = 1000,
+        parent: QObject = None,
+    ) -> None:
+        super(ADSWriteCoalescer, self).__init__(parent)
+        self.adsAdr = adsAdr
+        self.interval = interval
+        self.retry_interval = retry_interval
+        self.requested = 0
+        self.sent = 0
+
+        self._pending: Dict[KEY_TYPE, Tuple[Optional[ADSMapper], VALUE_TYPE]] = (
+            OrderedDict()
+        )
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.flush)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def write(self, mapper: ADSMapper, value: VALUE_TYPE) -> None:
+        """Queue writing a value to the plc address of a mapper.
+
+        The ``currentValue`` of the mapper is set immediately.
+
+        :param ADSMapper mapper: mapper to write
+        :param value: value to be written
+
+        """
+        mapper.currentValue = value
+        self._queue(
+            (mapper.indexGroup, mapper.plcAdr, mapper.plcDataType), mapper, value
+        )
+
+    def write_to_plc(
+        self, address: int, value: VALUE_TYPE, datatype: Any, group: int = None
+    ) -> None:
+        """Queue writing a value to a plc address.
+
+        :param int address: memory address
+        :param value: value to be written
+        :param datatype: ``c`` datatype, a PLCTYPE constant
+        :param int group: index group, by default the plc memory area
+
+        """
+        if group is None:
+            group = index_group(datatype)
+        self._queue((group, address, datatype), None, value)
+
+    def _queue(
+        self, key: KEY_TYPE, mapper: Optional[ADSMapper], value: VALUE_TYPE
+    ) -> None:
+        self.requested += 1
+        # a newer value moves the address to the end of the queue
+        self._pending.pop(key, None)
+        self._pending[key] = (mapper, value)
+        if not self.timer.isActive():
+            self.timer.start(self.interval)
+
+    def flush(self) -> None:
+        """Send all pending values to the plc now."""
+        self.timer.stop()
+        pending, self._pending = self._pending, OrderedDict()
+        keys = []
+        requests = []
+        for key, (mapper, value) in pending.items():
+            data = self._encode(key, mapper, value)
+            if data is not None:
+                keys.append(key)
+                requests.append((key[0], key[1], data))
+        failed = []
+
+        for start in range(0, len(keys), MAX_SUM_REQUESTS):
+            chunk = keys[start:start + MAX_SUM_REQUESTS]
+            try:
+                results = sum_write(
+                    self.adsAdr, requests[start:start + MAX_SUM_REQUESTS]
+                )
+            except ADSError as e:
+                self.error.emit(
+                    "Sum writing %i values (ErrorCode %i)" %
+                    (len(chunk), e.err_code)
+                )
+                failed += chunk
+                continue
+
+            for key, err in zip(chunk, results):
+                if err:
+                    self.error.emit(
+                        "Writing on address %i (ErrorCode %i)" % (key[1], err)
+                    )
+                    failed.append(key)
+                else:
+                    self.sent += 1
+
+        # retry failed values, unless a newer value has been queued meanwhile
+        retry = OrderedDict((key, pending[key]) for key in failed)
+        if retry:
+            for key in self._pending:
+                retry.pop(key, None)
+            retry.update(self._pending)
+            self._pending = retry
+            self.timer.start(self.retry_interval)
+        elif self._pending:
+            self.timer.start(self.interval)
+
+    def _encode(
+        self, key: KEY_TYPE, mapper: Optional[ADSMapper], value: VALUE_TYPE
+    ) -> Optional[bytes]:
+        # a value that cannot be sent now will never be sent, it is dropped
+        group, address, datatype = key
+        if address is None:
+            self.error.emit(
+                "Writing on %s dropped, the symbol is not resolved" %
+                (mapper.symbol if mapper is not None else None)
+            )
+            return None
+        try:
+            return encode(datatype, value)
+        except (struct.error, OverflowError, TypeError, ValueError) as e:
+            self.error.emit(
+                "Writing %r on address %i dropped: %s" % (value, address, e)
+            )
+            return None
+
+    def clear(self) -> None:
+        """Discard all pending values."""
+        self.timer.stop()
+        self._pending.clear()
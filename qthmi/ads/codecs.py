@@ -0,0 +1,324 @@
+"""Precompiled conversion of plc values from and to raw bytes.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+Converting a value with ctypes allocates a ctypes object for every single
+value. The :py:class:`Codec` of a datatype wraps a precompiled
+:py:class:`struct.Struct` instead and decodes values directly from the
+buffer of a block or sum read response, so thousands of values can be
+decoded per refresh cycle without creating intermediate objects.
+
+The codec of a datatype is created on first use by :py:func:`get_codec`.
+Besides the ctypes PLCTYPE constants numpy dtypes are accepted as datatype,
+they are decoded to numpy arrays viewing the receive buffer. Datatypes
+without a struct format, e.g. ctypes structures, can be added with
+:py:func:`register`.
+
+"""
+import ctypes
+import functools
+import struct
+from typing import Any, Dict, Iterable, List, Tuple, Type
+
+import numpy as np
+import pyads
+from pyads.constants import STRING_BUFFER
+from . import metrics
+from .ports import ads_read, ads_write
+
+
+@functools.lru_cache(maxsize=None)
+def byte_buffer(size: int) -> Type[ctypes.Structure]:
+    """Return a ctypes type for a raw buffer of *size* bytes.
+
+    pyads creates the write data of a request with ``datatype(value)`` and
+    returns structures without a ``value`` attribute unchanged. So the
+    returned type can be used as read and as write datatype for transferring
+    raw bytes.
+
+    :param int size: size of the buffer in bytes
+
+    """
+
+    class ByteBuffer(ctypes.Structure):
+        _fields_ = [("data", ctypes.c_ubyte * size)]
+
+        def __init__(self, data: bytes = b"") -> None:
+            super(ByteBuffer, self).__init__()
+            ctypes.memmove(ctypes.addressof(self), data, len(data))
+
+    return ByteBuffer
+
+
+class Codec:
+    """Conversion of values of a fixed size datatype.
+
+    :param str fmt: struct format of a single value, little endian
+
+    :ivar struct: precompiled struct of a single value
+    :ivar int size: size of a value in bytes
+
+    """
+
+    def __init__(self, fmt: str) -> None:
+        self.struct = struct.Struct(fmt)
+        self.size = self.struct.size
+
+    def __repr__(self) -> str:
+        return "<%s %r>" % (type(self).__name__, self.struct.format)
+
+    def decode(self, buffer: Any, offset: int = 0) -> Any:
+        """Decode a value from a buffer.
+
+        :param buffer: bytes, bytearray or memoryview with the raw data
+        :param int offset: position of the value in the buffer
+
+        """
+        return self.struct.unpack_from(buffer, offset)[0]
+
+    def decode_many(self, buffer: Any, count: int, offset: int = 0) -> List[Any]:
+        """Decode consecutive values of this datatype from a buffer.
+
+        :param buffer: bytes, bytearray or memoryview with the raw data
+        :param int count: number of values
+        :param int offset: position of the first value in the buffer
+
+        """
+        data = memoryview(buffer)[offset:offset + count * self.size]
+        return [value for value, in self.struct.iter_unpack(data)]
+
+    def encode(self, value: Any) -> bytes:
+        """Encode a value to raw bytes.
+
+        :param value: value to encode
+
+        """
+        return self.struct.pack(value)
+
+
+class ArrayCodec(Codec):
+    """Conversion of ctypes arrays like ``pyads.PLCTYPE_INT * 10``.
+
+    Values are decoded to lists.
+
+    :param str fmt: struct format of a single element, little endian
+    :param int length: number of elements
+
+    """
+
+    def __init__(self, fmt: str, length: int) -> None:
+        super(ArrayCodec, self).__init__("<%i%s" % (length, fmt.lstrip("<")))
+        self.length = length
+
+    def decode(self, buffer: Any, offset: int = 0) -> List[Any]:
+        return list(self.struct.unpack_from(buffer, offset))
+
+    def decode_many(self, buffer: Any, count: int, offset: int = 0) -> List[Any]:
+        data = memoryview(buffer)[offset:offset + count * self.size]
+        return [list(values) for values in self.struct.iter_unpack(data)]
+
+    def encode(self, value: Any) -> bytes:
+        return self.struct.pack(*value)
+
+
+class StringCodec(Codec):
+    """Conversion of null terminated strings of a fixed buffer size.
+
+    :param int size: size of the string buffer in bytes
+
+    """
+
+    def __init__(self, size: int = STRING_BUFFER) -> None:
+        super(StringCodec, self).__init__("<%is" % size)
+
+    def decode(self, buffer: Any, offset: int = 0) -> str:
+        data = self.struct.unpack_from(buffer, offset)[0]
+        return data.split(b"\x00", 1)[0].decode("utf-8")
+
+    def decode_many(self, buffer: Any, count: int, offset: int = 0) -> List[Any]:
+        return [
+            self.decode(buffer, offset + i * self.size) for i in range(count)
+        ]
+
+    def encode(self, value: Any) -> bytes:
+        data = str(value).encode("utf-8")[:self.size - 1]
+        return data + b"\x00"
+
+
+class CtypesCodec(Codec):
+    """Fallback conversion by means of ctypes for datatypes without format.
+
+    :param datatype: ``c`` datatype
+
+    """
+
+    def __init__(self, datatype: Any) -> None:
+        self.datatype = datatype
+        self.struct = struct.Struct("<%is" % ctypes.sizeof(datatype))
+        self.size = self.struct.size
+
+    def __repr__(self) -> str:
+        return "<%s %s>" % (type(self).__name__, self.datatype.__name__)
+
+    def decode(self, buffer: Any, offset: int = 0) -> Any:
+        value = self.datatype.from_buffer_copy(buffer, offset)
+        return getattr(value, "value", value)
+
+    def decode_many(self, buffer: Any, count: int, offset: int = 0) -> List[Any]:
+        return [
+            self.decode(buffer, offset + i * self.size) for i in range(count)
+        ]
+
+    def encode(self, value: Any) -> bytes:
+        # instances of structures are encoded as they are
+        if not isinstance(value, self.datatype):
+            value = self.datatype(value)
+        return bytes(value)
+
+
+class NumpyCodec(Codec):
+    """Conversion of arrays and structures described by a numpy dtype.
+
+    Values are decoded to numpy objects viewing the buffer without a copy:
+    a dtype with a shape like ``np.dtype(("<f4", (1000,)))`` gives an array
+    of that shape, a structured dtype gives a structured scalar whose fields
+    are accessed by name.
+
+    :param dtype: numpy dtype of the value, little endian
+
+    """
+
+    def __init__(self, dtype: Any) -> None:
+        self.dtype = np.dtype(dtype)
+        self.size = self.dtype.itemsize
+
+    def __repr__(self) -> str:
+        return "<%s %s>" % (type(self).__name__, self.dtype)
+
+    def decode(self, buffer: Any, offset: int = 0) -> Any:
+        if self.dtype.subdtype is not None:
+            base, shape = self.dtype.subdtype
+            count = self.size // base.itemsize
+            return np.frombuffer(buffer, base, count, offset).reshape(shape)
+        return np.frombuffer(buffer, self.dtype, 1, offset)[0]
+
+    def decode_many(self, buffer: Any, count: int, offset: int = 0) -> List[Any]:
+        return [
+            self.decode(buffer, offset + i * self.size) for i in range(count)
+        ]
+
+    def encode(self, value: Any) -> bytes:
+        if self.dtype.subdtype is not None:
+            return np.asarray(value, self.dtype.subdtype[0]).tobytes()
+        return np.asarray(value, self.dtype).tobytes()
+
+
+_codecs: Dict[Any, Codec] = {}
+
+
+def _create(datatype: Any) -> Codec:
+    if isinstance(datatype, np.dtype):
+        return NumpyCodec(datatype)
+    if datatype == pyads.PLCTYPE_STRING:
+        return StringCodec()
+
+    element, length = datatype, 1
+    if issubclass(datatype, ctypes.Array):
+        element, length = datatype._type_, datatype._length_
+
+    type_code = getattr(element, "_type_", None)
+    if not isinstance(type_code, str):
+        return CtypesCodec(datatype)
+    fmt = "<" + type_code
+    try:
+        size = struct.calcsize(fmt)
+    except struct.error:
+        return CtypesCodec(datatype)
+    # standard sizes may differ from the native ones, e.g. c_long on Linux
+    if size != ctypes.sizeof(element):
+        return CtypesCodec(datatype)
+    if datatype is element:
+        return Codec(fmt)
+    return ArrayCodec(fmt, length)
+
+
+def register(datatype: Any, codec: Codec) -> None:
+    """Register the codec of a datatype.
+
+    :param datatype: ``c`` datatype, a PLCTYPE constant or any other ctypes
+        type
+    :param Codec codec: codec for the values of the datatype
+
+    """
+    _codecs[datatype] = codec
+
+
+def get_codec(datatype: Any) -> Codec:
+    """Return the codec of a datatype, create it on first use.
+
+    :param datatype: ``c`` datatype, a PLCTYPE constant or any other ctypes
+        type
+
+    """
+    try:
+        return _codecs[datatype]
+    except KeyError:
+        codec = _codecs[datatype] = _create(datatype)
+        return codec
+
+
+def decode_many(
+    items: Iterable[Tuple[Any, int]], buffer: Any
+) -> List[Any]:
+    """Decode values of different datatypes from one buffer.
+
+    :param items: list of (datatype, offset) tuples
+    :param buffer: bytes, bytearray or memoryview with the raw data
+    :return: list of values in the order of the items
+
+    """
+    return [get_codec(datatype).decode(buffer, offset) for datatype, offset in items]
+
+
+def read_value(
+    adr: pyads.AmsAddr, index_group: int, offset: int, datatype: Any
+) -> Any:
+    """Read a value from the plc and decode it with the codec of its datatype.
+
+    :param pyads.AmsAddr adr: address of the ADS device
+    :param int index_group: index group of the value
+    :param int offset: index offset of the value
+    :param datatype: ``c`` datatype, a PLCTYPE constant
+
+    """
+    codec = get_codec(datatype)
+    if metrics.enabled:
+        data = metrics.registry.measure(
+            adr, index_group, codec.size, 0,
+            ads_read, adr, index_group, offset, byte_buffer(codec.size)
+        )
+    else:
+        data = ads_read(adr, index_group, offset, byte_buffer(codec.size))
+    return codec.decode(memoryview(data).cast("B"))
+
+
+def write_value(
+    adr: pyads.AmsAddr, index_group: int, offset: int, value: Any, datatype: Any
+) -> None:
+    """Encode a value with the codec of its datatype and write it to the plc.
+
+    :param pyads.AmsAddr adr: address of the ADS device
+    :param int index_group: index group of the value
+    :param int offset: index offset of the value
+    :param value: value to be written
+    :param datatype: ``c`` datatype, a PLCTYPE constant
+
+    """
+    data = get_codec(datatype).encode(value)
+    if metrics.enabled:
+        metrics.registry.measure(
+            adr, index_group, 0, len(data),
+            ads_write, adr, index_group, offset, data, byte_buffer(len(data))
+        )
+    else:
+        ads_write(adr, index_group, offset, data, byte_buffer(len(data)))
@@ -8,9 +8,23 @@
 :last modified time: 2018-07-17 15:27:19
 
 """
+from typing import Any, Iterable, List, Optional, Sequence, Tuple, Union
 from qthmi.main.connector import AbstractPLCConnector, ConnectionError
-from .gui import VALUE_TYPE
+from .gui import ADSMapper, VALUE_TYPE
+from .batch import (
+    MAX_SUM_REQUESTS, ADSWriteBatch, data_size, decode, index_group, sum_read
+)
+from .breaker import CircuitBreaker, probe_device
+from .cache import ValueCache
+from .codecs import read_value, write_value
+from .ports import ADSError, close_port, open_port
+from .symbols import CACHE_DIR, HandlePool, SymbolTable
 import pyads
+from pyads.constants import ADSIGRP_SYM_VALBYHND
+
+
+#: plc address, either a memory address or a symbol name
+ADDRESS_TYPE = Union[int, str]
 
 
 class ADSConnector(AbstractPLCConnector):
@@ -19,44 +33,168 @@ class ADSConnector(AbstractPLCConnector):
     :ivar int port: port number to the ADS device
     :ivar ams_addr: ip adress of the ADS device
 
+    :ivar handles: pool of variable handles, released by :py:meth:`close`
+    :ivar breaker: circuit breaker rejecting requests while the device is
+        not reachable, see :py:class:`qthmi.ads.breaker.CircuitBreaker`
+    :ivar cache: cache of values shared with other connectors and mappers,
+        see :py:class:`qthmi.ads.cache.ValueCache`, None to read every value
+        from the plc
+
     The ``ams_addr`` is set to the address of the local host and
     the port is set to PORT_SPS1 (801).
 
+    Addresses can be given as memory addresses or as symbol names like
+    ``MAIN.fbAxis.fActPos``. The symbol table is loaded from the plc on the
+    first access by name and cached in ``symbol_cache``, see
+    :py:class:`qthmi.ads.symbols.SymbolTable`. Names the symbol table can not
+    resolve, e.g. array elements, are accessed by variable handles.
+
     """
 
-    def __init__(self, ams_addr: pyads.AmsAddr=None, port: int=None) -> None:
+    def __init__(
+        self,
+        ams_addr: pyads.AmsAddr = None,
+        port: int = None,
+        symbol_cache: Optional[str] = CACHE_DIR,
+        cache: ValueCache = None,
+    ) -> None:
         super(ADSConnector, self).__init__()
-        self.port = pyads.open_port()
+        self.port: Optional[int] = open_port()
         self.ams_addr = ams_addr or pyads.get_local_address()
         self.ams_addr.port = port or pyads.PORT_SPS1
+        self.symbol_cache = symbol_cache
+        self.handles = HandlePool(self.ams_addr)
+        self.breaker = CircuitBreaker(probe_device(self.ams_addr))
+        self.cache = cache
+        self._symbols: Optional[SymbolTable] = None
+
+    @property
+    def symbols(self) -> SymbolTable:
+        """Symbol table of the plc, loaded on first access."""
+        if self._symbols is None:
+            try:
+                self._symbols = self.breaker.call(
+                    SymbolTable.load, self.ams_addr, self.symbol_cache
+                )
+            except ADSError as e:
+                raise ConnectionError(
+                    "Loading symbol table (ErrorCode %i)" % e.err_code
+                )
+        return self._symbols
+
+    def resolve(self, mappers: Iterable[ADSMapper]) -> None:
+        """Resolve the symbol names of the mappers.
+
+        Names missing in the symbol table get a variable handle.
+
+        :param mappers: mappers to resolve
+
+        """
+        for mapper in mappers:
+            try:
+                self.breaker.call(mapper.resolve, self.symbols, self.handles)
+            except ADSError as e:
+                raise ConnectionError(
+                    "Resolving symbol %s (ErrorCode %i)" %
+                    (mapper.symbol, e.err_code)
+                )
+
+    def close(self) -> None:
+        """Release all variable handles and the port of the connector."""
+        if self.port is None:
+            return
+        self.breaker.reset()
+        self.handles.release_all()
+        self.port = None
+        close_port()
+
+    def _locate(self, address: ADDRESS_TYPE, datatype: Any) -> Tuple[int, int]:
+        """Return index group and offset of a memory address or symbol.
+
+        Symbols missing in the symbol table are accessed by a variable
+        handle, the offset is the handle then.
+
+        """
+        if not isinstance(address, str):
+            return index_group(datatype), address
+        try:
+            return self.symbols.resolve(address)
+        except KeyError:
+            pass
+        try:
+            handle = self.breaker.call(self.handles.get, address)
+        except ADSError as e:
+            raise ConnectionError(
+                "Resolving symbol %s (ErrorCode %i)" % (address, e.err_code)
+            )
+        return ADSIGRP_SYM_VALBYHND, handle
 
-    def read_from_plc(self, address: int, datatype: int) -> VALUE_TYPE:
+    def read_from_plc(self, address: ADDRESS_TYPE, datatype: int) -> VALUE_TYPE:
         """Read value from the plc.
 
-        :param int address: memory address
+        :param address: memory address or symbol name
         :param datatype: ``c`` datatype, a PLCTYPE constant
 
         The PLCTYPE constants are found in the :py:mod:`qthmi.ads.constants`
         module.
 
         """
-        index_group = (pyads.INDEXGROUP_MEMORYBIT
-                       if datatype == pyads.PLCTYPE_BOOL
-                       else pyads.INDEXGROUP_MEMORYBYTE)
+        group, offset = self._locate(address, datatype)
 
         try:
-            value = pyads.read(self.ams_addr, index_group, address, datatype)
-        except pyads.ADSError as e:
+            value = self.breaker.call(
+                read_value if self.cache is None else self.cache.get,
+                self.ams_addr, group, offset, datatype
+            )
+        except ADSError as e:
             raise ConnectionError(
-                "Reading from address %i (ErrorCode %i)" %
+                "Reading from address %s (ErrorCode %i)" %
                 (address, e.err_code)
             )
         return value
 
-    def write_to_plc(self, address: int, value: VALUE_TYPE, datatype: int) -> None:
+    def read_list_from_plc(
+        self, items: Sequence[Tuple[ADDRESS_TYPE, Any]]
+    ) -> List[VALUE_TYPE]:
+        """Read several values from the plc with ADS sum read requests.
+
+        :param items: list of (address or symbol name, datatype) tuples
+        :return: list of values in the order of the items
+
+        One request is sent for every :py:data:`qthmi.ads.batch.MAX_SUM_REQUESTS`
+        items instead of one request per item.
+
+        """
+        values: List[VALUE_TYPE] = []
+        for start in range(0, len(items), MAX_SUM_REQUESTS):
+            chunk = items[start:start + MAX_SUM_REQUESTS]
+            requests = [
+                self._locate(address, datatype) + (data_size(datatype),)
+                for address, datatype in chunk
+            ]
+            try:
+                results = self.breaker.call(sum_read, self.ams_addr, requests)
+            except ADSError as e:
+                raise ConnectionError(
+                    "Sum reading %i addresses (ErrorCode %i)" %
+                    (len(chunk), e.err_code)
+                )
+
+            for (address, datatype), (err, data) in zip(chunk, results):
+                if err:
+                    raise ConnectionError(
+                        "Reading from address %s (ErrorCode %i)" %
+                        (address, err)
+                    )
+                values.append(decode(datatype, data))
+        return values
+
+    def write_to_plc(
+        self, address: ADDRESS_TYPE, value: VALUE_TYPE, datatype: int
+    ) -> None:
         """Write value to the plc.
 
-        :param int address: memory address
+        :param address: memory address or symbol name
         :param value: value to be written
         :param datatype: ``c`` datatype, a PLCTYPE constant
 
@@ -64,15 +202,56 @@ class ADSConnector(AbstractPLCConnector):
         module.
 
         """
-        index_group = (pyads.INDEXGROUP_MEMORYBIT
-                       if datatype == pyads.PLCTYPE_BOOL
-                       else pyads.INDEXGROUP_MEMORYBYTE)
+        group, offset = self._locate(address, datatype)
 
         try:
-            pyads.write(self.ams_addr, index_group, address,
-                        value, datatype)
-        except pyads.ADSError as e:
+            self.breaker.call(
+                write_value if self.cache is None else self.cache.write,
+                self.ams_addr, group, offset, value, datatype
+            )
+        except ADSError as e:
             raise ConnectionError(
-                "Writing on address %i (ErrorCode %i)" %
+                "Writing on address %s (ErrorCode %i)" %
                 (address, e.err_code)
             )
+
+    def write_list_to_plc(
+        self, items: Sequence[Tuple[ADDRESS_TYPE, VALUE_TYPE, Any]]
+    ) -> None:
+        """Write several values to the plc with ADS sum write requests.
+
+        The values written successfully are stored in the cache even if
+        other items failed.
+
+        :param items: list of (address or symbol name, value, datatype) tuples
+
+        """
+        batch = self.write_batch()
+        located = []
+        for address, value, datatype in items:
+            group, offset = self._locate(address, datatype)
+            batch.write_to_plc(offset, value, datatype, group)
+            located.append((group, offset, datatype, value))
+        try:
+            self.breaker.call(batch.flush)
+        finally:
+            if self.cache is not None:
+                for (group, offset, datatype, value), err in zip(
+                    located, batch.codes
+                ):
+                    if not err:
+                        self.cache.put(
+                            self.ams_addr, group, offset, datatype, value
+                        )
+
+    def write_batch(self) -> ADSWriteBatch:
+        """Return a write batch for the ADS device of this connector.
+
+        Sample code::
+
+        >>> with connector.write_batch() as batch:
+        >>>     batch.write_to_plc(0, 42, pyads.PLCTYPE_INT)
+        >>>     batch.write(mapper, 1.5)
+
+        """
+        return ADSWriteBatch(self.ams_addr)
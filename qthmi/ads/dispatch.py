@@ -0,0 +1,183 @@
+"""Batched update of the gui objects.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+Painting thousands of widgets takes longer than reading their values. When
+scan classes and poll groups show their values in separate events, every
+event repaints the changed widgets, often several times per frame. The
+:py:class:`GuiDispatcher` collects the values and shows them in one pass of
+the event loop, Qt merges the repaint requests of a pass into one paint
+event per window. Batches are applied at most once per frame, if values
+arrive faster only the latest value per mapper is shown.
+
+The updates of the windows are not disabled while a batch is applied,
+enabling them again repaints the whole window instead of the changed
+widgets.
+
+Sample code::
+
+>>> dispatcher = GuiDispatcher(min_interval=16)
+>>> scheduler = PollScheduler(adsAdr, dispatcher=dispatcher)
+
+"""
+import threading
+import time
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+from PyQt5.QtCore import QObject, Qt, QTimer, pyqtSignal
+from .gui import ADSMapper, VALUE_TYPE
+
+
+class _Update(NamedTuple):
+    """Queued update of a mapper."""
+
+    value: VALUE_TYPE
+    timestamp: Optional[float]
+    #: ADS error code if the mapper could not be read, None otherwise
+    error: Optional[int] = None
+
+
+class GuiDispatcher(QObject):
+    """Show values on the gui objects in batches.
+
+    Values may be submitted from any thread, they are shown in the thread
+    of the dispatcher, usually the gui thread. If a mapper raises an
+    exception while showing its value, the other values of the batch are
+    shown anyway and :py:attr:`error` is emitted.
+
+    :param int min_interval: minimum time in ms between two batches, e.g.
+        16 for a screen refresh rate of 60 Hz
+    :param QObject parent: parent object
+
+    :ivar int batches: number of applied batches
+    :ivar int updates: number of values shown
+    :ivar int dropped: number of values replaced by a newer value of the
+        same mapper before they were shown
+    :ivar float last_frame_time: duration of the last batch in seconds
+    :ivar float max_frame_time: duration of the slowest batch in seconds
+    :ivar int errors: number of values whose mapper raised an exception
+
+    """
+
+    scheduled = pyqtSignal()
+
+    #: message of the failed updates of a batch
+    error = pyqtSignal(str)
+
+    def __init__(
+        self,
+        min_interval: int = 16,
+        parent: QObject = None,
+    ) -> None:
+        super(GuiDispatcher, self).__init__(parent)
+        self.min_interval = min_interval
+        self.batches = 0
+        self.updates = 0
+        self.dropped = 0
+        self.last_frame_time = 0.0
+        self.max_frame_time = 0.0
+        self.errors = 0
+
+        self._pending: Dict[ADSMapper, _Update] = {}
+        self._scheduled = False
+        self._last: Optional[float] = None
+        self._lock = threading.Lock()
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.flush)
+
+        self.scheduled.connect(self._schedule, Qt.QueuedConnection)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def submit(
+        self, mapper: ADSMapper, value: VALUE_TYPE, timestamp: float = None
+    ) -> None:
+        """Queue a value to be shown by a mapper.
+
+        :param ADSMapper mapper: mapper showing the value
+        :param value: value read from the plc
+        :param float timestamp: time the value has been read, ``time.time``
+
+        """
+        self.submit_many(((mapper, value),), timestamp)
+
+    def submit_error(self, mapper: ADSMapper, error: int = 0) -> None:
+        """Queue marking a mapper bad, replaces a value not shown yet.
+
+        :param ADSMapper mapper: mapper that could not be read
+        :param int error: ADS error code, 0 if unknown
+
+        """
+        self._submit(((mapper, _Update(None, None, error)),))
+
+    def submit_many(
+        self,
+        updates: Iterable[Tuple[ADSMapper, VALUE_TYPE]],
+        timestamp: float = None,
+    ) -> None:
+        """Queue the values of a poll cycle.
+
+        :param updates: (mapper, value) tuples
+        :param float timestamp: time the values have been read,
+            ``time.time``, by default the time they are shown
+
+        """
+        self._submit(
+            (mapper, _Update(value, timestamp)) for mapper, value in updates
+        )
+
+    def _submit(self, updates: Iterable[Tuple[ADSMapper, _Update]]) -> None:
+        with self._lock:
+            pending = self._pending
+            size = len(pending)
+            count = 0
+            for mapper, update in updates:
+                pending[mapper] = update
+                count += 1
+            self.dropped += size + count - len(pending)
+            if self._scheduled or not pending:
+                return
+            self._scheduled = True
+        self.scheduled.emit()
+
+    def _schedule(self) -> None:
+        delay = 0
+        if self._last is not None:
+            elapsed = (time.monotonic() - self._last) * 1000.0
+            delay = max(int(self.min_interval - elapsed), 0)
+        self._timer.start(delay)
+
+    def flush(self) -> None:
+        """Show all queued values now, must be called in the gui thread."""
+        self._timer.stop()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._scheduled = False
+        if not pending:
+            return
+
+        start = time.perf_counter()
+        self._last = time.monotonic()
+        failed = []
+        for mapper, update in pending.items():
+            try:
+                if update.error is not None:
+                    mapper.markBad(update.error)
+                else:
+                    mapper.update(update.value, update.timestamp)
+            except Exception as e:
+                # one broken mapper must not stop the rest of the batch
+                failed.append(e)
+
+        duration = time.perf_counter() - start
+        self.batches += 1
+        self.updates += len(pending) - len(failed)
+        self.errors += len(failed)
+        self.last_frame_time = duration
+        self.max_frame_time = max(self.max_frame_time, duration)
+        if failed:
+            self.error.emit(
+                "Showing %i values failed: %s" % (len(failed), failed[0])
+            )
@@ -0,0 +1,753 @@
+"""Gateway sharing one ADS session between several local processes.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+Several HMI panels and services polling the same plc multiply the load on
+the controller, every process opens its own port and reads the same values.
+The :py:class:`ADSGateway` runs in one process, holds the connection to the
+ADS device and polls the values subscribed by all clients once per interval
+with ADS sum read requests. Changed values are published to the clients
+over a Unix domain socket.
+
+The :py:class:`GatewayConnector` is a drop-in replacement for
+:py:class:`qthmi.ads.connector.ADSConnector` in the client processes. Single
+reads are answered from the values polled by the gateway if they are not
+older than the poll interval. Symbol names are resolved by the gateway,
+variable handles of names missing in the symbol table stay in the gateway
+process.
+
+Messages are pickled, the socket is created with access for the user of the
+gateway only. Do not make it accessible to untrusted users. A client sending
+a message that cannot be unpickled or is larger than :py:data:`MAX_FRAME` is
+disconnected, the other clients are served on.
+
+Sample code::
+
+>>> # gateway process
+>>> with ADSGateway(pyads.AmsAddr("5.20.31.1.1.1"), 851, interval=0.1) as gateway:
+>>>     gateway.serve_forever()
+
+>>> # client process
+>>> connector = GatewayConnector()
+>>> speed = connector.read_from_plc("MAIN.fSpeed", pyads.PLCTYPE_LREAL)
+>>> connector.subscribe(0, pyads.PLCTYPE_INT, lambda v: dispatcher.submit(mapper, v))
+
+"""
+import ctypes
+import os
+import pickle
+import queue
+import selectors
+import socket
+import struct
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyads
+from qthmi.main.connector import AbstractPLCConnector, ConnectionError
+from .batch import ADSWriteBatch, encode, sum_write
+from .cache import ValueCache
+from .connector import ADDRESS_TYPE, ADSConnector
+from .gui import ADSMapper, VALUE_TYPE
+from .ports import ADSError, PrivatePorts
+from .symbols import CACHE_DIR, SymbolTable
+
+
+#: default path of the socket of the gateway
+SOCKET_PATH = os.path.join(tempfile.gettempdir(), "qthmi-ads-gateway.sock")
+
+#: seconds a client may block the gateway while a message is sent to it
+SEND_TIMEOUT = 1.0
+
+#: maximum size of a message in bytes
+MAX_FRAME = 64 * 1024 * 1024
+
+#: kinds of the messages sent by the gateway
+RESULT = 0
+ERROR = 1
+UPDATE = 2
+
+_HEADER = struct.Struct("!I")
+_ARRAY = "array"
+
+
+def _pack_datatype(datatype: Any) -> Any:
+    # ctypes array types are created on the fly and cannot be pickled
+    if isinstance(datatype, type) and issubclass(datatype, ctypes.Array):
+        return (_ARRAY, _pack_datatype(datatype._type_), datatype._length_)
+    return datatype
+
+
+def _unpack_datatype(datatype: Any) -> Any:
+    if isinstance(datatype, tuple) and datatype[:1] == (_ARRAY,):
+        return _unpack_datatype(datatype[1]) * datatype[2]
+    return datatype
+
+
+def _send(sock: socket.socket, message: Any) -> None:
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+
+def _frames(buffer: bytearray) -> List[Any]:
+    """Remove the complete messages from a receive buffer and return them.
+
+    :raises ValueError: if a message is larger than :py:data:`MAX_FRAME`,
+        errors of unpickling are passed on
+
+    """
+    messages = []
+    start = 0
+    while len(buffer) - start >= _HEADER.size:
+        size, = _HEADER.unpack_from(buffer, start)
+        if size > MAX_FRAME:
+            raise ValueError("Message of %i bytes exceeds MAX_FRAME" % size)
+        end = start + _HEADER.size + size
+        if len(buffer) < end:
+            break
+        messages.append(pickle.loads(buffer[start + _HEADER.size:end]))
+        start = end
+    del buffer[:start]
+    return messages
+
+
+class _Subscription:
+    """Value polled for the clients, attached to the cache like a mapper."""
+
+    def __init__(
+        self, group: int, offset: int, datatype: Any, changed: List["_Subscription"]
+    ) -> None:
+        self.indexGroup = group
+        self.plcAdr = offset
+        self.plcDataType = datatype
+        self.value: VALUE_TYPE = None
+        self.known = False
+        self.error = 0
+        self.clients: Dict["_Client", List[int]] = {}
+        self._changed = changed
+
+    def update(self, value: VALUE_TYPE, timestamp: Optional[float] = None) -> None:
+        self.error = 0
+        if self.known and _equal(value, self.value):
+            return
+        self.value = value
+        self.known = True
+        self._changed.append(self)
+
+    def markBad(self, error: int = 0) -> None:
+        # the clients keep the last value, failed reads are not published
+        self.error = error
+
+
+def _equal(a: VALUE_TYPE, b: VALUE_TYPE) -> bool:
+    try:
+        return bool(a == b)
+    except ValueError:
+        # numpy arrays compare elementwise
+        return bool(np.all(a == b))
+
+
+class _Client:
+    """Connection of a client process."""
+
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self.buffer = bytearray()
+        self.subscriptions: Dict[int, _Subscription] = {}
+
+
+class ADSGateway:
+    """Gateway polling the ADS device for the connected clients.
+
+    All requests to the ADS device are sent by the thread running
+    :py:meth:`serve_forever` on a private port, requests of the clients are
+    handled between two polls.
+
+    :param pyads.AmsAddr ams_addr: address of the ADS device, defaults to
+        the local address
+    :param int port: port of the ADS device, defaults to PORT_SPS1 (801)
+    :param str path: path of the Unix domain socket
+    :param float interval: poll interval in seconds
+    :param str symbol_cache: directory of the symbol table cache
+
+    :ivar ADSConnector connector: connector to the ADS device, reading
+        through :py:attr:`cache`
+    :ivar ValueCache cache: values polled for the clients, with the poll
+        interval as time to live
+    :ivar int polls: number of poll cycles
+    :ivar int published: number of values sent to clients
+    :ivar int errors: number of failed poll cycles
+    :ivar str last_error: message of the last failed poll cycle
+
+    """
+
+    def __init__(
+        self,
+        ams_addr: pyads.AmsAddr = None,
+        port: int = None,
+        path: str = SOCKET_PATH,
+        interval: float = 0.1,
+        symbol_cache: Optional[str] = CACHE_DIR,
+    ) -> None:
+        self.path = path
+        self.interval = interval
+        self.cache = ValueCache(ttl=interval)
+        self.connector = ADSConnector(ams_addr, port, symbol_cache, cache=self.cache)
+        self.polls = 0
+        self.published = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+        self._clients: Dict[socket.socket, _Client] = {}
+        self._subscriptions: Dict[Tuple[int, int, Any], _Subscription] = {}
+        self._changed: List[_Subscription] = []
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        if os.path.exists(path):
+            os.unlink(path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(path)
+        os.chmod(path, 0o600)
+        self._server.listen()
+        self._server.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._server, selectors.EVENT_READ)
+
+    def __enter__(self) -> "ADSGateway":
+        return self
+
+    def __exit__(self, exc_type: object, exc_value: object, tb: object) -> None:
+        self.close()
+
+    @property
+    def clients(self) -> int:
+        """Number of connected clients."""
+        return len(self._clients)
+
+    @property
+    def subscriptions(self) -> int:
+        """Number of polled values."""
+        return len(self._subscriptions)
+
+    def start(self) -> None:
+        """Run :py:meth:`serve_forever` in a background thread."""
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="ADSGateway", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop serving, waits for the background thread if started."""
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self) -> None:
+        """Stop serving, disconnect the clients and close the connector."""
+        self.stop()
+        for client in list(self._clients.values()):
+            self._disconnect(client)
+        self._selector.close()
+        self._server.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.connector.close()
+
+    def serve_forever(self) -> None:
+        """Poll the ADS device and handle the clients until stopped."""
+        self._stopped.clear()
+        ports = PrivatePorts()
+        ports.open()
+        try:
+            next_poll = time.monotonic()
+            while not self._stopped.is_set():
+                timeout = max(min(next_poll - time.monotonic(), self.interval), 0)
+                for key, _ in self._selector.select(timeout):
+                    if key.fileobj is self._server:
+                        self._accept()
+                        continue
+                    # the client may have been dropped earlier in this batch
+                    client: _Client = key.data
+                    if client.sock in self._clients:
+                        self._receive(client)
+
+                now = time.monotonic()
+                if now >= next_poll:
+                    self.poll()
+                    # skip the cycles missed by a slow poll
+                    next_poll = max(next_poll + self.interval, now)
+        finally:
+            ports.close()
+
+    def poll(self) -> None:
+        """Read the subscribed values and publish the changed ones."""
+        self.polls += 1
+        # values read by clients since the last poll are read again as well
+        self.cache.invalidate(self.connector.ams_addr)
+        try:
+            self.cache.poll(self.connector.ams_addr)
+        except ConnectionError as e:
+            self.errors += 1
+            self.last_error = str(e)
+        self._publish()
+
+    def _publish(self) -> None:
+        # the list is shared with the subscriptions
+        changed = list(self._changed)
+        del self._changed[:]
+        updates: Dict[_Client, List[Tuple[int, VALUE_TYPE]]] = {}
+        for subscription in dict.fromkeys(changed):
+            for client, ids in subscription.clients.items():
+                updates.setdefault(client, []).extend(
+                    (i, subscription.value) for i in ids
+                )
+        for client, values in updates.items():
+            if client.sock not in self._clients:
+                continue
+            self._send(client, (UPDATE, None, values))
+            self.published += len(values)
+
+    def _accept(self) -> None:
+        try:
+            sock, _ = self._server.accept()
+        except BlockingIOError:
+            return
+        sock.settimeout(SEND_TIMEOUT)
+        client = self._clients[sock] = _Client(sock)
+        self._selector.register(sock, selectors.EVENT_READ, client)
+
+    def _disconnect(self, client: _Client) -> None:
+        if client.sock not in self._clients:
+            return
+        for i in list(client.subscriptions):
+            self._unsubscribe(client, i)
+        self._selector.unregister(client.sock)
+        del self._clients[client.sock]
+        client.sock.close()
+
+    def _send(self, client: _Client, message: Any) -> None:
+        try:
+            _send(client.sock, message)
+        except OSError:
+            # a client blocking the gateway is dropped
+            self._disconnect(client)
+
+    def _receive(self, client: _Client) -> None:
+        try:
+            data = client.sock.recv(65536)
+        except OSError:
+            data = b""
+        if not data:
+            self._disconnect(client)
+            return
+        client.buffer += data
+        try:
+            messages = [
+                (request_id, method, args)
+                for request_id, method, args in _frames(client.buffer)
+            ]
+        except Exception:
+            # a client sending garbage is dropped, the others are served on
+            self._disconnect(client)
+            return
+        for request_id, method, args in messages:
+            try:
+                result = getattr(self, "_do_" + method)(client, *args)
+            except Exception as e:
+                self._send(client, (ERROR, request_id, str(e)))
+            else:
+                self._send(client, (RESULT, request_id, result))
+            if client.sock not in self._clients:
+                return
+        # values known at subscription and written values
+        self._publish()
+
+    def _do_info(self, client: _Client) -> Tuple[str, int]:
+        return self.connector.ams_addr.netid, self.connector.ams_addr.port
+
+    def _do_symbols(self, client: _Client) -> SymbolTable:
+        return self.connector.symbols
+
+    def _do_read(
+        self, client: _Client, address: ADDRESS_TYPE, datatype: Any
+    ) -> VALUE_TYPE:
+        return self.connector.read_from_plc(address, _unpack_datatype(datatype))
+
+    def _do_read_list(
+        self, client: _Client, items: Sequence[Tuple[ADDRESS_TYPE, Any]]
+    ) -> List[VALUE_TYPE]:
+        return self.connector.read_list_from_plc(
+            [(address, _unpack_datatype(datatype)) for address, datatype in items]
+        )
+
+    def _do_write(
+        self, client: _Client, address: ADDRESS_TYPE, value: VALUE_TYPE, datatype: Any
+    ) -> None:
+        datatype = _unpack_datatype(datatype)
+        self.connector.write_to_plc(address, value, datatype)
+        self._written(address, value, datatype)
+
+    def _do_write_list(
+        self, client: _Client, items: Sequence[Tuple[ADDRESS_TYPE, VALUE_TYPE, Any]]
+    ) -> None:
+        items = [
+            (address, value, _unpack_datatype(datatype))
+            for address, value, datatype in items
+        ]
+        self.connector.write_list_to_plc(items)
+        for address, value, datatype in items:
+            self._written(address, value, datatype)
+
+    def _do_write_items(
+        self, client: _Client, items: Sequence[Tuple[int, int, VALUE_TYPE, Any]]
+    ) -> List[int]:
+        items = [
+            (group, offset, value, _unpack_datatype(datatype))
+            for group, offset, value, datatype in items
+        ]
+        try:
+            errors = self.connector.breaker.call(
+                sum_write, self.connector.ams_addr, [
+                    (group, offset, encode(datatype, value))
+                    for group, offset, value, datatype in items
+                ]
+            )
+        except ADSError as e:
+            raise ConnectionError(
+                "Sum writing %i values (ErrorCode %i)" % (len(items), e.err_code)
+            )
+        for (group, offset, value, datatype), err in zip(items, errors):
+            if not err:
+                self._written_at(group, offset, datatype, value)
+        return errors
+
+    def _written(
+        self, address: ADDRESS_TYPE, value: VALUE_TYPE, datatype: Any
+    ) -> None:
+        group, offset = self.connector._locate(address, datatype)
+        self._written_at(group, offset, datatype, value)
+
+    def _written_at(
+        self, group: int, offset: int, datatype: Any, value: VALUE_TYPE
+    ) -> None:
+        self.cache.put(self.connector.ams_addr, group, offset, datatype, value)
+        subscription = self._subscriptions.get((group, offset, datatype))
+        if subscription is not None:
+            subscription.update(value)
+
+    def _do_subscribe(
+        self,
+        client: _Client,
+        subscription_id: int,
+        address: ADDRESS_TYPE,
+        datatype: Any,
+    ) -> None:
+        datatype = _unpack_datatype(datatype)
+        key = self.connector._locate(address, datatype) + (datatype,)
+        subscription = self._subscriptions.get(key)
+        if subscription is None:
+            subscription = self._subscriptions[key] = _Subscription(
+                key[0], key[1], datatype, self._changed
+            )
+            self.cache.attach(subscription, self.connector.ams_addr)
+        subscription.clients.setdefault(client, []).append(subscription_id)
+        client.subscriptions[subscription_id] = subscription
+        if subscription.known:
+            self._send(client, (UPDATE, None, [(subscription_id, subscription.value)]))
+
+    def _do_unsubscribe(self, client: _Client, subscription_id: int) -> None:
+        self._unsubscribe(client, subscription_id)
+
+    def _unsubscribe(self, client: _Client, subscription_id: int) -> None:
+        subscription = client.subscriptions.pop(subscription_id, None)
+        if subscription is None:
+            return
+        ids = subscription.clients[client]
+        ids.remove(subscription_id)
+        if not ids:
+            del subscription.clients[client]
+        if not subscription.clients:
+            del self._subscriptions[
+                subscription.indexGroup, subscription.plcAdr, subscription.plcDataType
+            ]
+            self.cache.detach(subscription, self.connector.ams_addr)
+
+
+class _GatewayWriteBatch(ADSWriteBatch):
+    """Write batch sending its sum write requests through the gateway."""
+
+    def __init__(self, connector: "GatewayConnector") -> None:
+        super(_GatewayWriteBatch, self).__init__(connector.ams_addr)
+        self.connector = connector
+
+    def _send(
+        self, items: Sequence[Tuple[int, int, VALUE_TYPE, Any]]
+    ) -> List[int]:
+        return self.connector._call("write_items", [
+            (group, offset, value, _pack_datatype(datatype))
+            for group, offset, value, datatype in items
+        ])
+
+
+class GatewayConnector(AbstractPLCConnector):
+    """Connector to the ADS device through an :py:class:`ADSGateway`.
+
+    The connector offers the API of
+    :py:class:`qthmi.ads.connector.ADSConnector`, errors of the gateway and
+    of the ADS device are raised as :py:class:`ConnectionError`. Requests of
+    several threads are serialized.
+
+    The connector has no circuit breaker and no cache of its own, the
+    gateway uses both for all clients.
+
+    :param str path: path of the socket of the gateway
+    :param float timeout: seconds to wait for the answer of the gateway
+
+    :ivar int callback_errors: number of exceptions raised by subscription
+        callbacks, they do not stop the connector
+    :ivar str last_error: message of the last exception of a callback
+
+    Sample code::
+
+    >>> connector = GatewayConnector()
+    >>> connector.write_to_plc("MAIN.bStart", True, pyads.PLCTYPE_BOOL)
+
+    """
+
+    def __init__(self, path: str = SOCKET_PATH, timeout: float = 5.0) -> None:
+        super(GatewayConnector, self).__init__()
+        self.path = path
+        self.timeout = timeout
+        self.callback_errors = 0
+        self.last_error: Optional[str] = None
+
+        self._sock: Optional[socket.socket] = socket.socket(
+            socket.AF_UNIX, socket.SOCK_STREAM
+        )
+        try:
+            self._sock.connect(path)
+        except OSError as e:
+            self._sock.close()
+            raise ConnectionError("Connecting to gateway %s (%s)" % (path, e))
+
+        self._lock = threading.Lock()
+        self._request_id = 0
+        self._subscription_id = 0
+        self._callbacks: Dict[int, Callable[[VALUE_TYPE], None]] = {}
+        self._responses: "queue.Queue[Tuple[int, Optional[int], Any]]" = queue.Queue()
+        self._ams_addr: Optional[pyads.AmsAddr] = None
+        self._symbols: Optional[SymbolTable] = None
+        self._closed: Optional[str] = None
+        self._thread = threading.Thread(
+            target=self._run, args=(self._sock,), name="GatewayConnector",
+            daemon=True,
+        )
+        self._thread.start()
+
+    @property
+    def ams_addr(self) -> pyads.AmsAddr:
+        """Address of the ADS device of the gateway."""
+        if self._ams_addr is None:
+            self._ams_addr = pyads.AmsAddr(*self._call("info"))
+        return self._ams_addr
+
+    @property
+    def symbols(self) -> SymbolTable:
+        """Symbol table of the plc, loaded by the gateway on first access."""
+        if self._symbols is None:
+            self._symbols = self._call("symbols")
+        return self._symbols
+
+    def resolve(self, mappers: Iterable[ADSMapper]) -> None:
+        """Resolve the symbol names of the mappers.
+
+        Unlike :py:meth:`qthmi.ads.connector.ADSConnector.resolve` names
+        missing in the symbol table raise KeyError, their variable handles
+        would only be valid in the gateway process. Read and write them by
+        name with the methods of the connector instead.
+
+        :param mappers: mappers to resolve
+
+        """
+        for mapper in mappers:
+            mapper.resolve(self.symbols)
+
+    def write_batch(self) -> ADSWriteBatch:
+        """Return a write batch sending its requests through the gateway.
+
+        Sample code::
+
+        >>> with connector.write_batch() as batch:
+        >>>     batch.write(mapper, 1.5)
+
+        """
+        return _GatewayWriteBatch(self)
+
+    def close(self) -> None:
+        """Disconnect from the gateway, all subscriptions are deleted."""
+        with self._lock:
+            sock, self._sock = self._sock, None
+        if sock is None:
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+        self._thread.join()
+
+    def _run(self, sock: socket.socket) -> None:
+        # receives the answers and the published values
+        buffer = bytearray()
+        while True:
+            try:
+                data = sock.recv(65536)
+            except OSError:
+                data = b""
+            if not data:
+                self._close_connection("Gateway closed the connection")
+                return
+            buffer += data
+            try:
+                messages = _frames(buffer)
+            except Exception as e:
+                self._close_connection("Invalid message from gateway (%s)" % e)
+                return
+            for kind, request_id, payload in messages:
+                if kind == UPDATE:
+                    for subscription_id, value in payload:
+                        callback = self._callbacks.get(subscription_id)
+                        if callback is None:
+                            continue
+                        try:
+                            callback(value)
+                        except Exception as e:
+                            self.callback_errors += 1
+                            self.last_error = "Subscription %i: %s" % (
+                                subscription_id, e
+                            )
+                else:
+                    self._responses.put((kind, request_id, payload))
+
+    def _close_connection(self, message: str) -> None:
+        # later calls fail at once, a waiting call gets the error
+        self._closed = message
+        self._responses.put((ERROR, None, message))
+
+    def _call(self, method: str, *args: Any) -> Any:
+        with self._lock:
+            if self._sock is None:
+                raise ConnectionError("Connector is closed")
+            if self._closed is not None:
+                raise ConnectionError(self._closed)
+            self._request_id += 1
+            try:
+                _send(self._sock, (self._request_id, method, args))
+            except OSError as e:
+                raise ConnectionError("Sending to gateway (%s)" % e)
+            while True:
+                try:
+                    kind, request_id, payload = self._responses.get(
+                        timeout=self.timeout
+                    )
+                except queue.Empty:
+                    raise ConnectionError("No answer from gateway %s" % self.path)
+                # answers of requests that timed out are dropped
+                if request_id is None or request_id == self._request_id:
+                    break
+        if kind == ERROR:
+            raise ConnectionError(payload)
+        return payload
+
+    def read_from_plc(self, address: ADDRESS_TYPE, datatype: Any) -> VALUE_TYPE:
+        """Read value from the plc.
+
+        :param address: memory address or symbol name
+        :param datatype: ``c`` datatype, a PLCTYPE constant
+
+        """
+        return self._call("read", address, _pack_datatype(datatype))
+
+    def read_list_from_plc(
+        self, items: Sequence[Tuple[ADDRESS_TYPE, Any]]
+    ) -> List[VALUE_TYPE]:
+        """Read several values from the plc with ADS sum read requests.
+
+        :param items: list of (address or symbol name, datatype) tuples
+        :return: list of values in the order of the items
+
+        """
+        return self._call("read_list", [
+            (address, _pack_datatype(datatype)) for address, datatype in items
+        ])
+
+    def write_to_plc(
+        self, address: ADDRESS_TYPE, value: VALUE_TYPE, datatype: Any
+    ) -> None:
+        """Write value to the plc.
+
+        :param address: memory address or symbol name
+        :param value: value to be written
+        :param datatype: ``c`` datatype, a PLCTYPE constant
+
+        """
+        self._call("write", address, value, _pack_datatype(datatype))
+
+    def write_list_to_plc(
+        self, items: Sequence[Tuple[ADDRESS_TYPE, VALUE_TYPE, Any]]
+    ) -> None:
+        """Write several values to the plc with ADS sum write requests.
+
+        :param items: list of (address or symbol name, value, datatype) tuples
+
+        """
+        self._call("write_list", [
+            (address, value, _pack_datatype(datatype))
+            for address, value, datatype in items
+        ])
+
+    def subscribe(
+        self,
+        address: ADDRESS_TYPE,
+        datatype: Any,
+        callback: Callable[[VALUE_TYPE], None],
+    ) -> int:
+        """Receive the value of an address whenever the gateway polls a change.
+
+        The callback is called with the current value as soon as it is known
+        and then with every change. It is invoked in the receive thread of
+        the connector, pass the values to the gui thread e.g. with
+        :py:meth:`qthmi.ads.dispatch.GuiDispatcher.submit`.
+
+        :param address: memory address or symbol name
+        :param datatype: ``c`` datatype, a PLCTYPE constant
+        :param callback: function called with the value
+        :return: id of the subscription for :py:meth:`unsubscribe`
+
+        """
+        with self._lock:
+            self._subscription_id += 1
+            subscription_id = self._subscription_id
+        self._callbacks[subscription_id] = callback
+        try:
+            self._call(
+                "subscribe", subscription_id, address, _pack_datatype(datatype)
+            )
+        except ConnectionError:
+            del self._callbacks[subscription_id]
+            raise
+        return subscription_id
+
+    def unsubscribe(self, subscription_id: int) -> None:
+        """Stop receiving the values of a subscription.
+
+        :param int subscription_id: id returned by :py:meth:`subscribe`
+
+        """
+        self._callbacks.pop(subscription_id, None)
+        self._call("unsubscribe", subscription_id)
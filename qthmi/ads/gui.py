@@ -8,12 +8,25 @@
 :last modified time: 2018-07-17 15:27:03
 
 """
-from typing import Union, List, Optional, Any
+import math
+import time
+from typing import TYPE_CHECKING, Union, List, Optional, Any, Callable
+import numpy as np
 import pyads
+from pyads.constants import ADSIGRP_SYM_VALBYHND
+from PyQt5.QtCore import QCoreApplication, QTimer
 from qthmi.main.widgets import HMIObject
+from . import metrics
+from .codecs import Codec, get_codec, read_value, write_value
+from .ports import ADSError
+from .quality import QUALITY_BAD, QUALITY_GOOD, QUALITY_UNCERTAIN, Sample
 
+if TYPE_CHECKING:
+    from .cache import ValueCache  # noqa: F401
+    from .symbols import HandlePool, SymbolTable  # noqa: F401
 
-VALUE_TYPE = Optional[Union[float, int]]
+
+VALUE_TYPE = Optional[Union[float, int, str, np.ndarray, np.void]]
 
 
 class ADSMapper:
@@ -24,11 +37,36 @@ class ADSMapper:
     the interaction between gui objects and plc values subclass and implement
     mapAdsToGui according to the given examples.
 
-    :param int plcAddress: plc address
+    :param plcAddress: plc address or symbol name, symbol names need to be
+        resolved with :py:meth:`resolve` before accessing the plc
     :param plcDataType: plc data type
     :param guiObjects: list/tuple or single gui objects
         (for instance Qt objects)
     :param string hint: hint for the plv value
+    :param float deadband: absolute deadband for float values, changes
+        within the deadband are not shown
+    :param float deadbandPercent: deadband for float values in percent of
+        the value shown last
+    :param float minInterval: minimum time in seconds between two updates
+        of the gui objects
+
+    Values are only shown on the gui objects if they differ from the value
+    shown last. Integers, booleans and strings are compared exactly, floats
+    are compared with the configured deadband. A change held back by
+    ``minInterval`` is shown when the interval is over, even if no further
+    value is read, e.g. with notifications. The counters
+    ``deliveredUpdates`` and ``suppressedUpdates`` help tuning these
+    settings.
+
+    Every value carries the time it has been read and a quality code, see
+    :py:mod:`qthmi.ads.quality`. A mapper that could not be read is marked
+    bad by :py:meth:`markBad` and keeps its last value. Implement
+    ``mapQualityToGui`` to show bad values, it is called whenever the
+    quality changes.
+
+    :cvar int addressGeneration: incremented whenever symbol names of
+        mappers are resolved, plans depending on the addresses of mappers
+        are renewed when it changes
 
     Sample code::
 
@@ -53,79 +91,306 @@ class ADSMapper:
     >>>     def mapAdsToGui(self, guiObject, value):
     >>>         guiObject.setText(__builtin__.bin(int(value)))
 
+    >>> class QualityTextBoxMapper (TextBoxMapper):
+    >>>     def mapQualityToGui(self, guiObject, sample):
+    >>>         guiObject.setEnabled(sample.good)
+
     """
 
+    addressGeneration = 0
+
     def __init__(
         self,
-        plcAddress: int,
+        plcAddress: Union[int, str],
         plcDataType: int,
         guiObjects: List[HMIObject],
         hint: str = None,
+        deadband: float = 0.0,
+        deadbandPercent: float = 0.0,
+        minInterval: float = 0.0,
     ) -> None:
         self.hint = hint
-        self.plcAdr = plcAddress
+        self.symbol: Optional[str] = None
+        self.plcAdr: int = None  # type: ignore
+        self._indexGroup: Optional[int] = None
+        if isinstance(plcAddress, str):
+            self.symbol = plcAddress
+        else:
+            self.plcAdr = plcAddress
         self.plcDataType = plcDataType
         self.currentValue: VALUE_TYPE = None
+        self.timestamp: Optional[float] = None
+        self.quality = QUALITY_UNCERTAIN
+        self.error = 0
         self.guiObjects = guiObjects
 
+        self.deadband = deadband
+        self.deadbandPercent = deadbandPercent
+        self.minInterval = minInterval
+        self.deliveredUpdates = 0
+        self.suppressedUpdates = 0
+        self._shownValue: VALUE_TYPE = None
+        self._shownTime: Optional[float] = None
+        self._trailing = False
+        self.listeners: List[Callable[[Sample], None]] = []
+
         if isinstance(guiObjects, (list, tuple)):
             for o in guiObjects:
                 o.plcObject = self
         else:
             guiObjects.plcObject = self
 
-    def write(self, adsAdr: int, value: VALUE_TYPE) -> None:
-        """Write a value to the plc address.
+    @property
+    def indexGroup(self) -> int:
+        """Index group of the plc address.
 
-        :param qthmi.ads.constants.AmsAdr adsAdr: address to the ADS device
-        :param value: value to be written
+        For symbols this is the index group of the symbol, for plain
+        addresses the plc memory area.
 
         """
-        self.currentValue = value
-        indexgroup = (
+        if self._indexGroup is not None:
+            return self._indexGroup
+        return (
             pyads.INDEXGROUP_MEMORYBIT
             if self.plcDataType == pyads.PLCTYPE_BOOL
             else pyads.INDEXGROUP_MEMORYBYTE
         )
-        err = pyads.write(
-            adsAdr, indexgroup, self.plcAdr, self.currentValue, self.plcDataType
-        )
-        if err == 0:
+
+    @property
+    def sample(self) -> Sample:
+        """Current value with timestamp and quality."""
+        return Sample(self.currentValue, self.timestamp, self.quality, self.error)
+
+    @property
+    def codec(self) -> Codec:
+        """Codec converting the values of the plc datatype."""
+        return get_codec(self.plcDataType)
+
+    def resolve(
+        self, symbols: "SymbolTable", handles: Optional["HandlePool"] = None
+    ) -> None:
+        """Set index group and address from the symbol name.
+
+        Symbols missing in the symbol table are accessed by a variable
+        handle of the handle pool, the address is the handle then.
+
+        :param qthmi.ads.symbols.SymbolTable symbols: symbol table of the plc
+        :param qthmi.ads.symbols.HandlePool handles: handles of the plc
+            variables, None raises KeyError for unknown symbols
+
+        """
+        if self.symbol is None:
             return
-        raise Exception(
-            "error writing on address %i. error number %i" % (self.plcAdr, err)
-        )
+        try:
+            self._indexGroup, self.plcAdr = symbols.resolve(self.symbol)
+        except KeyError:
+            if handles is None:
+                raise
+            self.plcAdr = handles.get(self.symbol)
+            self._indexGroup = ADSIGRP_SYM_VALBYHND
+        ADSMapper.addressGeneration += 1
+
+    def write(self, adsAdr: int, value: VALUE_TYPE) -> None:
+        """Write a value to the plc address.
+
+        :param qthmi.ads.constants.AmsAdr adsAdr: address to the ADS device
+        :param value: value to be written
+
+        """
+        self.currentValue = value
+        try:
+            write_value(
+                adsAdr, self.indexGroup, self.plcAdr, self.currentValue,
+                self.plcDataType
+            )
+        except ADSError as e:
+            raise Exception(
+                "error writing on address %i. error number %i" %
+                (self.plcAdr, e.err_code)
+            )
 
-    def read(self, adsAdr: pyads.AmsAddr) -> Any:
+    def read(
+        self, adsAdr: pyads.AmsAddr, cache: Optional["ValueCache"] = None
+    ) -> Any:
         """Read from plc address and write in self.currentValue.
 
         Call mapAdsToGui to show the value on the connected gui objects.
+        If the value cannot be read the mapper is marked bad before the
+        error is raised.
 
         :param qthmi.ads.constants.AmsAdr adsAdr: address to the ADS
             device
+        :param qthmi.ads.cache.ValueCache cache: cache the value is read
+            through, e.g. the cache of the connector, None to send a request
         :return: current value
 
         """
-        indexgroup = (
-            pyads.INDEXGROUP_MEMORYBIT
-            if self.plcDataType == pyads.PLCTYPE_BOOL
-            else pyads.INDEXGROUP_MEMORYBYTE
-        )
-        (err, value) = pyads.read(adsAdr, indexgroup, self.plcAdr, self.plcDataType)
-
-        if err:
+        try:
+            if cache is None:
+                value = read_value(
+                    adsAdr, self.indexGroup, self.plcAdr, self.plcDataType
+                )
+            else:
+                value = cache.get(
+                    adsAdr, self.indexGroup, self.plcAdr, self.plcDataType
+                )
+        except ADSError as e:
+            self.markBad(e.err_code)
             raise Exception(
-                "error reading from address %i. error number %i" % (self.plcAdr, err)
+                "error reading from address %i. error number %i" %
+                (self.plcAdr, e.err_code)
             )
+        self.update(value)
+
+        return value
+
+    def update(self, value: VALUE_TYPE, timestamp: Optional[float] = None) -> None:
+        """Show a value that has been read from the plc.
+
+        Store the value in self.currentValue and call mapAdsToGui for all
+        connected gui objects if the value has changed. This is used by
+        :py:meth:`read` and by collections of mappers that fetch their
+        values in one request like :py:class:`qthmi.ads.batch.ADSPollGroup`.
+        The quality is set to good.
+
+        The listeners of the mapper are called with every sample, even if
+        it is not shown.
+
+        :param value: value read from the plc
+        :param float timestamp: time the value has been sampled,
+            ``time.time``, by default now
+
+        """
+        self.currentValue = value
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.error = 0
+        if self.quality != QUALITY_GOOD:
+            self.quality = QUALITY_GOOD
+            self.showQuality()
+        if self.listeners:
+            self.notifyListeners(self.sample)
+
+        now = time.monotonic()
+        if self._shownTime is not None:
+            if not self.hasChanged(value):
+                self.suppressedUpdates += 1
+                return
+            remaining = self.minInterval - (now - self._shownTime)
+            if remaining > 0:
+                self.suppressedUpdates += 1
+                self._showLater(remaining)
+                return
+        self._show(value, now)
+
+    def _showLater(self, delay: float) -> None:
+        # the change held back by minInterval is shown when it is over
+        if self._trailing or QCoreApplication.instance() is None:
+            return
+        self._trailing = True
+        QTimer.singleShot(int(math.ceil(delay * 1000)), self._showTrailing)
+
+    def _showTrailing(self) -> None:
+        self._trailing = False
+        value = self.currentValue
+        if self.hasChanged(value):
+            self._show(value, time.monotonic())
+
+    def _show(self, value: VALUE_TYPE, now: float) -> None:
+        self._shownValue = value
+        self._shownTime = now
+        self.deliveredUpdates += 1
+        if metrics.enabled:
+            start = time.perf_counter()
+            self.showValue(value)
+            metrics.registry.dispatched(time.perf_counter() - start)
+        else:
+            self.showValue(value)
+
+    def showValue(self, value: VALUE_TYPE) -> None:
+        """Call mapAdsToGui for all connected gui objects.
+
+        :param value: value to display
+
+        """
         if isinstance(self.guiObjects, (list, tuple)):
             for o in self.guiObjects:
                 self.mapAdsToGui(o, value)
         else:
             self.mapAdsToGui(self.guiObjects, value)
 
-        self.currentValue = value
+    def markBad(self, error: int = 0) -> None:
+        """Mark the value bad because it could not be read.
 
-        return value
+        The last value and its timestamp are kept, ``mapQualityToGui`` is
+        called if the quality changes. The listeners get the last value with
+        bad quality, stamped with the time of the failed read.
+
+        :param int error: ADS error code, 0 if unknown
+
+        """
+        self.error = error
+        if self.quality != QUALITY_BAD:
+            self.quality = QUALITY_BAD
+            self.showQuality()
+        if self.listeners:
+            self.notifyListeners(self.sample._replace(timestamp=time.time()))
+
+    def showQuality(self) -> None:
+        """Call mapQualityToGui for all connected gui objects."""
+        sample = self.sample
+        if isinstance(self.guiObjects, (list, tuple)):
+            for o in self.guiObjects:
+                self.mapQualityToGui(o, sample)
+        else:
+            self.mapQualityToGui(self.guiObjects, sample)
+
+    def notifyListeners(self, sample: Sample) -> None:
+        """Call the listeners with a sample.
+
+        :param Sample sample: value read from the plc with its timestamp and
+            quality
+
+        """
+        for listener in self.listeners:
+            listener(sample)
+
+    def addListener(self, listener: Callable[[Sample], None]) -> None:
+        """Add a function that is called with every value read from the plc.
+
+        Failed reads are passed as samples of bad quality.
+
+        :param listener: function taking a :py:class:`Sample` as only
+            argument
+
+        """
+        self.listeners.append(listener)
+
+    def removeListener(self, listener: Callable[[Sample], None]) -> None:
+        """Remove a function added by :py:meth:`addListener`.
+
+        :param listener: function to remove
+
+        """
+        self.listeners.remove(listener)
+
+    def hasChanged(self, value: VALUE_TYPE) -> bool:
+        """Check if the value differs from the value shown last.
+
+        :param value: value read from the plc
+
+        """
+        last = self._shownValue
+        if (
+            isinstance(value, float)
+            and isinstance(last, (float, int))
+            and (self.deadband or self.deadbandPercent)
+        ):
+            diff = abs(value - last)
+            return (
+                diff > self.deadband
+                and diff > abs(last) * self.deadbandPercent / 100.0
+            )
+        return value != last
 
     def mapAdsToGui(self, guiObject: HMIObject, value: VALUE_TYPE) -> None:
         """Display the value on the connected gui object.gui.
@@ -138,3 +403,14 @@ class ADSMapper:
 
         """
         print(value)
+
+    def mapQualityToGui(self, guiObject: HMIObject, sample: Sample) -> None:
+        """Display the quality of the value on the connected gui object.
+
+        This function may be overriden, e.g. to grey out or colour a widget
+        showing a bad value. By default nothing is done.
+
+        :param QObject guiObject: gui object for value output
+        :param Sample sample: current value with timestamp and quality
+
+        """
@@ -0,0 +1,476 @@
+"""Long term storage of plc values in memory mapped segment files.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+The :py:class:`Historian` appends time stamped values to segment files of
+fixed size records, one directory per signal. The segments are memory
+mapped, so queries return numpy views on the files without reading or
+copying them. Samples are queued by the polling code and written by a
+background thread, disk I/O never delays a refresh cycle. Values of attached
+mappers are stored with the timestamp of the read, failed reads as NaN.
+
+A full segment is closed and a new one is started. Segments older than the
+retention time are deleted.
+
+Layout of a segment file: a header of :py:data:`HEADER_SIZE` bytes with
+magic and number of records, followed by records of
+:py:data:`RECORD_DTYPE`.
+
+"""
+import bisect
+import mmap
+import os
+import queue
+import re
+import struct
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from . import metrics
+from .gui import ADSMapper, VALUE_TYPE
+from .quality import Sample
+
+if TYPE_CHECKING:
+    from .table import TagView  # noqa: F401
+
+
+#: record of a segment file, time stamp in seconds since the epoch and value
+RECORD_DTYPE = np.dtype([("time", "<f8"), ("value", "<f8")])
+
+#: size of the segment header in bytes
+HEADER_SIZE = 64
+
+#: default number of records per segment, 16 MiB per file
+SEGMENT_RECORDS = 1024 * 1024
+
+_HEADER = struct.Struct("<8sQ")
+_MAGIC = b"QTHMIHS1"
+
+
+class Segment:
+    """Memory mapped segment file of a signal.
+
+    :param str path: path of the segment file
+    :param int capacity: number of records, only used for new files
+
+    :ivar records: array of all records viewing the file
+    :ivar int count: number of valid records
+
+    """
+
+    def __init__(self, path: str, capacity: int = SEGMENT_RECORDS) -> None:
+        self.path = path
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, 0).ljust(HEADER_SIZE, b"\x00"))
+                f.truncate(HEADER_SIZE + capacity * RECORD_DTYPE.itemsize)
+
+        with open(path, "r+b") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0)
+        magic, self.count = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC:
+            self._mmap.close()
+            raise ValueError("%s is no historian segment" % path)
+        self.capacity = (len(self._mmap) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        self.records = np.ndarray(
+            (self.capacity,), RECORD_DTYPE, self._mmap, HEADER_SIZE
+        )
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def full(self) -> bool:
+        """True if no more records fit into the segment."""
+        return self.count >= self.capacity
+
+    @property
+    def start(self) -> float:
+        """Time stamp of the first record."""
+        return float(self.records["time"][0]) if self.count else float("inf")
+
+    @property
+    def end(self) -> float:
+        """Time stamp of the last record."""
+        if not self.count:
+            return float("-inf")
+        return float(self.records["time"][self.count - 1])
+
+    def append(self, samples: np.ndarray) -> int:
+        """Append records as far as they fit into the segment.
+
+        :param samples: array of :py:data:`RECORD_DTYPE`
+        :return: number of appended records
+
+        """
+        n = min(len(samples), self.capacity - self.count)
+        self.records[self.count:self.count + n] = samples[:n]
+        self.count += n
+        _HEADER.pack_into(self._mmap, 0, _MAGIC, self.count)
+        return n
+
+    def range(self, start: float, end: float) -> np.ndarray:
+        """Return the records of a time range as view on the file.
+
+        :param float start: first time stamp, inclusive
+        :param float end: last time stamp, exclusive
+
+        """
+        times = self.records["time"][:self.count]
+        first = int(np.searchsorted(times, start, "left"))
+        last = int(np.searchsorted(times, end, "left"))
+        return self.records[first:last]
+
+    def flush(self) -> None:
+        """Write the changes to disk."""
+        self._mmap.flush()
+
+    def close(self) -> None:
+        """Close the memory map, if no view on it is in use anymore."""
+        try:
+            self._mmap.close()
+        except BufferError:
+            # views returned by queries keep the map alive
+            pass
+
+
+class SignalStore:
+    """Segments of a signal, ordered by time.
+
+    :param str directory: directory of the segment files
+    :param int segment_records: number of records of new segments
+
+    """
+
+    def __init__(self, directory: str, segment_records: int = SEGMENT_RECORDS) -> None:
+        self.directory = directory
+        self.segment_records = segment_records
+        os.makedirs(directory, exist_ok=True)
+
+        self.segments: List[Segment] = []
+        self._starts: List[float] = []
+        self._lock = threading.Lock()
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".seg"):
+                segment = Segment(os.path.join(directory, name))
+                if segment.count:
+                    self.segments.append(segment)
+                    self._starts.append(segment.start)
+
+    def append(self, samples: np.ndarray) -> None:
+        """Append records, start new segments if necessary.
+
+        :param samples: array of :py:data:`RECORD_DTYPE` in chronological
+            order
+
+        """
+        while len(samples):
+            segment = self.segments[-1] if self.segments else None
+            if segment is None or segment.full:
+                number = (
+                    int(os.path.basename(segment.path)[:-4]) + 1
+                    if segment is not None else 0
+                )
+                segment = Segment(
+                    os.path.join(self.directory, "%08i.seg" % number),
+                    self.segment_records,
+                )
+                with self._lock:
+                    self.segments.append(segment)
+                    self._starts.append(float(samples["time"][0]))
+            n = segment.append(samples)
+            samples = samples[n:]
+
+    def query(self, start: float, end: float) -> List[np.ndarray]:
+        """Return the records of a time range as views per segment.
+
+        The segments are found by binary search on their start times.
+
+        :param float start: first time stamp, inclusive
+        :param float end: last time stamp, exclusive
+
+        """
+        with self._lock:
+            first = max(bisect.bisect_right(self._starts, start) - 1, 0)
+            last = bisect.bisect_left(self._starts, end)
+            segments = self.segments[first:last]
+        views = [segment.range(start, end) for segment in segments]
+        return [view for view in views if len(view)]
+
+    def expire(self, before: float) -> int:
+        """Delete the segments whose records are all older than a time stamp.
+
+        The last segment is never deleted.
+
+        :param float before: time stamp
+        :return: number of deleted segments
+
+        """
+        with self._lock:
+            count = 0
+            while len(self.segments) > 1 and self.segments[0].end < before:
+                expired = self.segments.pop(0)
+                self._starts.pop(0)
+                expired.close()
+                try:
+                    os.remove(expired.path)
+                except OSError:
+                    # still mapped on Windows, expires again on the next start
+                    pass
+                count += 1
+        return count
+
+    def flush(self) -> None:
+        """Write the changes of the last segment to disk."""
+        if self.segments:
+            self.segments[-1].flush()
+
+    def close(self) -> None:
+        """Flush and close all segments."""
+        with self._lock:
+            for segment in self.segments:
+                segment.flush()
+                segment.close()
+            self.segments = []
+            self._starts = []
+
+
+class Historian:
+    """Append only storage of plc values.
+
+    Samples are added by :py:meth:`record` or by mappers connected with
+    :py:meth:`attach` and written to disk by a background thread. The time
+    stamps of a signal need to increase monotonically.
+
+    :param str directory: directory of the historian, one sub directory per
+        signal
+    :param float retention: time in seconds after which samples are deleted,
+        None keeps all samples
+    :param int segment_records: number of records per segment file
+    :param float flush_interval: maximum time in seconds before queued
+        samples are written to disk
+
+    Sample code::
+
+    >>> historian = Historian("history", retention=28 * 24 * 3600)
+    >>> historian.attach(temperatureMapper, "temperature")
+    >>> historian.start()
+    >>> ...
+    >>> records = historian.query("temperature", time.time() - 3600)
+    >>> historian.close()
+
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        retention: Optional[float] = None,
+        segment_records: int = SEGMENT_RECORDS,
+        flush_interval: float = 1.0,
+    ) -> None:
+        self.directory = directory
+        self.retention = retention
+        self.segment_records = segment_records
+        self.flush_interval = flush_interval
+
+        self.stores: Dict[str, SignalStore] = {}
+        self._queue: "queue.Queue[Optional[Tuple[str, float, float]]]" = queue.Queue()
+        self._listeners: Dict[str, Tuple[Union[ADSMapper, "TagView"], Any]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._last_expire = 0.0
+
+    def start(self) -> None:
+        """Start the writer thread."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="Historian", daemon=True
+        )
+        self._thread.start()
+
+    def close(self) -> None:
+        """Write all queued samples, stop the writer thread and close files."""
+        for name in list(self._listeners):
+            self.detach(name)
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        else:
+            self._write(self._drain()[0])
+        with self._lock:
+            for store in self.stores.values():
+                store.close()
+            self.stores.clear()
+
+    def record(
+        self, name: str, value: VALUE_TYPE, timestamp: Optional[float] = None
+    ) -> None:
+        """Queue a sample for writing.
+
+        :param str name: name of the signal
+        :param value: value of the sample, None is ignored
+        :param float timestamp: time stamp in seconds since the epoch, the
+            current time by default
+
+        """
+        if value is None:
+            return
+        self._queue.put(
+            (name, time.time() if timestamp is None else timestamp,
+             float(value))  # type: ignore
+        )
+
+    def attach(
+        self, mapper: Union[ADSMapper, "TagView"], name: Optional[str] = None
+    ) -> str:
+        """Record every value read by a mapper, failed reads as NaN.
+
+        :param mapper: :py:class:`ADSMapper` or tag view to record
+        :param str name: name of the signal, the symbol name or address of
+            the mapper by default
+        :return: name of the signal
+
+        """
+        if name is None:
+            name = mapper.symbol or str(mapper.plcAdr)
+        signal = name
+
+        def listener(sample: Sample) -> None:
+            # failed reads are recorded as NaN
+            value = sample.value if sample.good else float("nan")
+            self.record(signal, value, sample.timestamp)
+
+        mapper.addListener(listener)
+        self._listeners[name] = (mapper, listener)
+        return name
+
+    def detach(self, name: str) -> None:
+        """Stop recording the mapper of a signal.
+
+        :param str name: name of the signal
+
+        """
+        if name in self._listeners:
+            mapper, listener = self._listeners.pop(name)
+            mapper.removeListener(listener)
+
+    def store(self, name: str) -> SignalStore:
+        """Return the segment store of a signal, open it if necessary.
+
+        :param str name: name of the signal
+
+        """
+        with self._lock:
+            store = self.stores.get(name)
+            if store is None:
+                directory = os.path.join(
+                    self.directory, re.sub(r"[^\w.\-]", "_", name)
+                )
+                store = SignalStore(directory, self.segment_records)
+                self.stores[name] = store
+        return store
+
+    def query_segments(
+        self, name: str, start: float, end: float = None
+    ) -> List[np.ndarray]:
+        """Return the records of a time range as views per segment file.
+
+        :param str name: name of the signal
+        :param float start: first time stamp, inclusive
+        :param float end: last time stamp, exclusive, now by default
+
+        """
+        return self.store(name).query(start, time.time() if end is None else end)
+
+    def query(self, name: str, start: float, end: float = None) -> np.ndarray:
+        """Return the records of a time range.
+
+        The result is a view on the segment file if the range lies within
+        one segment, otherwise the records of the segments are copied into
+        one array.
+
+        :param str name: name of the signal
+        :param float start: first time stamp, inclusive
+        :param float end: last time stamp, exclusive, now by default
+        :return: array of :py:data:`RECORD_DTYPE`
+
+        """
+        views = self.query_segments(name, start, end)
+        if not views:
+            return np.empty(0, RECORD_DTYPE)
+        if len(views) == 1:
+            return views[0]
+        return np.concatenate(views)
+
+    def expire(self) -> int:
+        """Delete the segments older than the retention time.
+
+        Called by the writer thread, call it directly if the thread is not
+        used.
+
+        :return: number of deleted segments
+
+        """
+        if self.retention is None:
+            return 0
+        before = time.time() - self.retention
+        with self._lock:
+            stores = list(self.stores.values())
+        return sum(store.expire(before) for store in stores)
+
+    def _drain(
+        self, items: List[Any] = None
+    ) -> Tuple[Dict[str, List[Tuple[float, float]]], bool]:
+        # group the queued samples by signal, None requests to stop
+        samples: Dict[str, List[Tuple[float, float]]] = {}
+        stop = False
+        items = list(items or [])
+        while True:
+            for item in items:
+                if item is None:
+                    stop = True
+                else:
+                    samples.setdefault(item[0], []).append(item[1:])
+            try:
+                items = [self._queue.get_nowait()]
+            except queue.Empty:
+                return samples, stop
+
+    def _write(
+        self, samples: Dict[str, List[Tuple[float, float]]], flush: bool = True
+    ) -> None:
+        for name, values in samples.items():
+            self.store(name).append(np.array(values, RECORD_DTYPE))
+        if flush:
+            with self._lock:
+                stores = list(self.stores.values())
+            for store in stores:
+                store.flush()
+
+    def _run(self) -> None:
+        stop = False
+        last_flush = time.monotonic()
+        while not stop:
+            try:
+                items = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                items = []
+            if metrics.enabled:
+                metrics.registry.queue_depth(
+                    "historian", self._queue.qsize() + len(items)
+                )
+            samples, stop = self._drain(items)
+
+            now = time.monotonic()
+            flush = stop or now - last_flush >= self.flush_interval
+            if flush:
+                last_flush = now
+            self._write(samples, flush)
+
+            if now - self._last_expire > 60.0:
+                self._last_expire = now
+                self.expire()
@@ -0,0 +1,377 @@
+"""Instrumentation of the ADS communication.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+When enabled by :py:func:`enable` every ADS request is timed and counted
+per target and per index group, together with the transferred bytes and
+errors. The number of requests per polling cycle, the time spent drawing
+values in ``mapAdsToGui`` and the depth of the job queues are recorded as
+well. While disabled the instrumented code only checks :py:data:`enabled`.
+
+The numbers are available by :py:meth:`Registry.snapshot` and as text in
+the Prometheus exposition format by :py:meth:`Registry.prometheus`.
+:py:class:`qthmi.ads.overlay.StatsOverlay` shows them on the HMI.
+
+Sample code::
+
+>>> from qthmi.ads import metrics
+>>> metrics.enable()
+>>> ...
+>>> print(metrics.registry.prometheus())
+
+"""
+import bisect
+import threading
+import time
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Sequence, Tuple
+from contextlib import contextmanager, nullcontext
+
+import pyads
+
+
+#: True if the ADS communication is instrumented
+enabled = False
+
+#: upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+#: upper bounds of the requests per cycle histogram buckets
+CYCLE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def target_key(adr: pyads.AmsAddr) -> str:
+    """Return a key identifying an ADS device, e.g. ``5.20.31.1.1.1:851``.
+
+    :param pyads.AmsAddr adr: address of the ADS device
+
+    """
+    return "%s:%i" % (adr.netid, adr.port)
+
+
+class Histogram:
+    """Histogram with fixed buckets.
+
+    :param bounds: upper bounds of the buckets in ascending order, a last
+        bucket collects all larger values
+
+    """
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS) -> None:
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Add a value.
+
+        :param float value: value to add
+
+        """
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    @property
+    def mean(self) -> float:
+        """Mean of all values."""
+        return self.sum / self.count if self.count else 0.0
+
+    def percentile(self, p: float) -> float:
+        """Estimate a percentile by the upper bound of its bucket.
+
+        :param float p: percentile between 0 and 100
+        :return: upper bound of the bucket, infinity for the last bucket
+
+        """
+        if not self.count:
+            return 0.0
+        rank = self.count * p / 100.0
+        total = 0
+        for bound, count in zip(self.bounds, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float("inf")
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """Return (upper bound, cumulative count) tuples of all buckets."""
+        result = []
+        total = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class RequestStats:
+    """Counters of an ADS device or index group.
+
+    :ivar Histogram latency: request durations in seconds
+    :ivar int errors: number of failed requests
+    :ivar int bytes_read: number of bytes received
+    :ivar int bytes_written: number of bytes sent
+
+    """
+
+    def __init__(self) -> None:
+        self.latency = Histogram()
+        self.errors = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    @property
+    def requests(self) -> int:
+        """Number of requests."""
+        return self.latency.count
+
+
+class Registry:
+    """Collected numbers of the instrumentation.
+
+    All methods are thread-safe.
+
+    """
+
+    def __init__(self) -> None:
+        self.started = time.time()
+        self.targets: Dict[str, RequestStats] = {}
+        self.index_groups: Dict[int, RequestStats] = {}
+        self.cycles: Dict[str, Histogram] = {}
+        self.dispatch = Histogram()
+        self.queues: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def reset(self) -> None:
+        """Clear all numbers."""
+        with self._lock:
+            self.started = time.time()
+            self.targets.clear()
+            self.index_groups.clear()
+            self.cycles.clear()
+            self.dispatch = Histogram()
+            self.queues.clear()
+
+    def request(
+        self,
+        adr: pyads.AmsAddr,
+        index_group: int,
+        duration: float,
+        bytes_read: int = 0,
+        bytes_written: int = 0,
+        error: bool = False,
+    ) -> None:
+        """Record an ADS request.
+
+        :param pyads.AmsAddr adr: address of the ADS device
+        :param int index_group: index group of the request
+        :param float duration: duration in seconds
+        :param int bytes_read: number of bytes received
+        :param int bytes_written: number of bytes sent
+        :param bool error: True if the request failed
+
+        """
+        key = target_key(adr)
+        self._local.requests = getattr(self._local, "requests", 0) + 1
+        with self._lock:
+            for stats in (
+                self.targets.get(key) or self.targets.setdefault(key, RequestStats()),
+                self.index_groups.get(index_group)
+                or self.index_groups.setdefault(index_group, RequestStats()),
+            ):
+                stats.latency.observe(duration)
+                stats.bytes_read += bytes_read
+                stats.bytes_written += bytes_written
+                stats.errors += error
+
+    def measure(
+        self,
+        adr: pyads.AmsAddr,
+        index_group: int,
+        bytes_read: int,
+        bytes_written: int,
+        function: Callable[..., Any],
+        *args: Any
+    ) -> Any:
+        """Call a function sending an ADS request and record the request.
+
+        :param pyads.AmsAddr adr: address of the ADS device
+        :param int index_group: index group of the request
+        :param int bytes_read: number of bytes received
+        :param int bytes_written: number of bytes sent
+        :param function: function sending the request
+        :param args: arguments of the function
+        :return: return value of the function
+
+        """
+        start = time.perf_counter()
+        try:
+            result = function(*args)
+        except Exception:
+            self.request(
+                adr, index_group, time.perf_counter() - start,
+                error=True,
+            )
+            raise
+        self.request(
+            adr, index_group, time.perf_counter() - start,
+            bytes_read, bytes_written,
+        )
+        return result
+
+    @contextmanager
+    def cycle(self, name: str) -> Iterator[None]:
+        """Count the requests of the current thread within a polling cycle.
+
+        :param str name: name of the cycle, e.g. the scan class
+
+        """
+        first = getattr(self._local, "requests", 0)
+        try:
+            yield
+        finally:
+            count = getattr(self._local, "requests", 0) - first
+            with self._lock:
+                histogram = self.cycles.get(name)
+                if histogram is None:
+                    histogram = self.cycles[name] = Histogram(CYCLE_BUCKETS)
+                histogram.observe(count)
+
+    def dispatched(self, duration: float) -> None:
+        """Record the time spent in ``mapAdsToGui`` for one value.
+
+        :param float duration: duration in seconds
+
+        """
+        with self._lock:
+            self.dispatch.observe(duration)
+
+    def queue_depth(self, name: str, depth: int) -> None:
+        """Set the current depth of a queue.
+
+        :param str name: name of the queue
+        :param int depth: number of waiting jobs
+
+        """
+        with self._lock:
+            self.queues[name] = depth
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the current numbers as dictionary, durations in seconds."""
+
+        def summary(stats: RequestStats) -> Dict[str, Any]:
+            return {
+                "requests": stats.requests,
+                "errors": stats.errors,
+                "bytes_read": stats.bytes_read,
+                "bytes_written": stats.bytes_written,
+                "mean": stats.latency.mean,
+                "p50": stats.latency.percentile(50),
+                "p99": stats.latency.percentile(99),
+            }
+
+        with self._lock:
+            return {
+                "uptime": time.time() - self.started,
+                "targets": {k: summary(s) for k, s in self.targets.items()},
+                "index_groups": {
+                    k: summary(s) for k, s in self.index_groups.items()
+                },
+                "cycles": {
+                    k: {"cycles": h.count, "mean_requests": h.mean,
+                        "max_requests": h.percentile(100)}
+                    for k, h in self.cycles.items()
+                },
+                "dispatch": {
+                    "count": self.dispatch.count,
+                    "mean": self.dispatch.mean,
+                    "p99": self.dispatch.percentile(99),
+                },
+                "queues": dict(self.queues),
+            }
+
+    def prometheus(self, prefix: str = "qthmi_ads") -> str:
+        """Return the numbers in the Prometheus text exposition format.
+
+        :param str prefix: prefix of the metric names
+
+        """
+        lines: List[str] = []
+
+        def histogram(name: str, labels: str, h: Histogram) -> None:
+            sep = "," if labels else ""
+            for bound, total in h.cumulative():
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(
+                    '%s_bucket{%s%sle="%s"} %i' % (name, labels, sep, le, total)
+                )
+            braces = "{%s}" % labels if labels else ""
+            lines.append("%s_sum%s %r" % (name, braces, h.sum))
+            lines.append("%s_count%s %i" % (name, braces, h.count))
+
+        def counters(
+            name: str, label: str, items: Dict[Any, RequestStats]
+        ) -> None:
+            for metric, attribute in (
+                ("requests_total", "requests"),
+                ("errors_total", "errors"),
+                ("read_bytes_total", "bytes_read"),
+                ("written_bytes_total", "bytes_written"),
+            ):
+                lines.append("# TYPE %s_%s_%s counter" % (prefix, name, metric))
+                for key, stats in items.items():
+                    lines.append('%s_%s_%s{%s="%s"} %i' % (
+                        prefix, name, metric, label, key,
+                        getattr(stats, attribute),
+                    ))
+            lines.append("# TYPE %s_%s_request_seconds histogram" % (prefix, name))
+            for key, stats in items.items():
+                histogram(
+                    "%s_%s_request_seconds" % (prefix, name),
+                    '%s="%s"' % (label, key), stats.latency,
+                )
+
+        with self._lock:
+            counters("target", "target", self.targets)
+            counters(
+                "index_group", "index_group",
+                {"0x%X" % k: s for k, s in self.index_groups.items()},
+            )
+            lines.append("# TYPE %s_cycle_requests histogram" % prefix)
+            for name, h in self.cycles.items():
+                histogram("%s_cycle_requests" % prefix, 'cycle="%s"' % name, h)
+            lines.append("# TYPE %s_dispatch_seconds histogram" % prefix)
+            histogram("%s_dispatch_seconds" % prefix, "", self.dispatch)
+            lines.append("# TYPE %s_queue_depth gauge" % prefix)
+            for name, depth in self.queues.items():
+                lines.append('%s_queue_depth{queue="%s"} %i' % (prefix, name, depth))
+        return "\n".join(lines) + "\n"
+
+
+#: registry of the instrumentation
+registry = Registry()
+
+
+def enable() -> None:
+    """Start instrumenting the ADS communication."""
+    global enabled
+    enabled = True
+
+
+def disable() -> None:
+    """Stop instrumenting the ADS communication, keep the numbers."""
+    global enabled
+    enabled = False
+
+
+def cycle(name: str) -> ContextManager[None]:
+    """Count the requests of a polling cycle if instrumentation is enabled.
+
+    :param str name: name of the cycle, e.g. the scan class
+
+    """
+    return registry.cycle(name) if enabled else nullcontext()
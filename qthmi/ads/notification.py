@@ -0,0 +1,247 @@
+"""Push based update of mappers by ADS device notifications.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+Instead of polling the plc cyclically the ADS device sends a notification
+whenever a value has changed. The notification callbacks are invoked in a
+thread of the ADS router. They only store the raw data and request a single
+queued Qt signal, the values are decoded and shown on the gui objects in the
+gui thread.
+
+"""
+import ctypes
+import struct
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import pyads
+from pyads.structs import SAdsNotificationHeader
+from PyQt5.QtCore import QObject, Qt, pyqtSignal
+from qthmi.main.connector import ConnectionError
+from . import metrics
+from .batch import ADSPollGroup, data_size, decode
+from .gui import ADSMapper, VALUE_TYPE
+from .ports import (
+    ADSError, add_device_notification, close_port, del_device_notification,
+    open_port
+)
+from .quality import ERR_INVALID_SIZE, filetime_to_timestamp
+
+
+#: default maximum number of notifications per group, further mappers are
+#: polled to keep the load of the ADS router low
+MAX_NOTIFICATIONS = 500
+
+
+def notification_attrib(
+    datatype: Any, cycle_time: int, max_delay: int
+) -> pyads.NotificationAttrib:
+    """Return the attributes of an on-change notification.
+
+    :param datatype: ``c`` datatype, a PLCTYPE constant
+    :param int cycle_time: cycle time in ms the ADS device checks for changes
+    :param int max_delay: maximum delay in ms before a notification is sent
+
+    """
+    # set the raw attributes, the unit of delay and cycle time is 100 ns
+    attr = pyads.NotificationAttrib(data_size(datatype))
+    attr.trans_mode = pyads.ADSTRANS_SERVERONCHA
+    attr.max_delay = max_delay * 10000
+    attr.cycle_time = cycle_time * 10000
+    return attr
+
+
+def sample_data(notification: Any) -> Tuple[int, bytes]:
+    """Return the handle and a copy of the data of a notification.
+
+    :param notification: notification header passed to the callback
+    :return: tuple of notification handle and raw data
+
+    """
+    contents = notification.contents
+    raw = ctypes.string_at(
+        ctypes.addressof(contents) + SAdsNotificationHeader.data.offset,
+        contents.cbSampleSize,
+    )
+    return contents.hNotification, raw
+
+
+def sample_time(notification: Any) -> float:
+    """Return the time the ADS device sampled the data of a notification.
+
+    :param notification: notification header passed to the callback
+    :return: timestamp, ``time.time``
+
+    """
+    return filetime_to_timestamp(notification.contents.nTimeStamp)
+
+
+class ADSNotificationGroup(QObject):
+    """Collection of mappers that are updated by ADS device notifications.
+
+    For every mapper an on-change notification is registered on the ADS
+    device. If the registration fails or :py:data:`MAX_NOTIFICATIONS` is
+    exceeded the mapper is added to :py:attr:`fallback` and needs to be
+    polled by calling :py:meth:`poll` cyclically.
+
+    Notifications arriving for the same mapper before the gui thread
+    handled them are coalesced, only the latest value is shown. The values
+    carry the timestamp of the ADS device. A sample that cannot be decoded
+    marks its mapper bad.
+
+    :param pyads.AmsAddr adsAdr: address to the ADS device
+    :param mappers: mappers belonging to the group
+    :param int cycle_time: cycle time in ms the ADS device checks for changes
+    :param int max_delay: maximum delay in ms before a notification is sent
+    :param int max_notifications: maximum number of registered notifications
+    :param QObject parent: parent object
+
+    :ivar ADSPollGroup fallback: mappers that are not notified and need
+        to be polled
+
+    Sample code::
+
+    >>> group = ADSNotificationGroup(adsAdr, mappers, cycle_time=50)
+    >>> timer.timeout.connect(lambda: group.poll())
+
+    """
+
+    notified = pyqtSignal()
+
+    def __init__(
+        self,
+        adsAdr: pyads.AmsAddr,
+        mappers: Iterable[ADSMapper] = (),
+        cycle_time: int = 100,
+        max_delay: int = 100,
+        max_notifications: int = MAX_NOTIFICATIONS,
+        parent: QObject = None,
+    ) -> None:
+        super(ADSNotificationGroup, self).__init__(parent)
+        self.adsAdr = adsAdr
+        self.cycle_time = cycle_time
+        self.max_delay = max_delay
+        self.max_notifications = max_notifications
+        self.fallback = ADSPollGroup()
+
+        self._port: Optional[int] = open_port()
+        self._handles: Dict[ADSMapper, int] = {}
+        self._mappers: Dict[int, ADSMapper] = {}
+        self._pending: Dict[int, Tuple[bytes, float]] = {}
+        self._scheduled = False
+        self._lock = threading.Lock()
+
+        self.notified.connect(self._dispatch, Qt.QueuedConnection)
+
+        for mapper in mappers:
+            self.add(mapper)
+
+    @property
+    def mappers(self) -> List[ADSMapper]:
+        """Mappers updated by notifications."""
+        return list(self._handles)
+
+    def add(self, mapper: ADSMapper) -> bool:
+        """Register a notification for the mapper.
+
+        :param ADSMapper mapper: mapper to add
+        :return: True if the notification has been registered, False if the
+            mapper has been added to the polled fallback group
+
+        """
+        if len(self._handles) >= self.max_notifications:
+            self.fallback.add(mapper)
+            return False
+
+        attr = notification_attrib(
+            mapper.plcDataType, self.cycle_time, self.max_delay
+        )
+        if self._port is None:
+            raise ConnectionError("Notification group is closed")
+        try:
+            handle = add_device_notification(
+                self._port, self.adsAdr, mapper.indexGroup, mapper.plcAdr,
+                attr, self._callback
+            )
+        except ADSError:
+            self.fallback.add(mapper)
+            return False
+
+        with self._lock:
+            self._handles[mapper] = handle
+            self._mappers[handle] = mapper
+        return True
+
+    def remove(self, mapper: ADSMapper) -> None:
+        """Delete the notification of the mapper.
+
+        :param ADSMapper mapper: mapper to remove
+
+        """
+        if mapper in self.fallback.mappers:
+            self.fallback.remove(mapper)
+            return
+
+        with self._lock:
+            handle = self._handles.pop(mapper)
+            del self._mappers[handle]
+            self._pending.pop(handle, None)
+        if self._port is None:
+            return
+        try:
+            del_device_notification(self._port, self.adsAdr, handle)
+        except ADSError:
+            # the device deletes the notifications of a lost connection
+            pass
+
+    def clear(self) -> None:
+        """Delete all notifications and clear the fallback group."""
+        for mapper in self.mappers + self.fallback.mappers:
+            self.remove(mapper)
+
+    def close(self) -> None:
+        """Delete all notifications and release the port."""
+        if self._port is None:
+            return
+        self.clear()
+        self._port = None
+        close_port()
+
+    def poll(self) -> List[VALUE_TYPE]:
+        """Read the mappers of the fallback group.
+
+        :return: list of values of the fallback mappers
+
+        """
+        if not self.fallback.mappers:
+            return []
+        return self.fallback.read(self.adsAdr)
+
+    def _callback(self, notification: Any) -> None:
+        # invoked in the thread of the ADS router, keep it short
+        handle, raw = sample_data(notification)
+        with self._lock:
+            self._pending[handle] = (raw, sample_time(notification))
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self.notified.emit()
+
+    def _dispatch(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._scheduled = False
+        if metrics.enabled:
+            metrics.registry.queue_depth("notifications", len(pending))
+
+        for handle, (raw, timestamp) in pending.items():
+            mapper = self._mappers.get(handle)
+            if mapper is None:
+                continue
+            try:
+                value = decode(mapper.plcDataType, memoryview(raw))
+            except (struct.error, ValueError):
+                # the sample does not match the datatype, only this mapper fails
+                mapper.markBad(ERR_INVALID_SIZE)
+                continue
+            mapper.update(value, timestamp)
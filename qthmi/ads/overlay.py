@@ -0,0 +1,114 @@
+"""Overlay showing the live numbers of the ADS instrumentation.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+The :py:class:`StatsOverlay` is a semi-transparent label placed on top of
+another widget. It shows the request rate and latency per ADS device, the
+requests per polling cycle, the time spent in ``mapAdsToGui`` and the depth
+of the job queues recorded by :py:mod:`qthmi.ads.metrics`.
+
+Sample code::
+
+>>> metrics.enable()
+>>> overlay = StatsOverlay(mainWindow.centralWidget())
+>>> overlay.show()
+
+"""
+from typing import Any, Dict
+
+from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtGui import QFont
+from PyQt5.QtWidgets import QLabel, QWidget
+from . import metrics
+
+
+STYLE = "background-color: rgba(0, 0, 0, 160); color: white; padding: 4px;"
+
+
+class StatsOverlay(QLabel):
+    """Label showing the numbers of the ADS instrumentation.
+
+    The numbers are refreshed by a timer while the overlay is visible.
+
+    :param QWidget parent: widget the overlay is placed on
+    :param int interval: refresh interval in milliseconds
+    :param registry: registry to show, defaults to
+        :py:data:`qthmi.ads.metrics.registry`
+
+    """
+
+    def __init__(
+        self,
+        parent: QWidget = None,
+        interval: int = 500,
+        registry: metrics.Registry = None,
+    ) -> None:
+        super(StatsOverlay, self).__init__(parent)
+        self.registry = registry or metrics.registry
+        self._last: Dict[str, Any] = {}
+
+        font = QFont("monospace")
+        font.setStyleHint(QFont.TypeWriter)
+        self.setFont(font)
+        self.setStyleSheet(STYLE)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setTextFormat(Qt.PlainText)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.refresh)
+
+    def showEvent(self, event: Any) -> None:
+        self.refresh()
+        self.timer.start()
+        super(StatsOverlay, self).showEvent(event)
+
+    def hideEvent(self, event: Any) -> None:
+        self.timer.stop()
+        super(StatsOverlay, self).hideEvent(event)
+
+    def refresh(self) -> None:
+        """Show the current numbers."""
+        snapshot = self.registry.snapshot()
+        self.setText(self.format(snapshot))
+        self.adjustSize()
+        self._last = snapshot
+
+    def format(self, snapshot: Dict[str, Any]) -> str:
+        """Format a snapshot of the registry as text.
+
+        The request rate is calculated from the previous snapshot.
+
+        :param dict snapshot: result of :py:meth:`metrics.Registry.snapshot`
+
+        """
+        lines = [] if metrics.enabled else ["instrumentation disabled"]
+        elapsed = snapshot["uptime"] - self._last.get("uptime", 0.0)
+        last_targets = self._last.get("targets", {})
+
+        lines.append("%-24s %8s %8s %8s %6s" % (
+            "target", "req/s", "p50 ms", "p99 ms", "errors"
+        ))
+        for key, stats in sorted(snapshot["targets"].items()):
+            previous = last_targets.get(key, {}).get("requests", 0)
+            rate = (stats["requests"] - previous) / elapsed if elapsed > 0 else 0.0
+            lines.append("%-24s %8.1f %8.2f %8.2f %6i" % (
+                key, rate, stats["p50"] * 1e3, stats["p99"] * 1e3,
+                stats["errors"],
+            ))
+
+        for name, stats in sorted(snapshot["cycles"].items()):
+            lines.append("cycle %-18s %8.1f req/cycle" % (
+                name, stats["mean_requests"]
+            ))
+
+        dispatch = snapshot["dispatch"]
+        lines.append("dispatch %8i values  mean %.3f ms  p99 %.3f ms" % (
+            dispatch["count"], dispatch["mean"] * 1e3, dispatch["p99"] * 1e3
+        ))
+
+        if snapshot["queues"]:
+            lines.append("queues " + "  ".join(
+                "%s %i" % item for item in sorted(snapshot["queues"].items())
+            ))
+        return "\n".join(lines)
@@ -0,0 +1,214 @@
+"""Coalescing of reads from adjacent plc addresses into block reads.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+Mappers usually point at neighbouring addresses of the plc memory area.
+Instead of reading each address separately the addresses are sorted by
+index group and offset and merged into blocks. Each block is read in one
+piece and the values are decoded from the shared buffer.
+
+Bit addresses (``INDEXGROUP_MEMORYBIT``) are folded into byte reads of the
+memory area (``INDEXGROUP_MEMORYBYTE``) and unpacked with bit masks.
+Variables accessed by handle (``ADSIGRP_SYM_VALBYHND``) are never merged,
+their offset is a handle and not a memory address.
+
+"""
+import time
+from typing import Any, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import pyads
+from pyads.constants import ADSIGRP_SYM_VALBYHND
+from qthmi.main.connector import ConnectionError
+from .batch import MAX_SUM_REQUESTS, ADSPollGroup, data_size, sum_read
+from .codecs import get_codec
+from .gui import ADSMapper, VALUE_TYPE
+from .ports import ADSError
+from .quality import ERR_SYMBOL_NOT_FOUND
+
+
+#: default maximum number of unused bytes between two merged addresses
+MAX_GAP = 16
+
+#: default maximum size of a block in bytes
+MAX_BLOCK_SIZE = 1024
+
+
+class Slot(NamedTuple):
+    """Position of a single value within a block."""
+
+    item: int  #: index of the item in the planned sequence
+    offset: int  #: byte offset relative to the start of the block
+    datatype: Any  #: ``c`` datatype, a PLCTYPE constant
+    bit: Optional[int]  #: bit number for folded bit addresses
+
+
+class Block(NamedTuple):
+    """Contiguous memory range that is read in one piece."""
+
+    index_group: int
+    start: int
+    length: int
+    slots: List[Slot]
+
+
+def plan_blocks(
+    items: Sequence[Tuple[int, int, Any]],
+    max_gap: int = MAX_GAP,
+    max_block_size: int = MAX_BLOCK_SIZE,
+) -> List[Block]:
+    """Merge plc addresses into blocks of contiguous memory.
+
+    :param items: list of (index group, index offset, datatype) tuples,
+        items with index offset None, e.g. unresolved symbols, are skipped
+    :param int max_gap: maximum number of unused bytes between two addresses
+        that are merged into the same block
+    :param int max_block_size: maximum size of a block in bytes, a single
+        value larger than this gets a block of its own
+    :return: list of blocks sorted by index group and start offset
+
+    """
+    ranges = []
+    for i, (group, offset, datatype) in enumerate(items):
+        if offset is None:
+            continue
+        bit: Optional[int] = None
+        if group == pyads.INDEXGROUP_MEMORYBIT:
+            group = pyads.INDEXGROUP_MEMORYBYTE
+            offset, bit = divmod(offset, 8)
+            size = 1
+        else:
+            size = data_size(datatype)
+        ranges.append((group, offset, size, i, datatype, bit))
+    ranges.sort(key=lambda r: (r[0], r[1]))
+
+    blocks: List[Block] = []
+    for group, offset, size, i, datatype, bit in ranges:
+        if blocks:
+            block = blocks[-1]
+            end = max(offset + size, block.start + block.length)
+            if (
+                block.index_group == group
+                and group != ADSIGRP_SYM_VALBYHND
+                and offset - (block.start + block.length) <= max_gap
+                and end - block.start <= max_block_size
+            ):
+                block.slots.append(Slot(i, offset - block.start, datatype, bit))
+                blocks[-1] = block._replace(length=end - block.start)
+                continue
+        blocks.append(Block(group, offset, size, [Slot(i, 0, datatype, bit)]))
+    return blocks
+
+
+def decode_slot(slot: Slot, buffer: memoryview) -> VALUE_TYPE:
+    """Decode the value of a slot from the buffer of its block.
+
+    :param Slot slot: position of the value
+    :param memoryview buffer: data of the block
+
+    """
+    if slot.bit is not None:
+        return bool(buffer[slot.offset] & (1 << slot.bit))
+    return get_codec(slot.datatype).decode(buffer, slot.offset)
+
+
+def read_blocks(
+    adr: pyads.AmsAddr, blocks: Sequence[Block], count: int
+) -> List[Tuple[int, VALUE_TYPE]]:
+    """Read the planned blocks and decode the values of all items.
+
+    The blocks are read with ADS sum read requests.
+
+    :param pyads.AmsAddr adr: address of the ADS device
+    :param blocks: blocks returned by :py:func:`plan_blocks`
+    :param int count: number of planned items
+    :return: list of (error code, value) tuples in the order of the items,
+        items without a block get
+        :py:data:`qthmi.ads.quality.ERR_SYMBOL_NOT_FOUND`
+
+    """
+    result: List[Tuple[int, VALUE_TYPE]] = [(ERR_SYMBOL_NOT_FOUND, None)] * count
+    for start in range(0, len(blocks), MAX_SUM_REQUESTS):
+        chunk = blocks[start:start + MAX_SUM_REQUESTS]
+        responses = sum_read(
+            adr, [(b.index_group, b.start, b.length) for b in chunk]
+        )
+        for block, (err, buffer) in zip(chunk, responses):
+            for slot in block.slots:
+                result[slot.item] = (
+                    (err, None) if err else (0, decode_slot(slot, buffer))
+                )
+    return result
+
+
+class ADSBlockReadGroup(ADSPollGroup):
+    """Collection of mappers that are read in coalesced blocks.
+
+    Like :py:class:`qthmi.ads.batch.ADSPollGroup` but the addresses of the
+    mappers are merged into blocks of contiguous memory by
+    :py:func:`plan_blocks`. The plan is created on the first read and
+    renewed whenever mappers are added or removed or symbol names are
+    resolved. Mappers whose symbol name has not been resolved yet are not
+    read, they are marked bad with
+    :py:data:`qthmi.ads.quality.ERR_SYMBOL_NOT_FOUND`.
+
+    :param mappers: mappers belonging to the group
+    :param int max_gap: maximum number of unused bytes between two merged
+        addresses
+    :param int max_block_size: maximum size of a block in bytes
+    :param dispatcher: :py:class:`qthmi.ads.dispatch.GuiDispatcher`
+        showing the values in batches, None to show them immediately
+
+    """
+
+    def __init__(
+        self,
+        mappers: Iterable[ADSMapper] = (),
+        max_gap: int = MAX_GAP,
+        max_block_size: int = MAX_BLOCK_SIZE,
+        dispatcher: Any = None,
+    ) -> None:
+        super(ADSBlockReadGroup, self).__init__(mappers, dispatcher=dispatcher)
+        self.max_gap = max_gap
+        self.max_block_size = max_block_size
+        self._blocks: Optional[List[Block]] = None
+        self._generation = ADSMapper.addressGeneration
+
+    @property
+    def blocks(self) -> List[Block]:
+        """Blocks planned for the current mappers."""
+        if (
+            self._blocks is None
+            or self._generation != ADSMapper.addressGeneration
+        ):
+            self._generation = ADSMapper.addressGeneration
+            self._blocks = plan_blocks(
+                [(m.indexGroup, m.plcAdr, m.plcDataType) for m in self.mappers],
+                self.max_gap,
+                self.max_block_size,
+            )
+        return self._blocks
+
+    def add(self, mapper: ADSMapper) -> None:
+        super(ADSBlockReadGroup, self).add(mapper)
+        self._blocks = None
+
+    def remove(self, mapper: ADSMapper) -> None:
+        super(ADSBlockReadGroup, self).remove(mapper)
+        self._blocks = None
+
+    def fetch(self, adsAdr: pyads.AmsAddr) -> List[Tuple[int, VALUE_TYPE]]:
+        """Read the values of all mappers in blocks without showing them.
+
+        :param pyads.AmsAddr adsAdr: address to the ADS device
+        :return: list of (error code, value) tuples in the order of the mappers
+
+        """
+        try:
+            results = read_blocks(adsAdr, self.blocks, len(self.mappers))
+        except ADSError as e:
+            raise ConnectionError(
+                "Block reading %i mappers (ErrorCode %i)" %
+                (len(self.mappers), e.err_code)
+            )
+        self.fetched = time.time()
+        return results
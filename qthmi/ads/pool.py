@@ -0,0 +1,244 @@
+"""Pool of connections to several ADS devices.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+An HMI for a production line talks to many plcs. The
+:py:class:`ADSConnectionPool` keeps one :py:class:`ADSConnector` per target,
+all of them sharing the port to the ADS router. The poll groups of all
+targets are read in parallel worker threads with a private port each, so a
+slow plc does not hold up the refresh of the others.
+
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional, Tuple
+
+import pyads
+from . import metrics
+from .batch import ADSPollGroup
+from .connector import ADSConnector
+from .gui import VALUE_TYPE
+from .metrics import target_key
+from .ports import PrivatePorts
+
+
+class TargetStats:
+    """Request statistics of an ADS device.
+
+    :ivar int requests: number of requests
+    :ivar int errors: number of failed requests
+    :ivar float total_time: accumulated duration of all requests in seconds
+    :ivar float max_time: duration of the slowest request in seconds
+    :ivar float last_time: duration of the last request in seconds
+    :ivar str last_error: message of the last error
+
+    """
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_time = 0.0
+        self.last_error = ""
+
+    @property
+    def mean_time(self) -> float:
+        """Mean duration of the requests in seconds."""
+        return self.total_time / self.requests if self.requests else 0.0
+
+    def record(self, duration: float, error: Exception = None) -> None:
+        """Add a request to the statistics.
+
+        :param float duration: duration of the request in seconds
+        :param Exception error: error raised by the request
+
+        """
+        self.requests += 1
+        self.total_time += duration
+        self.last_time = duration
+        self.max_time = max(self.max_time, duration)
+        if error is not None:
+            self.errors += 1
+            self.last_error = str(error)
+
+    def __repr__(self) -> str:
+        return "<TargetStats requests=%i errors=%i mean=%.1fms max=%.1fms>" % (
+            self.requests, self.errors, self.mean_time * 1e3, self.max_time * 1e3
+        )
+
+
+class ADSConnectionPool:
+    """Connectors and poll groups for several ADS devices.
+
+    :param int max_workers: maximum number of targets polled in parallel,
+        by default one thread per target, the threads are added when targets
+        are added
+
+    Sample code::
+
+    >>> pool = ADSConnectionPool()
+    >>> for adr, mappers in lines:
+    >>>     pool.add_group(adr, ADSPollGroup(mappers))
+    >>> timer.timeout.connect(lambda: pool.poll(timeout=0.05))
+    >>> ...
+    >>> pool.close()
+
+    """
+
+    def __init__(self, max_workers: int = None) -> None:
+        self.max_workers = max_workers
+        self.stats: Dict[str, TargetStats] = {}
+
+        self._connectors: Dict[str, ADSConnector] = {}
+        self._groups: List[Tuple[str, ADSPollGroup]] = []
+        self._pending: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._workers = 0
+        self._retired: List[ThreadPoolExecutor] = []
+        self._ports = PrivatePorts()
+
+    def __enter__(self) -> "ADSConnectionPool":
+        return self
+
+    def __exit__(self, exc_type: object, exc_value: object, tb: object) -> None:
+        self.close()
+
+    def connector(
+        self, adr: pyads.AmsAddr, ip_address: str = None
+    ) -> ADSConnector:
+        """Return the connector of an ADS device, create it if necessary.
+
+        :param pyads.AmsAddr adr: address of the ADS device
+        :param str ip_address: ip address of the ADS device, if given a route
+            to the device is added to the ADS router (Linux only)
+
+        """
+        key = target_key(adr)
+        with self._lock:
+            connector = self._connectors.get(key)
+            if connector is None:
+                connector = ADSConnector(pyads.AmsAddr(adr.netid), adr.port)
+                if ip_address is not None:
+                    pyads.add_route(connector.ams_addr, ip_address)
+                self._connectors[key] = connector
+                self.stats[key] = TargetStats()
+        return connector
+
+    @property
+    def connectors(self) -> List[ADSConnector]:
+        """Connectors of all targets."""
+        return list(self._connectors.values())
+
+    def add_group(
+        self, adr: pyads.AmsAddr, group: ADSPollGroup, ip_address: str = None
+    ) -> None:
+        """Add a poll group for an ADS device.
+
+        :param pyads.AmsAddr adr: address of the ADS device
+        :param ADSPollGroup group: mappers of the ADS device
+        :param str ip_address: ip address of the ADS device (Linux only)
+
+        """
+        self.connector(adr, ip_address)
+        self._groups.append((target_key(adr), group))
+
+    def remove_group(self, group: ADSPollGroup) -> None:
+        """Remove a poll group.
+
+        :param ADSPollGroup group: group to remove
+
+        """
+        self._groups = [(k, g) for k, g in self._groups if g is not group]
+        self._pending.pop(id(group), None)
+
+    def poll(self, timeout: float = None) -> Dict[str, Exception]:
+        """Read all poll groups in parallel and show the values.
+
+        The groups are read in worker threads, the values are shown in the
+        calling thread. A group whose last read has not finished yet is not
+        read again. If the read of a target does not finish within
+        *timeout* it is shown on one of the next calls, so slow targets do
+        not delay the others. The mappers of a failed read are marked bad.
+
+        :param float timeout: maximum time in seconds to wait for the
+            targets, None waits for all of them
+        :return: dictionary of errors with the target key as key
+
+        """
+        workers = self.max_workers or max(len(self._connectors), 1)
+        if self._executor is None or workers > self._workers:
+            if self._executor is not None:
+                # the pending reads finish on the threads of the old executor
+                self._executor.shutdown(wait=False)
+                self._retired.append(self._executor)
+            self._executor = ThreadPoolExecutor(
+                workers,
+                thread_name_prefix="ADSConnectionPool",
+                initializer=self._ports.open,
+            )
+            self._workers = workers
+
+        for key, group in self._groups:
+            if id(group) not in self._pending:
+                self._pending[id(group)] = self._executor.submit(
+                    self._fetch, key, group
+                )
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        errors: Dict[str, Exception] = {}
+        for key, group in self._groups:
+            future = self._pending[id(group)]
+            remaining = (
+                None if deadline is None
+                else max(deadline - time.monotonic(), 0.0)
+            )
+            try:
+                results = future.result(remaining)
+            except FutureTimeoutError:
+                continue
+            except Exception as e:
+                errors[key] = e
+                del self._pending[id(group)]
+                group.mark_bad()
+                continue
+
+            del self._pending[id(group)]
+            try:
+                group.dispatch(results)
+            except Exception as e:
+                errors[key] = e
+        return errors
+
+    def _fetch(
+        self, key: str, group: ADSPollGroup
+    ) -> List[Tuple[int, VALUE_TYPE]]:
+        start = time.perf_counter()
+        try:
+            connector = self._connectors[key]
+            with metrics.cycle(key):
+                results = connector.breaker.call(group.fetch, connector.ams_addr)
+        except Exception as e:
+            with self._lock:
+                self.stats[key].record(time.perf_counter() - start, e)
+            raise
+        with self._lock:
+            self.stats[key].record(time.perf_counter() - start)
+        return results
+
+    def close(self) -> None:
+        """Stop the worker threads and close all connectors."""
+        if self._executor is not None:
+            for executor in self._retired + [self._executor]:
+                executor.shutdown(wait=True)
+            self._executor = None
+            self._retired = []
+            self._ports.close()
+        self._pending.clear()
+        with self._lock:
+            for connector in self._connectors.values():
+                connector.close()
+            self._connectors.clear()
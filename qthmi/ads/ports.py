@@ -0,0 +1,235 @@
+"""Ports to the ADS router.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+The ADS router accepts only one pending request per port. All connectors of
+the gui thread share one port opened by :py:func:`open_port`. Threads sending
+requests concurrently, like the workers of
+:py:class:`qthmi.ads.pool.ADSConnectionPool`, use a private port each, see
+:py:class:`PrivatePorts`.
+
+The raw requests of this package are sent by :py:func:`ads_read`,
+:py:func:`ads_write`, :py:func:`ads_read_write` and
+:py:func:`ads_read_state`, which use the private
+port of the current thread if there is one and the shared port otherwise.
+Failed requests raise :py:data:`ADSError`.
+
+Device notifications are registered by index group and offset with
+:py:func:`add_device_notification`, pyads 2.2 only registers them by
+symbol name.
+
+"""
+import ctypes
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pyads
+from pyads import pyads_ex
+from pyads.structs import SAdsNotificationAttrib, SAdsNotificationHeader, SAmsAddr
+from pyads.utils import platform_is_windows
+
+try:
+    #: error raised by failed requests of pyads
+    ADSError = pyads.ADSError
+except AttributeError:
+    # pyads 2.2 does not export the error class
+    from pyads.pyads import ADSError  # noqa: F401
+
+
+#: ctypes type of the notification callbacks of the ADS library
+NOTIFICATION_CALLBACK = pyads_ex.LNOTEFUNC or (
+    ctypes.WINFUNCTYPE if platform_is_windows() else ctypes.CFUNCTYPE
+)(
+    None, ctypes.POINTER(SAmsAddr), ctypes.POINTER(SAdsNotificationHeader),
+    ctypes.c_ulong,
+)
+
+
+_port_lock = threading.Lock()
+_port_users = 0
+_thread = threading.local()
+
+# ctypes callbacks of the registered notifications, they must stay alive,
+# key is (port, AMS net id, AMS port, notification handle)
+_callbacks: Dict[Tuple[int, str, int, int], Any] = {}
+
+
+def open_port() -> int:
+    """Open the port to the ADS router shared by all connectors.
+
+    The port is opened by the first call, following calls only increase the
+    number of users.
+
+    :return: port number
+
+    """
+    global _port_users
+    with _port_lock:
+        port = pyads.open_port()
+        _port_users += 1
+    return port
+
+
+def close_port() -> None:
+    """Release the shared port, it is closed when the last user releases it."""
+    global _port_users
+    with _port_lock:
+        if _port_users == 0:
+            return
+        _port_users -= 1
+        if _port_users == 0:
+            pyads.close_port()
+
+
+def thread_port() -> Optional[int]:
+    """Return the private port of the current thread, None if it has none."""
+    return getattr(_thread, "port", None)
+
+
+class PrivatePorts:
+    """Private ports of a group of threads.
+
+    Pass :py:meth:`open` as initializer of a ``ThreadPoolExecutor`` and call
+    :py:meth:`close` after the executor has been shut down.
+
+    Sample code::
+
+    >>> ports = PrivatePorts()
+    >>> executor = ThreadPoolExecutor(4, initializer=ports.open)
+    >>> ...
+    >>> executor.shutdown()
+    >>> ports.close()
+
+    """
+
+    def __init__(self) -> None:
+        self._ports: List[int] = []
+        self._lock = threading.Lock()
+
+    def open(self) -> None:
+        """Open a private port for the current thread."""
+        port = pyads_ex.adsPortOpenEx()
+        _thread.port = port
+        with self._lock:
+            self._ports.append(port)
+
+    def close(self) -> None:
+        """Close all ports opened by :py:meth:`open`."""
+        with self._lock:
+            ports, self._ports = self._ports, []
+        for port in ports:
+            pyads_ex.adsPortCloseEx(port)
+
+
+def ads_read(
+    adr: pyads.AmsAddr, index_group: int, offset: int, datatype: Any
+) -> Any:
+    """Read data like ``pyads.read`` using the port of the current thread."""
+    port = thread_port()
+    if port is None:
+        return pyads.read(adr, index_group, offset, datatype)
+    return pyads_ex.adsSyncReadReqEx2(port, adr, index_group, offset, datatype)
+
+
+def ads_write(
+    adr: pyads.AmsAddr, index_group: int, offset: int, value: Any, datatype: Any
+) -> None:
+    """Write data like ``pyads.write`` using the port of the current thread."""
+    port = thread_port()
+    if port is None:
+        pyads.write(adr, index_group, offset, value, datatype)
+    else:
+        pyads_ex.adsSyncWriteReqEx(port, adr, index_group, offset, value, datatype)
+
+
+def ads_read_write(
+    adr: pyads.AmsAddr,
+    index_group: int,
+    offset: int,
+    read_datatype: Any,
+    value: Any,
+    write_datatype: Any,
+) -> Any:
+    """Write and read data like ``pyads.read_write`` using the port of the
+    current thread."""
+    port = thread_port()
+    if port is None:
+        return pyads.read_write(
+            adr, index_group, offset, read_datatype, value, write_datatype
+        )
+    return pyads_ex.adsSyncReadWriteReqEx2(
+        port, adr, index_group, offset, read_datatype, value, write_datatype
+    )
+
+
+def ads_read_state(adr: pyads.AmsAddr) -> Tuple[int, int]:
+    """Read the ADS and device state like ``pyads.read_state`` using the port
+    of the current thread."""
+    port = thread_port()
+    if port is None:
+        return pyads.read_state(adr)
+    return pyads_ex.adsSyncReadStateReqEx(port, adr)
+
+
+def add_device_notification(
+    port: int,
+    adr: pyads.AmsAddr,
+    index_group: int,
+    offset: int,
+    attrib: pyads.NotificationAttrib,
+    callback: Callable[[Any], None],
+) -> int:
+    """Register a device notification on a plc address.
+
+    The callback is called in a thread of the ADS router with a pointer to
+    the ``SAdsNotificationHeader`` of the sample.
+
+    :param int port: port to the ADS router
+    :param pyads.AmsAddr adr: address of the ADS device
+    :param int index_group: index group of the plc address
+    :param int offset: index offset of the plc address
+    :param pyads.NotificationAttrib attrib: attributes of the notification
+    :param callback: function taking the notification header
+    :return: notification handle
+    :raises ADSError: if the device refused the notification
+
+    """
+    function = pyads_ex._adsDLL.AdsSyncAddDeviceNotificationReqEx
+    function.argtypes = [
+        ctypes.c_ulong, ctypes.POINTER(SAmsAddr), ctypes.c_ulong, ctypes.c_ulong,
+        ctypes.POINTER(SAdsNotificationAttrib), NOTIFICATION_CALLBACK,
+        ctypes.c_ulong, ctypes.POINTER(ctypes.c_ulong),
+    ]
+    function.restype = ctypes.c_long
+
+    c_callback = NOTIFICATION_CALLBACK(
+        lambda address, notification, user: callback(notification)
+    )
+    handle = ctypes.c_ulong()
+    err_code = function(
+        port, ctypes.pointer(adr.amsAddrStruct()), index_group, offset,
+        ctypes.byref(attrib.notificationAttribStruct()), c_callback, 0,
+        ctypes.byref(handle),
+    )
+    if err_code:
+        raise ADSError(err_code)
+    _callbacks[(port, adr.netid, adr.port, handle.value)] = c_callback
+    return handle.value
+
+
+def del_device_notification(port: int, adr: pyads.AmsAddr, handle: int) -> None:
+    """Delete a notification registered by :py:func:`add_device_notification`.
+
+    :param int port: port to the ADS router
+    :param pyads.AmsAddr adr: address of the ADS device
+    :param int handle: notification handle
+    :raises ADSError: if the device could not delete the notification
+
+    """
+    function = pyads_ex._adsDLL.AdsSyncDelDeviceNotificationReqEx
+    err_code = function(
+        port, ctypes.pointer(adr.amsAddrStruct()), ctypes.c_ulong(handle)
+    )
+    _callbacks.pop((port, adr.netid, adr.port, handle), None)
+    if err_code:
+        raise ADSError(err_code)
@@ -0,0 +1,84 @@
+"""Quality and timestamp of plc values.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+A value read from the plc is only meaningful together with the time it was
+sampled and whether it could be read at all. Every mapper keeps a
+:py:class:`Sample` of its current value. A tag whose read failed inside a
+sum read or notification is marked bad and keeps its last value, the other
+tags of the request are updated normally and no error is raised through the
+poll loop. Widgets show bad or stale values by implementing
+``mapQualityToGui`` of the mapper.
+
+The quality codes follow the major quality bits of OPC.
+
+"""
+import time
+from typing import Any, NamedTuple, Optional
+
+
+#: quality of a value that has been read successfully
+QUALITY_GOOD = 0xC0
+#: quality of a value that has not been read yet, or is older than expected
+QUALITY_UNCERTAIN = 0x40
+#: quality of a value that could not be read, the value is the last good one
+QUALITY_BAD = 0x00
+
+#: ADS error code of a value whose data does not match the datatype
+ERR_INVALID_SIZE = 0x705
+#: ADS error code of a symbol name that has not been resolved
+ERR_SYMBOL_NOT_FOUND = 0x710
+
+#: difference between the FILETIME epoch 1601 and the unix epoch in 100 ns
+_FILETIME_EPOCH = 116444736000000000
+
+
+def filetime_to_timestamp(filetime: int) -> float:
+    """Convert a Windows FILETIME, e.g. of a notification, to ``time.time``.
+
+    :param int filetime: 100 ns intervals since 1601-01-01 UTC
+
+    """
+    return (filetime - _FILETIME_EPOCH) / 1e7
+
+
+class Sample(NamedTuple):
+    """Value of a tag with its source timestamp and quality.
+
+    :ivar value: last value read, None if never read
+    :ivar float timestamp: time the value has been sampled, ``time.time``,
+        None if never read
+    :ivar int quality: quality code, see :py:data:`QUALITY_GOOD`
+    :ivar int error: ADS error code of the last failed read, 0 if the read
+        succeeded or the error is unknown
+
+    """
+
+    value: Any = None
+    timestamp: Optional[float] = None
+    quality: int = QUALITY_UNCERTAIN
+    error: int = 0
+
+    @property
+    def good(self) -> bool:
+        """True if the value has been read successfully."""
+        return self.quality == QUALITY_GOOD
+
+    def age(self, now: float = None) -> float:
+        """Return the age of the value in seconds, infinite if never read.
+
+        :param float now: current time, ``time.time``, by default now
+
+        """
+        if self.timestamp is None:
+            return float("inf")
+        return (time.time() if now is None else now) - self.timestamp
+
+    def stale(self, max_age: float, now: float = None) -> bool:
+        """Return True if the value is older than *max_age* seconds.
+
+        :param float max_age: maximum age in seconds, e.g. a few scan periods
+        :param float now: current time, ``time.time``, by default now
+
+        """
+        return self.age(now) > max_age
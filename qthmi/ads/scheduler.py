@@ -0,0 +1,380 @@
+"""Cyclic polling of mappers in scan classes of different periods.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+Alarm bits and axis positions need a fast refresh, configuration values
+hardly ever change. The :py:class:`PollScheduler` assigns every mapper to a
+scan class with its own period and reads the mappers of a class with one
+batched request per cycle. Scan classes whose gui objects are all hidden are
+skipped, mappers without gui objects, e.g. recorded by a trend recorder, are
+always read.
+
+For every scan class the jitter of the cycle start and the number of
+overruns, cycles taking longer than the period, are recorded in
+:py:class:`ScanStats`.
+
+"""
+import time
+from typing import Any, Dict, List, Optional
+
+import pyads
+from PyQt5.QtCore import QObject, Qt, QTimer, pyqtSignal
+from qthmi.main.connector import ConnectionError
+from . import metrics
+from .batch import ADSPollGroup
+from .breaker import CircuitBreaker
+from .gui import ADSMapper
+
+
+#: default scan classes, name and period in seconds
+SCAN_CLASSES = {"fast": 0.02, "normal": 0.2, "slow": 2.0}
+
+
+def is_visible(mapper: ADSMapper) -> bool:
+    """Check if at least one gui object of a mapper is visible.
+
+    Gui objects without ``isVisible`` method and mappers without gui objects
+    are regarded as visible.
+
+    :param ADSMapper mapper: mapper to check
+
+    """
+    objects = mapper.guiObjects
+    if not isinstance(objects, (list, tuple)):
+        objects = [objects]
+    if not objects:
+        return True
+    return any(getattr(o, "isVisible", lambda: True)() for o in objects)
+
+
+class ScanStats:
+    """Timing statistics of a scan class.
+
+    The jitter is the deviation of the time between two cycle starts from
+    the period.
+
+    :ivar int cycles: number of executed cycles
+    :ivar int overruns: number of cycles taking longer than the period
+    :ivar int skipped: number of cycles skipped because the scan class was
+        paused or all its gui objects were hidden
+    :ivar int errors: number of failed cycles
+    :ivar float last_duration: duration of the last cycle in seconds
+    :ivar float max_duration: duration of the slowest cycle in seconds
+    :ivar float last_jitter: jitter of the last cycle in seconds
+    :ivar float max_jitter: largest absolute jitter in seconds
+
+    """
+
+    def __init__(self) -> None:
+        self.cycles = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.errors = 0
+        self.total_duration = 0.0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.total_jitter = 0.0
+        self.last_jitter = 0.0
+        self.max_jitter = 0.0
+        self._jitter_samples = 0
+
+    @property
+    def mean_duration(self) -> float:
+        """Mean duration of the cycles in seconds."""
+        return self.total_duration / self.cycles if self.cycles else 0.0
+
+    @property
+    def mean_jitter(self) -> float:
+        """Mean absolute jitter in seconds."""
+        return (
+            self.total_jitter / self._jitter_samples
+            if self._jitter_samples else 0.0
+        )
+
+    def record(
+        self, duration: float, interval: Optional[float], period: float
+    ) -> bool:
+        """Add a cycle to the statistics.
+
+        :param float duration: duration of the cycle in seconds
+        :param float interval: time since the start of the previous cycle in
+            seconds, None for the first cycle
+        :param float period: period of the scan class in seconds
+        :return: True if the cycle was an overrun
+
+        """
+        self.cycles += 1
+        self.total_duration += duration
+        self.last_duration = duration
+        self.max_duration = max(self.max_duration, duration)
+        if interval is not None:
+            self.last_jitter = interval - period
+            self.total_jitter += abs(self.last_jitter)
+            self.max_jitter = max(self.max_jitter, abs(self.last_jitter))
+            self._jitter_samples += 1
+        if duration > period:
+            self.overruns += 1
+            return True
+        return False
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the statistics as dictionary, times in seconds."""
+        return {
+            "cycles": self.cycles,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "mean_duration": self.mean_duration,
+            "max_duration": self.max_duration,
+            "mean_jitter": self.mean_jitter,
+            "max_jitter": self.max_jitter,
+        }
+
+    def __repr__(self) -> str:
+        return (
+            "<ScanStats cycles=%i overruns=%i skipped=%i mean=%.1fms "
+            "jitter=%.1fms>" % (
+                self.cycles, self.overruns, self.skipped,
+                self.mean_duration * 1e3, self.mean_jitter * 1e3,
+            )
+        )
+
+
+class ScanClass:
+    """Mappers that are read with the same period.
+
+    :param str name: name of the scan class
+    :param float period: period in seconds
+
+    :ivar ADSPollGroup group: mappers of the scan class
+    :ivar ScanStats stats: timing statistics
+    :ivar bool paused: True if the scan class is paused manually
+
+    """
+
+    def __init__(self, name: str, period: float) -> None:
+        self.name = name
+        self.period = period
+        self.group = ADSPollGroup()
+        self.stats = ScanStats()
+        self.paused = False
+        self.timer: Optional[QTimer] = None
+        self._last_start: Optional[float] = None
+
+    def __repr__(self) -> str:
+        return "<ScanClass %s period=%.3fs mappers=%i>" % (
+            self.name, self.period, len(self.group.mappers)
+        )
+
+
+class PollScheduler(QObject):
+    """Read mappers cyclically in scan classes of different periods.
+
+    Every scan class has its own timer. On each tick the mappers of the
+    class are read with one batched request, see
+    :py:class:`qthmi.ads.batch.ADSPollGroup`. If ``pause_hidden`` is set,
+    only mappers with a visible gui object are read and a scan class without
+    any is skipped.
+
+    :param pyads.AmsAddr adsAdr: address to the ADS device
+    :param dict classes: scan classes with name and period in seconds,
+        :py:data:`SCAN_CLASSES` by default
+    :param bool pause_hidden: skip mappers whose gui objects are hidden
+    :param dispatcher: :py:class:`qthmi.ads.dispatch.GuiDispatcher`
+        showing the values of all scan classes in batches, None to show them
+        immediately
+    :param breaker: :py:class:`qthmi.ads.breaker.CircuitBreaker` the cycles
+        are sent through, e.g. the breaker of the connector, None to send
+        them directly. Cycles rejected by an open breaker count as errors.
+    :param QObject parent: parent object
+
+    Sample code::
+
+    >>> scheduler = PollScheduler(adsAdr, breaker=connector.breaker)
+    >>> scheduler.add(alarmMapper, "fast")
+    >>> scheduler.add(recipeMapper, "slow")
+    >>> scheduler.error.connect(statusBar.showMessage)
+    >>> scheduler.start()
+    >>> ...
+    >>> print(scheduler.stats())
+
+    """
+
+    #: name of the scan class, message
+    error = pyqtSignal(str, str)
+
+    #: name of the scan class, duration of the cycle in seconds
+    overrun = pyqtSignal(str, float)
+
+    def __init__(
+        self,
+        adsAdr: pyads.AmsAddr,
+        classes: Dict[str, float] = None,
+        pause_hidden: bool = True,
+        dispatcher: Any = None,
+        breaker: Optional[CircuitBreaker] = None,
+        parent: QObject = None,
+    ) -> None:
+        super(PollScheduler, self).__init__(parent)
+        self.adsAdr = adsAdr
+        self.pause_hidden = pause_hidden
+        self.dispatcher = dispatcher
+        self.breaker = breaker
+        self.classes: Dict[str, ScanClass] = {}
+        self._running = False
+        # scan class of every mapper
+        self._scan_classes: Dict[ADSMapper, ScanClass] = {}
+
+        for name, period in (classes or SCAN_CLASSES).items():
+            self.add_class(name, period)
+
+    def add_class(self, name: str, period: float) -> ScanClass:
+        """Add a scan class.
+
+        :param str name: name of the scan class
+        :param float period: period in seconds
+
+        """
+        scan_class = ScanClass(name, period)
+        scan_class.group.dispatcher = self.dispatcher
+        self.classes[name] = scan_class
+        if self._running:
+            self._start_timer(scan_class)
+        return scan_class
+
+    def add(self, mapper: ADSMapper, scan_class: str = "normal") -> None:
+        """Add a mapper to a scan class.
+
+        A mapper belongs to one scan class only, it is removed from its
+        previous scan class.
+
+        :param ADSMapper mapper: mapper to add
+        :param str scan_class: name of the scan class
+
+        """
+        target = self.classes[scan_class]
+        self.remove(mapper)
+        target.group.add(mapper)
+        self._scan_classes[mapper] = target
+
+    def remove(self, mapper: ADSMapper) -> None:
+        """Remove a mapper from its scan class.
+
+        :param ADSMapper mapper: mapper to remove
+
+        """
+        scan_class = self._scan_classes.pop(mapper, None)
+        if scan_class is not None:
+            scan_class.group.remove(mapper)
+
+    def pause(self, scan_class: str) -> None:
+        """Pause reading a scan class.
+
+        :param str scan_class: name of the scan class
+
+        """
+        self.classes[scan_class].paused = True
+
+    def resume(self, scan_class: str) -> None:
+        """Resume reading a paused scan class.
+
+        :param str scan_class: name of the scan class
+
+        """
+        self.classes[scan_class].paused = False
+
+    def start(self) -> None:
+        """Start the timers of all scan classes."""
+        self._running = True
+        for scan_class in self.classes.values():
+            self._start_timer(scan_class)
+
+    def stop(self) -> None:
+        """Stop the timers of all scan classes."""
+        self._running = False
+        for scan_class in self.classes.values():
+            if scan_class.timer is not None:
+                scan_class.timer.stop()
+                scan_class.timer = None
+            scan_class._last_start = None
+
+    def tick(self, name: str) -> None:
+        """Run one cycle of a scan class.
+
+        Called by the timer of the scan class, may be called directly to
+        refresh a scan class immediately.
+
+        :param str name: name of the scan class
+
+        """
+        scan_class = self.classes[name]
+        stats = scan_class.stats
+        start = time.monotonic()
+        interval = (
+            None if scan_class._last_start is None
+            else start - scan_class._last_start
+        )
+        scan_class._last_start = start
+
+        group = scan_class.group
+        if self.pause_hidden:
+            mappers = [m for m in group.mappers if is_visible(m)]
+            if len(mappers) != len(group.mappers):
+                group = ADSPollGroup(
+                    mappers, group.max_requests, group.dispatcher
+                )
+        if scan_class.paused or not group.mappers:
+            stats.skipped += 1
+            return
+
+        try:
+            with metrics.cycle(name):
+                if self.breaker is None:
+                    group.read(self.adsAdr)
+                else:
+                    self.breaker.call(group.read, self.adsAdr)
+        except ConnectionError as e:
+            stats.errors += 1
+            group.mark_bad()
+            self.error.emit(name, str(e))
+        else:
+            # single mappers that could not be read have been marked bad
+            if group.failed:
+                mapper, err = group.failed[0]
+                self.error.emit(
+                    name, "Reading %i mappers failed, address %i (ErrorCode %i)"
+                    % (len(group.failed), mapper.plcAdr, err)
+                )
+
+        duration = time.monotonic() - start
+        if stats.record(duration, interval, scan_class.period):
+            self.overrun.emit(name, duration)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return the statistics of all scan classes.
+
+        :return: dictionary with the name of the scan class as key and the
+            statistics as dictionary, see :py:meth:`ScanStats.as_dict`
+
+        """
+        return {
+            name: scan_class.stats.as_dict()
+            for name, scan_class in self.classes.items()
+        }
+
+    def mappers(self, scan_class: str) -> List[ADSMapper]:
+        """Return the mappers of a scan class.
+
+        :param str scan_class: name of the scan class
+
+        """
+        return list(self.classes[scan_class].group.mappers)
+
+    def _start_timer(self, scan_class: ScanClass) -> None:
+        if scan_class.timer is not None:
+            return
+        timer = QTimer(self)
+        timer.setTimerType(Qt.PreciseTimer)
+        timer.timeout.connect(lambda: self.tick(scan_class.name))
+        timer.start(max(int(scan_class.period * 1000), 1))
+        scan_class.timer = timer
@@ -0,0 +1,190 @@
+"""Subscription of mappers depending on the visibility of their widgets.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+Most widgets of a large HMI are on hidden tabs or minimized windows. The
+:py:class:`SubscriptionManager` watches the show and hide events of the gui
+objects of its mappers. A mapper is polled in its scan class while at least
+one of its gui objects is visible. When all of them are hidden it is moved
+to a slow background scan class or removed from the scheduler.
+
+Unlike the ``pause_hidden`` option of :py:class:`PollScheduler`, which checks
+the visibility of every mapper in every cycle, the manager only acts on
+show and hide events. A destroyed gui object releases its mappers like a
+hidden one.
+
+"""
+from typing import Dict, List, Set
+
+from PyQt5 import sip
+from PyQt5.QtCore import QEvent, QObject, pyqtSignal
+from .gui import ADSMapper
+from .scheduler import PollScheduler
+
+
+def _address(obj: QObject) -> int:
+    """Return the address of the C++ object, the same for all its wrappers."""
+    return sip.unwrapinstance(obj)  # type: ignore
+
+
+class SubscriptionManager(QObject):
+    """Subscribe mappers while their gui objects are visible.
+
+    Every visible gui object holds a reference on its mappers, a mapper is
+    subscribed while it has at least one reference. Gui objects without
+    ``installEventFilter`` method are regarded as always visible.
+
+    :param PollScheduler scheduler: scheduler polling the mappers, it should
+        be created with ``pause_hidden=False``
+    :param str hidden_class: scan class of mappers whose gui objects are all
+        hidden, None to stop polling them
+    :param QObject parent: parent object
+
+    :ivar int subscriptions: number of subscribed mappers
+
+    Sample code::
+
+    >>> scheduler = PollScheduler(adsAdr, pause_hidden=False)
+    >>> manager = SubscriptionManager(scheduler, hidden_class="slow")
+    >>> manager.add(speedMapper, "fast")
+    >>> manager.subscribed.connect(lambda m: cache.attach(m, adsAdr))
+    >>> manager.unsubscribed.connect(lambda m: cache.detach(m, adsAdr))
+
+    """
+
+    #: emitted with the mapper when it is subscribed
+    subscribed = pyqtSignal(object)
+    #: emitted with the mapper when it is unsubscribed
+    unsubscribed = pyqtSignal(object)
+
+    def __init__(
+        self,
+        scheduler: PollScheduler,
+        hidden_class: str = None,
+        parent: QObject = None,
+    ) -> None:
+        super(SubscriptionManager, self).__init__(parent)
+        self.scheduler = scheduler
+        self.hidden_class = hidden_class
+        self.subscriptions = 0
+
+        self._classes: Dict[ADSMapper, str] = {}
+        self._objects: Dict[ADSMapper, List[QObject]] = {}
+        self._visible: Dict[ADSMapper, Set[int]] = {}
+        self._mappers: Dict[QObject, List[ADSMapper]] = {}
+        self._watched: Dict[int, QObject] = {}
+
+    @property
+    def mappers(self) -> List[ADSMapper]:
+        """All mappers of the manager."""
+        return list(self._classes)
+
+    def is_subscribed(self, mapper: ADSMapper) -> bool:
+        """Return True if at least one gui object of the mapper is visible.
+
+        :param ADSMapper mapper: mapper to check
+
+        """
+        return bool(self._visible.get(mapper))
+
+    def add(self, mapper: ADSMapper, scan_class: str = "normal") -> None:
+        """Add a mapper and subscribe it if one of its gui objects is visible.
+
+        :param ADSMapper mapper: mapper to add
+        :param str scan_class: scan class of the mapper while it is visible
+
+        """
+        if mapper in self._classes:
+            self.remove(mapper)
+        objects = mapper.guiObjects
+        if not isinstance(objects, (list, tuple)):
+            objects = [objects]
+
+        self._classes[mapper] = scan_class
+        self._objects[mapper] = list(objects)
+        self._visible[mapper] = set()
+        for o in objects:
+            if not hasattr(o, "installEventFilter"):
+                self._visible[mapper].add(id(o))
+                continue
+            mappers = self._mappers.setdefault(o, [])
+            if not mappers:
+                o.installEventFilter(self)
+                o.destroyed.connect(self._destroyed)
+                self._watched[_address(o)] = o
+            mappers.append(mapper)
+            if o.isVisible():
+                self._visible[mapper].add(id(o))
+
+        if self._visible[mapper]:
+            self._subscribe(mapper)
+        else:
+            self._unsubscribe(mapper)
+
+    def remove(self, mapper: ADSMapper) -> None:
+        """Remove a mapper and stop polling it.
+
+        :param ADSMapper mapper: mapper to remove
+
+        """
+        if mapper not in self._classes:
+            return
+        for o in self._objects.pop(mapper):
+            mappers = self._mappers.get(o)
+            if mappers is None:
+                continue
+            mappers.remove(mapper)
+            if not mappers:
+                del self._mappers[o]
+                o.removeEventFilter(self)
+                o.destroyed.disconnect(self._destroyed)
+                del self._watched[_address(o)]
+
+        if self._visible.pop(mapper):
+            self.subscriptions -= 1
+            self.unsubscribed.emit(mapper)
+        del self._classes[mapper]
+        self.scheduler.remove(mapper)
+
+    def eventFilter(self, obj: QObject, event: QEvent) -> bool:
+        kind = event.type()
+        if kind == QEvent.Show:
+            for mapper in self._mappers.get(obj, ()):
+                refs = self._visible[mapper]
+                first = not refs
+                refs.add(id(obj))
+                if first:
+                    self._subscribe(mapper)
+        elif kind == QEvent.Hide:
+            for mapper in self._mappers.get(obj, ()):
+                self._release(mapper, obj)
+        return False
+
+    def _destroyed(self, destroyed: QObject) -> None:
+        # destroyed is a new wrapper, look up the watched one by its address
+        obj = self._watched.pop(_address(destroyed), None)
+        if obj is None:
+            return
+        for mapper in self._mappers.pop(obj, ()):
+            self._objects[mapper].remove(obj)
+            self._release(mapper, obj)
+
+    def _release(self, mapper: ADSMapper, obj: QObject) -> None:
+        refs = self._visible[mapper]
+        if id(obj) in refs:
+            refs.discard(id(obj))
+            if not refs:
+                self.subscriptions -= 1
+                self.unsubscribed.emit(mapper)
+                self._unsubscribe(mapper)
+
+    def _subscribe(self, mapper: ADSMapper) -> None:
+        self.subscriptions += 1
+        self.scheduler.add(mapper, self._classes[mapper])
+        self.subscribed.emit(mapper)
+
+    def _unsubscribe(self, mapper: ADSMapper) -> None:
+        if self.hidden_class is None:
+            self.scheduler.remove(mapper)
+        else:
+            self.scheduler.add(mapper, self.hidden_class)
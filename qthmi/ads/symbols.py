@@ -0,0 +1,351 @@
+"""Symbol name addressing for ADS devices.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+The symbol and datatype tables of a TwinCAT plc are uploaded once and
+cached on disk. Symbol names like ``MAIN.fbAxis.fActPos`` are resolved to
+index group and offset locally, members of structures and function blocks
+by the offsets of the datatype table. Reading a symbol costs no more than
+reading a raw address and needs no handle lookup per call.
+
+Names the tables can not resolve, e.g. array elements or references, are
+accessed by variable handles kept in a :py:class:`HandlePool`.
+
+The cache is invalidated when the symbol version or the size of the symbol
+tables reported by the plc changes, e.g. after a download of a new project.
+
+"""
+import os
+import pickle
+import struct
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import pyads
+from pyads.constants import ADSIGRP_SYM_HNDBYNAME, ADSIGRP_SYM_RELEASEHND
+from .codecs import byte_buffer
+from .ports import ADSError, ads_read, ads_read_write, ads_write
+
+
+ADSIGRP_SYM_VERSION = 0xF008  #: symbol version, changes on project download
+ADSIGRP_SYM_UPLOAD = 0xF00B  #: symbol table
+ADSIGRP_SYM_UPLOADINFO = 0xF00C  #: number and size of symbols
+ADSIGRP_SYM_DT_UPLOAD = 0xF00E  #: datatype table
+ADSIGRP_SYM_UPLOADINFO2 = 0xF00F  #: number and size of symbols and datatypes
+
+#: version of the cache file format
+CACHE_FORMAT = 2
+
+#: default directory of the symbol table cache
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "qthmi.ads")
+
+_SYMBOL_ENTRY = struct.Struct("<6I3H")
+_DATATYPE_ENTRY = struct.Struct("<8I5H")
+
+
+class Symbol(NamedTuple):
+    """Entry of the symbol table."""
+
+    name: str
+    index_group: int
+    index_offset: int
+    size: int
+    type_name: str
+    comment: str
+
+
+def parse_symbols(data: bytes) -> Dict[str, Symbol]:
+    """Parse the symbol table uploaded from the plc.
+
+    :param bytes data: raw symbol table
+    :return: dictionary of symbols with the upper case name as key
+
+    """
+    symbols = {}
+    offset = 0
+    while offset < len(data):
+        (length, group, index, size, _, _,
+         name_len, type_len, comment_len) = _SYMBOL_ENTRY.unpack_from(data, offset)
+        if not length:
+            break
+        start = offset + _SYMBOL_ENTRY.size
+        name = data[start:start + name_len].decode("utf-8", "replace")
+        start += name_len + 1
+        type_name = data[start:start + type_len].decode("utf-8", "replace")
+        start += type_len + 1
+        comment = data[start:start + comment_len].decode("utf-8", "replace")
+
+        symbols[name.upper()] = Symbol(name, group, index, size, type_name, comment)
+        offset += length
+    return symbols
+
+
+class Datatype(NamedTuple):
+    """Entry of the datatype table or member of a datatype."""
+
+    name: str
+    type_name: str  #: name of the base type, the type of a member
+    size: int
+    offset: int  #: offset of a member within its parent datatype
+    members: Dict[str, "Datatype"]  #: members with the upper case name as key
+
+
+def _parse_datatype(data: bytes, offset: int) -> Tuple[Datatype, int]:
+    """Parse one entry of the datatype table and its members.
+
+    :return: tuple of the datatype and the length of the entry
+
+    """
+    (length, _, _, _, size, member_offset, _, _,
+     name_len, type_len, comment_len, array_dim, sub_items) = (
+        _DATATYPE_ENTRY.unpack_from(data, offset)
+    )
+    start = offset + _DATATYPE_ENTRY.size
+    name = data[start:start + name_len].decode("utf-8", "replace")
+    start += name_len + 1
+    type_name = data[start:start + type_len].decode("utf-8", "replace")
+    # comment and array bounds (lower bound, elements) precede the members
+    start += type_len + 1 + comment_len + 1 + 8 * array_dim
+
+    members = {}
+    for _ in range(sub_items):
+        member, member_len = _parse_datatype(data, start)
+        if not member_len:
+            break
+        members[member.name.upper()] = member
+        start += member_len
+    return Datatype(name, type_name, size, member_offset, members), length
+
+
+def parse_datatypes(data: bytes) -> Dict[str, Datatype]:
+    """Parse the datatype table uploaded from the plc.
+
+    :param bytes data: raw datatype table
+    :return: dictionary of datatypes with the upper case name as key
+
+    """
+    datatypes = {}
+    offset = 0
+    while offset < len(data):
+        datatype, length = _parse_datatype(data, offset)
+        if not length:
+            break
+        datatypes[datatype.name.upper()] = datatype
+        offset += length
+    return datatypes
+
+
+class SymbolTable:
+    """Symbols and datatypes of a plc.
+
+    :param symbols: dictionary of symbols with the upper case name as key
+    :param datatypes: dictionary of datatypes with the upper case name as key
+    :param tuple version: version key the table was loaded with
+
+    Symbol names are not case sensitive. Members of symbols are resolved by
+    the datatype table, ``MAIN.fbAxis.fActPos`` is found at the offset of
+    ``fActPos`` within the type of the symbol ``MAIN.fbAxis``.
+
+    """
+
+    def __init__(
+        self,
+        symbols: Dict[str, Symbol],
+        datatypes: Optional[Dict[str, Datatype]] = None,
+        version: Tuple[int, ...] = (),
+    ) -> None:
+        self.symbols = symbols
+        self.datatypes = datatypes or {}
+        self.version = version
+
+    def __contains__(self, name: str) -> bool:
+        try:
+            self.resolve(name)
+        except KeyError:
+            return False
+        return True
+
+    def __getitem__(self, name: str) -> Symbol:
+        try:
+            return self.symbols[name.upper()]
+        except KeyError:
+            raise KeyError("Unknown symbol %s" % name)
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def get(self, name: str) -> Optional[Symbol]:
+        """Return the symbol of the given name or None."""
+        return self.symbols.get(name.upper())
+
+    def resolve(self, name: str) -> Tuple[int, int]:
+        """Return index group and offset of a symbol or a member of it.
+
+        :param str name: symbol name
+        :raises KeyError: if neither the symbol nor its members are known
+
+        """
+        symbol = self.get(name)
+        if symbol is not None:
+            return symbol.index_group, symbol.index_offset
+
+        # the longest prefix naming a symbol, the rest names members
+        parts = name.split(".")
+        for i in range(len(parts) - 1, 0, -1):
+            symbol = self.get(".".join(parts[:i]))
+            if symbol is not None:
+                break
+        else:
+            raise KeyError("Unknown symbol %s" % name)
+
+        offset, type_name = symbol.index_offset, symbol.type_name
+        for part in parts[i:]:
+            datatype = self.datatypes.get(type_name.upper())
+            member = datatype.members.get(part.upper()) if datatype else None
+            if member is None:
+                raise KeyError("Unknown symbol %s" % name)
+            offset += member.offset
+            type_name = member.type_name
+        return symbol.index_group, offset
+
+    @classmethod
+    def load(
+        cls, adr: pyads.AmsAddr, cache_dir: Optional[str] = CACHE_DIR
+    ) -> "SymbolTable":
+        """Load the symbol table of a plc, using the cache if it is valid.
+
+        :param pyads.AmsAddr adr: address of the ADS device
+        :param str cache_dir: directory of the cache, None disables caching
+
+        """
+        version, symbol_size, datatype_size = _read_upload_info(adr)
+
+        path = None
+        if cache_dir is not None:
+            path = os.path.join(
+                cache_dir,
+                "symbols_%s_%i.pickle" % (adr.netid.replace(".", "_"), adr.port),
+            )
+            table = cls._load_cache(path, version)
+            if table is not None:
+                return table
+
+        symbols = parse_symbols(_upload(adr, ADSIGRP_SYM_UPLOAD, symbol_size))
+        datatypes = (
+            parse_datatypes(_upload(adr, ADSIGRP_SYM_DT_UPLOAD, datatype_size))
+            if datatype_size else {}
+        )
+        table = cls(symbols, datatypes, version)
+
+        if path is not None:
+            table._save_cache(path)
+        return table
+
+    @classmethod
+    def _load_cache(
+        cls, path: str, version: Tuple[int, ...]
+    ) -> Optional["SymbolTable"]:
+        try:
+            with open(path, "rb") as f:
+                cache_format, cached_version, symbols, datatypes = pickle.load(f)
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+            return None
+        if cache_format != CACHE_FORMAT or cached_version != version:
+            return None
+        return cls(
+            {name.upper(): Symbol(*s) for name, s in symbols.items()},
+            datatypes, version,
+        )
+
+    def _save_cache(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(
+                (CACHE_FORMAT, self.version,
+                 {name: tuple(s) for name, s in self.symbols.items()},
+                 self.datatypes),
+                f, pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp, path)
+
+
+def _upload(adr: pyads.AmsAddr, index_group: int, size: int) -> bytes:
+    if not size:
+        return b""
+    return bytes(memoryview(ads_read(adr, index_group, 0, byte_buffer(size))))
+
+
+def _read_upload_info(adr: pyads.AmsAddr) -> Tuple[Tuple[int, ...], int, int]:
+    """Return version key, symbol table size and datatype table size."""
+    sym_version = ads_read(adr, ADSIGRP_SYM_VERSION, 0, pyads.PLCTYPE_USINT)
+    try:
+        info = memoryview(ads_read(adr, ADSIGRP_SYM_UPLOADINFO2, 0, byte_buffer(24)))
+        symbol_count, symbol_size, datatype_count, datatype_size = (
+            struct.unpack_from("<4I", info.cast("B"))
+        )
+    except ADSError:
+        # devices without datatype information only know the old request
+        info = memoryview(ads_read(adr, ADSIGRP_SYM_UPLOADINFO, 0, byte_buffer(8)))
+        symbol_count, symbol_size = struct.unpack_from("<2I", info.cast("B"))
+        datatype_count = datatype_size = 0
+
+    version = (sym_version, symbol_count, symbol_size, datatype_count, datatype_size)
+    return version, symbol_size, datatype_size
+
+
+class HandlePool:
+    """Cache of variable handles of a plc.
+
+    Handles are only needed for symbols that can not be accessed by index
+    group and offset, e.g. references. They are requested once, reused for
+    all following accesses and released together by :py:meth:`release_all`.
+
+    :param pyads.AmsAddr adr: address of the ADS device
+
+    """
+
+    def __init__(self, adr: pyads.AmsAddr) -> None:
+        self.adr = adr
+        self._handles: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._handles)
+
+    def get(self, name: str) -> int:
+        """Return the handle of a variable, request it if necessary.
+
+        :param str name: variable name
+
+        """
+        key = name.upper()
+        handle = self._handles.get(key)
+        if handle is None:
+            handle = ads_read_write(
+                self.adr, ADSIGRP_SYM_HNDBYNAME, 0,
+                pyads.PLCTYPE_UDINT, name, pyads.PLCTYPE_STRING
+            )
+            self._handles[key] = handle
+        return handle
+
+    def release(self, name: str) -> None:
+        """Release the handle of a variable.
+
+        :param str name: variable name
+
+        """
+        handle = self._handles.pop(name.upper(), None)
+        if handle is not None:
+            ads_write(
+                self.adr, ADSIGRP_SYM_RELEASEHND, 0,
+                handle, pyads.PLCTYPE_UDINT
+            )
+
+    def release_all(self) -> None:
+        """Release all handles of the pool."""
+        names: List[str] = list(self._handles)
+        for name in names:
+            try:
+                self.release(name)
+            except ADSError:
+                # the plc releases the handles of a lost connection itself
+                pass
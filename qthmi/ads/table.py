@@ -0,0 +1,635 @@
+"""Columnar storage of tens of thousands of tags.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+Every :py:class:`ADSMapper` is a Python object with a ``__dict__`` of its
+own, polling it means decoding, comparing and updating one object after the
+other. The :py:class:`TagTable` keeps address, datatype, current value,
+timestamp and quality of all tags in numpy columns. A poll decodes the sum
+read response of a datatype with one ``np.frombuffer`` and finds the changed
+values with vectorized compares over the whole columns, only the views of
+changed tags are called.
+
+A :py:class:`TagView` is a lightweight mapper with ``__slots__`` indexing into
+the table. It is subclassed like :py:class:`ADSMapper` and implements
+``mapAdsToGui``.
+
+Only scalar numeric and boolean datatypes are stored, values are kept as
+64 bit floats, so 64 bit integers beyond 2**53 lose precision. Use
+:py:class:`ADSMapper` for strings, arrays and structures.
+
+Sample code::
+
+>>> table = TagTable()
+>>> speed = TextBoxView(table, 0, pyads.PLCTYPE_REAL, lineEdit, deadband=0.1)
+>>> timer.timeout.connect(lambda: table.poll(adsAdr))
+
+"""
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pyads
+from qthmi.main.connector import ConnectionError
+from qthmi.main.widgets import HMIObject
+from .batch import MAX_SUM_REQUESTS, index_group, sum_read
+from .codecs import Codec, get_codec, write_value
+from .gui import VALUE_TYPE
+from .ports import ADSError
+from .quality import QUALITY_BAD, QUALITY_GOOD, QUALITY_UNCERTAIN, Sample
+
+#: struct formats of the datatypes stored in a table
+_NUMERIC_FORMATS = "?bBhHiIqQfd"
+
+#: sum read requests of the table: kind, slots and (group, offset, size)
+_PLAN_TYPE = List[Tuple[int, np.ndarray, List[Tuple[int, int, int]]]]
+
+
+def column_dtype(datatype: Any) -> Optional[np.dtype]:
+    """Return the numpy dtype of a datatype, None if it cannot be stored.
+
+    :param datatype: ``c`` datatype, a PLCTYPE constant
+
+    """
+    codec = get_codec(datatype)
+    fmt = codec.struct.format
+    if type(codec) is not Codec or fmt[1:] not in _NUMERIC_FORMATS:
+        return None
+    return np.dtype(fmt)
+
+
+class TagTable:
+    """Table of tags stored in numpy columns.
+
+    Slots of removed tags are reused by the next tag added.
+
+    :param int capacity: initial number of slots, the columns grow on demand
+
+    :ivar group: index group of the tags
+    :ivar offset: index offset of the tags
+    :ivar value: current values, NaN if not read yet
+    :ivar timestamp: time the values have been read, ``time.time``
+    :ivar quality: quality codes of the values, see :py:data:`QUALITY_GOOD`
+    :ivar error: ADS error code of the last failed read
+    :ivar listened: True for tags whose view has listeners
+    :ivar int reads: number of values read by :py:meth:`poll`
+    :ivar int changes: number of values passed to the views
+
+    """
+
+    _COLUMNS = (
+        ("group", np.uint32, 0),
+        ("offset", np.uint32, 0),
+        ("kind", np.int16, -1),
+        ("value", np.float64, np.nan),
+        ("timestamp", np.float64, np.nan),
+        ("quality", np.uint8, QUALITY_UNCERTAIN),
+        ("error", np.uint32, 0),
+        ("deadband", np.float64, 0.0),
+        ("deadband_percent", np.float64, 0.0),
+        ("min_interval", np.float64, 0.0),
+        ("shown", np.float64, np.nan),
+        ("shown_time", np.float64, np.nan),
+        ("listened", np.bool_, False),
+    )
+
+    # the columns are created from _COLUMNS
+    group: np.ndarray
+    offset: np.ndarray
+    kind: np.ndarray
+    value: np.ndarray
+    timestamp: np.ndarray
+    quality: np.ndarray
+    error: np.ndarray
+    deadband: np.ndarray
+    deadband_percent: np.ndarray
+    min_interval: np.ndarray
+    shown: np.ndarray
+    shown_time: np.ndarray
+    listened: np.ndarray
+
+    def __init__(self, capacity: int = 1024) -> None:
+        for name, dtype, default in self._COLUMNS:
+            setattr(self, name, np.full(capacity, default, dtype))
+        self.views: List[Optional["TagView"]] = [None] * capacity
+        self.reads = 0
+        self.changes = 0
+
+        self._count = 0
+        self._free: List[int] = list(range(capacity - 1, -1, -1))
+        self._datatypes: List[Any] = []
+        self._dtypes: List[np.dtype] = []
+        self._kinds: Dict[Any, int] = {}
+        self._plan: Optional[_PLAN_TYPE] = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def capacity(self) -> int:
+        """Number of slots of the columns."""
+        return len(self.value)
+
+    def _grow(self) -> None:
+        capacity = self.capacity
+        for name, dtype, default in self._COLUMNS:
+            column = getattr(self, name)
+            setattr(
+                self, name,
+                np.concatenate((column, np.full(capacity, default, dtype))),
+            )
+        self.views += [None] * capacity
+        self._free = list(range(2 * capacity - 1, capacity - 1, -1)) + self._free
+
+    def add(
+        self,
+        address: int,
+        datatype: Any,
+        group: Optional[int] = None,
+        deadband: float = 0.0,
+        deadband_percent: float = 0.0,
+        min_interval: float = 0.0,
+    ) -> int:
+        """Add a tag and return its slot.
+
+        :param int address: index offset of the value
+        :param datatype: ``c`` datatype, a PLCTYPE constant
+        :param int group: index group, by default the plc memory area
+        :param float deadband: absolute deadband of float values
+        :param float deadband_percent: deadband of float values in percent of
+            the value shown last
+        :param float min_interval: minimum time in seconds between two
+            changes passed to the view
+        :raises ValueError: if the datatype cannot be stored in a table
+
+        """
+        kind = self._kinds.get(datatype)
+        if kind is None:
+            dtype = column_dtype(datatype)
+            if dtype is None:
+                raise ValueError(
+                    "Datatype %r cannot be stored in a tag table" % datatype
+                )
+            kind = self._kinds[datatype] = len(self._datatypes)
+            self._datatypes.append(datatype)
+            self._dtypes.append(dtype)
+        # like ADSMapper the deadband only applies to float values
+        if self._dtypes[kind].kind != "f":
+            deadband = deadband_percent = 0.0
+
+        if not self._free:
+            self._grow()
+        slot = self._free.pop()
+        self.group[slot] = index_group(datatype) if group is None else group
+        self.offset[slot] = address
+        self.kind[slot] = kind
+        self.deadband[slot] = deadband
+        self.deadband_percent[slot] = deadband_percent
+        self.min_interval[slot] = min_interval
+        self._count += 1
+        self._plan = None
+        return slot
+
+    def remove(self, slot: int) -> None:
+        """Remove a tag, its slot is reused.
+
+        The view of the tag is detached from the slot.
+
+        :param int slot: slot of the tag
+
+        """
+        if self.kind[slot] < 0:
+            return
+        for name, dtype, default in self._COLUMNS:
+            getattr(self, name)[slot] = default
+        view = self.views[slot]
+        if view is not None:
+            view._slot = -1
+        self.views[slot] = None
+        self._free.append(slot)
+        self._count -= 1
+        self._plan = None
+
+    def datatype(self, slot: int) -> Any:
+        """Return the datatype of a tag.
+
+        :param int slot: slot of the tag
+
+        """
+        return self._datatypes[self.kind[slot]]
+
+    def get(self, slot: int) -> VALUE_TYPE:
+        """Return the current value of a tag converted to its datatype.
+
+        :param int slot: slot of the tag
+        :return: the value, None if it has not been read yet
+
+        """
+        value = self.value[slot]
+        if np.isnan(value):
+            return None
+        return self._dtypes[self.kind[slot]].type(value).item()
+
+    def set(
+        self, slot: int, value: VALUE_TYPE, timestamp: Optional[float] = None
+    ) -> bool:
+        """Store a value of a tag, e.g. received by a notification.
+
+        :param int slot: slot of the tag
+        :param value: value of the tag
+        :param float timestamp: time of the value, ``time.time``, by default now
+        :return: True if the change has to be shown by the view
+
+        """
+        self.value[slot] = value
+        self.timestamp[slot] = time.time() if timestamp is None else timestamp
+        self.quality[slot] = QUALITY_GOOD
+        self.error[slot] = 0
+        slots = np.array([slot])
+        changed = self._changed(slots, time.monotonic())
+        if not changed[0]:
+            return False
+        self.shown[slot] = value
+        self.shown_time[slot] = time.monotonic()
+        self.changes += 1
+        return True
+
+    def mark_bad(self, slot: int, error: int = 0) -> bool:
+        """Mark the value of a tag bad, the last value is kept.
+
+        :param int slot: slot of the tag
+        :param int error: ADS error code, 0 if unknown
+        :return: True if the quality has changed
+
+        """
+        self.error[slot] = error
+        if self.quality[slot] == QUALITY_BAD:
+            return False
+        self.quality[slot] = QUALITY_BAD
+        return True
+
+    def sample(self, slot: int) -> Sample:
+        """Return the current value of a tag with timestamp and quality.
+
+        :param int slot: slot of the tag
+
+        """
+        timestamp = self.timestamp[slot]
+        return Sample(
+            self.get(slot), None if np.isnan(timestamp) else float(timestamp),
+            int(self.quality[slot]), int(self.error[slot]),
+        )
+
+    def _changed(self, slots: np.ndarray, now: float) -> np.ndarray:
+        """Return a mask of the tags whose value has to be shown."""
+        value = self.value[slots]
+        shown = self.shown[slots]
+        shown_time = self.shown_time[slots]
+        never = np.isnan(shown_time)
+        with np.errstate(invalid="ignore"):
+            diff = np.abs(value - shown)
+            changed = (
+                (value != shown)
+                & (diff > self.deadband[slots])
+                & (diff > np.abs(shown) * self.deadband_percent[slots] / 100.0)
+            )
+            due = now - shown_time >= self.min_interval[slots]
+        return (never | (changed & due)) & ~np.isnan(value)
+
+    def _make_plan(self) -> _PLAN_TYPE:
+        # sum read requests of all tags, chunked per datatype
+        plan = []
+        for kind, dtype in enumerate(self._dtypes):
+            slots = np.flatnonzero(self.kind == kind)
+            for start in range(0, len(slots), MAX_SUM_REQUESTS):
+                chunk = slots[start:start + MAX_SUM_REQUESTS]
+                requests = [
+                    (group, offset, dtype.itemsize) for group, offset in zip(
+                        self.group[chunk].tolist(), self.offset[chunk].tolist()
+                    )
+                ]
+                plan.append((kind, chunk, requests))
+        return plan
+
+    def poll(self, adsAdr: pyads.AmsAddr) -> np.ndarray:
+        """Read all tags and pass the changed values to their views.
+
+        Tags that could not be read get the quality :py:data:`QUALITY_BAD`
+        and keep their last value. If a sum read request fails all tags of
+        the request are marked bad, the other requests are sent anyway.
+        The views of tags whose quality has changed are called first, then
+        the listeners of all tags read, then the views of changed values.
+        The requests do not pass the circuit breaker of a connector, see
+        :py:mod:`qthmi.ads.breaker`.
+
+        :param pyads.AmsAddr adsAdr: address of the ADS device
+        :return: slots of the changed values
+        :raises ConnectionError: if a sum read request failed, after all
+            other tags have been read
+
+        """
+        if self._plan is None:
+            self._plan = self._make_plan()
+
+        changed = []
+        flipped = []
+        listened = []
+        failure: Optional[ConnectionError] = None
+        for kind, slots, requests in self._plan:
+            previous = self.quality[slots]
+            try:
+                results = sum_read(adsAdr, requests)
+            except ADSError as e:
+                failure = failure or ConnectionError(
+                    "Sum reading %i addresses (ErrorCode %i)" %
+                    (len(requests), e.err_code)
+                )
+                self.error[slots] = e.err_code
+                self.quality[slots] = QUALITY_BAD
+                flipped.append(slots[previous != QUALITY_BAD])
+                listened.append(slots[self.listened[slots]])
+                continue
+            now = time.time()
+            errors = np.array([err for err, _ in results], np.uint32)
+            values = np.frombuffer(
+                b"".join([data for _, data in results]), self._dtypes[kind]
+            )
+
+            ok = errors == 0
+            good = slots[ok]
+            self.value[good] = values[ok]
+            self.timestamp[good] = now
+            self.quality[good] = QUALITY_GOOD
+            self.error[slots] = errors
+            if not ok.all():
+                self.quality[slots[~ok]] = QUALITY_BAD
+            flipped.append(slots[previous != self.quality[slots]])
+
+            mask = self._changed(good, time.monotonic())
+            changed.append(good[mask])
+            listened.append(slots[self.listened[slots]])
+            self.reads += len(good)
+
+        views = self.views
+        for slot in np.concatenate(flipped).tolist() if flipped else ():
+            view = views[slot]
+            if view is not None:
+                view.showQuality()
+        for slot in np.concatenate(listened).tolist() if listened else ():
+            view = views[slot]
+            if view is not None:
+                view.notifyListeners()
+
+        slots = np.concatenate(changed) if changed else np.empty(0, np.intp)
+        self.shown[slots] = self.value[slots]
+        self.shown_time[slots] = time.monotonic()
+        self.changes += len(slots)
+        for slot in slots.tolist():
+            view = views[slot]
+            if view is not None:
+                view.showValue(self.get(slot))
+        if failure is not None:
+            raise failure
+        return slots
+
+
+class TagView:
+    """Mapper viewing a tag of a :py:class:`TagTable`.
+
+    Subclass and implement ``mapAdsToGui`` like for :py:class:`ADSMapper`.
+    The view can be used in the place of a mapper by
+    :py:class:`qthmi.ads.batch.ADSPollGroup` and the other collections of
+    mappers, but the table polls its tags faster.
+
+    :param TagTable table: table storing the tag
+    :param int plcAddress: plc memory address
+    :param plcDataType: plc data type
+    :param guiObjects: list/tuple or single gui objects
+    :param int indexGroup: index group, by default the plc memory area
+    :param float deadband: absolute deadband for float values
+    :param float deadbandPercent: deadband for float values in percent of
+        the value shown last
+    :param float minInterval: minimum time in seconds between two updates
+        of the gui objects
+
+    Subclasses have to declare ``__slots__`` as well, ``__slots__ = ()`` if
+    they add no attributes, otherwise every view gets a ``__dict__`` again.
+
+    After the tag has been removed the slot may belong to another tag, all
+    attributes read from the table raise ValueError then.
+
+    """
+
+    __slots__ = ("table", "_slot", "guiObjects", "listeners")
+
+    def __init__(
+        self,
+        table: TagTable,
+        plcAddress: int,
+        plcDataType: Any,
+        guiObjects: List[HMIObject],
+        indexGroup: Optional[int] = None,
+        deadband: float = 0.0,
+        deadbandPercent: float = 0.0,
+        minInterval: float = 0.0,
+    ) -> None:
+        self.table = table
+        self._slot = table.add(
+            plcAddress, plcDataType, indexGroup, deadband, deadbandPercent,
+            minInterval,
+        )
+        table.views[self._slot] = self
+        self.guiObjects = guiObjects
+        self.listeners: List[Callable[[Sample], None]] = []
+
+        if isinstance(guiObjects, (list, tuple)):
+            for o in guiObjects:
+                o.plcObject = self
+        else:
+            guiObjects.plcObject = self
+
+    @property
+    def slot(self) -> int:
+        """Slot of the tag in the table.
+
+        :raises ValueError: if the tag has been removed
+
+        """
+        if self._slot < 0:
+            raise ValueError("The tag has been removed from the table")
+        return self._slot
+
+    @property
+    def plcAdr(self) -> int:
+        """Index offset of the tag."""
+        return int(self.table.offset[self.slot])
+
+    @property
+    def symbol(self) -> Optional[str]:
+        """Symbol name, always None as tags are added by address."""
+        return None
+
+    @property
+    def indexGroup(self) -> int:
+        """Index group of the tag."""
+        return int(self.table.group[self.slot])
+
+    @property
+    def plcDataType(self) -> Any:
+        """Datatype of the tag."""
+        return self.table.datatype(self.slot)
+
+    @property
+    def codec(self) -> Codec:
+        """Codec converting the values of the plc datatype."""
+        return get_codec(self.plcDataType)
+
+    @property
+    def currentValue(self) -> VALUE_TYPE:
+        """Current value of the tag."""
+        return self.table.get(self.slot)
+
+    @property
+    def quality(self) -> int:
+        """Quality code of the current value."""
+        return int(self.table.quality[self.slot])
+
+    @property
+    def timestamp(self) -> Optional[float]:
+        """Time the current value has been read, ``time.time``."""
+        return self.table.sample(self.slot).timestamp
+
+    @property
+    def error(self) -> int:
+        """ADS error code of the last failed read."""
+        return int(self.table.error[self.slot])
+
+    @property
+    def sample(self) -> Sample:
+        """Current value with timestamp and quality."""
+        return self.table.sample(self.slot)
+
+    def remove(self) -> None:
+        """Remove the tag from the table."""
+        if self._slot >= 0:
+            self.table.remove(self._slot)
+
+    def write(self, adsAdr: pyads.AmsAddr, value: VALUE_TYPE) -> None:
+        """Write a value to the plc address.
+
+        The written value becomes the current value with the time of the
+        write and good quality, it is shown by the next poll if it differs
+        from the value shown last.
+
+        :param pyads.AmsAddr adsAdr: address to the ADS device
+        :param value: value to be written
+
+        """
+        try:
+            write_value(adsAdr, self.indexGroup, self.plcAdr, value, self.plcDataType)
+        except ADSError as e:
+            raise ConnectionError(
+                "Writing on address %i (ErrorCode %i)" % (self.plcAdr, e.err_code)
+            )
+        slot = self.slot
+        self.table.value[slot] = value
+        self.table.timestamp[slot] = time.time()
+        self.table.quality[slot] = QUALITY_GOOD
+        self.table.error[slot] = 0
+
+    def update(self, value: VALUE_TYPE, timestamp: Optional[float] = None) -> None:
+        """Store a value read from the plc and show it if it has changed.
+
+        :param value: value read from the plc
+        :param float timestamp: time the value has been sampled,
+            ``time.time``, by default now
+
+        """
+        previous = self.table.quality[self.slot]
+        shown = self.table.set(self.slot, value, timestamp)
+        if previous != QUALITY_GOOD:
+            self.showQuality()
+        self.notifyListeners()
+        if shown:
+            self.showValue(self.table.get(self.slot))
+
+    def markBad(self, error: int = 0) -> None:
+        """Mark the value bad because it could not be read.
+
+        :param int error: ADS error code, 0 if unknown
+
+        """
+        if self.table.mark_bad(self.slot, error):
+            self.showQuality()
+        self.notifyListeners()
+
+    def showQuality(self) -> None:
+        """Call mapQualityToGui for all connected gui objects."""
+        sample = self.sample
+        if isinstance(self.guiObjects, (list, tuple)):
+            for o in self.guiObjects:
+                self.mapQualityToGui(o, sample)
+        else:
+            self.mapQualityToGui(self.guiObjects, sample)
+
+    def showValue(self, value: VALUE_TYPE) -> None:
+        """Call mapAdsToGui for all connected gui objects.
+
+        :param value: value to display
+
+        """
+        if isinstance(self.guiObjects, (list, tuple)):
+            for o in self.guiObjects:
+                self.mapAdsToGui(o, value)
+        else:
+            self.mapAdsToGui(self.guiObjects, value)
+
+    def notifyListeners(self) -> None:
+        """Call the listeners with the current sample.
+
+        A sample of bad quality is stamped with the time of the failed read.
+
+        """
+        sample = self.table.sample(self.slot)
+        if sample.quality == QUALITY_BAD:
+            sample = sample._replace(timestamp=time.time())
+        for listener in self.listeners:
+            listener(sample)
+
+    def addListener(self, listener: Callable[[Sample], None]) -> None:
+        """Add a function that is called with every value read from the plc.
+
+        Failed reads are passed as samples of bad quality.
+
+        :param listener: function taking a :py:class:`Sample` as only
+            argument
+
+        """
+        self.listeners.append(listener)
+        self.table.listened[self.slot] = True
+
+    def removeListener(self, listener: Callable[[Sample], None]) -> None:
+        """Remove a function added by :py:meth:`addListener`.
+
+        :param listener: function to remove
+
+        """
+        self.listeners.remove(listener)
+        self.table.listened[self.slot] = bool(self.listeners)
+
+    def mapAdsToGui(self, guiObject: HMIObject, value: VALUE_TYPE) -> None:
+        """Display the value on the connected gui object.
+
+        :param QObject guiObject: gui object for value output
+        :param value: value to display in the gui object
+
+        """
+        print(value)
+
+    def mapQualityToGui(self, guiObject: HMIObject, sample: Sample) -> None:
+        """Display the quality of the value on the connected gui object.
+
+        :param QObject guiObject: gui object for value output
+        :param Sample sample: current value with timestamp and quality
+
+        """
@@ -0,0 +1,424 @@
+"""Declarative tag configuration.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+Instead of creating thousands of mappers in Python code the tags of an HMI
+are declared in a JSON, YAML or CSV file, one record per tag:
+
+=================== ==========================================================
+field               meaning
+=================== ==========================================================
+name                unique name of the tag
+address             memory address or symbol name
+type                plc datatype without ``PLCTYPE_`` prefix, e.g. ``LREAL``
+scan                scan class of the :py:class:`PollScheduler`, ``normal``
+deadband            absolute deadband of float values
+deadband_percent    deadband of float values in percent
+min_interval        minimum time in seconds between two updates
+screen              name of the screen showing the tag
+widget              object name of the widget on the screen
+mapper              name of the mapper class, see :py:class:`TagDatabase`
+hint                hint for the value
+=================== ==========================================================
+
+JSON and YAML files contain a list of records or a mapping with the list
+under the key ``tags``. CSV files have a header row with the field names.
+Only name, address and type are required.
+
+The file is validated and compiled into a cache on the first load, following
+loads read the cache as long as the file is unchanged. The mappers of a
+screen are created when the screen is shown for the first time.
+
+Sample code::
+
+>>> tags = TagDatabase.load("tags.yaml", {"text": TextBoxMapper})
+>>> tags.bind("overview", overviewWidget, scheduler, connector)
+
+"""
+import csv
+import hashlib
+import json
+import os
+import pickle
+from typing import (
+    Any, Callable, Dict, Iterable, List, Mapping, NamedTuple, Optional, Type, Union
+)
+
+import pyads
+from PyQt5.QtCore import QEvent, QObject
+from .gui import ADSMapper
+from .scheduler import SCAN_CLASSES
+from .symbols import CACHE_DIR
+
+
+#: version of the cache format, increase on changes of :py:class:`Tag`
+CACHE_VERSION = 1
+
+
+class TagError(ValueError):
+    """Invalid tag configuration.
+
+    :ivar errors: list of messages, one per invalid field
+
+    """
+
+    def __init__(self, errors: List[str]) -> None:
+        super(TagError, self).__init__("\n".join(errors))
+        self.errors = errors
+
+
+class Tag(NamedTuple):
+    """Declaration of a plc value."""
+
+    name: str
+    address: Union[int, str]
+    type: str
+    scan: str = "normal"
+    deadband: float = 0.0
+    deadband_percent: float = 0.0
+    min_interval: float = 0.0
+    screen: str = ""
+    widget: str = ""
+    mapper: str = ""
+    hint: str = ""
+
+    @property
+    def datatype(self) -> Any:
+        """``c`` datatype, a PLCTYPE constant."""
+        return plc_type(self.type)
+
+
+def plc_type(name: str) -> Any:
+    """Return the PLCTYPE constant of a datatype name.
+
+    :param str name: name of the datatype, e.g. ``INT`` or ``PLCTYPE_INT``
+
+    """
+    name = name.strip().upper()
+    if not name.startswith("PLCTYPE_"):
+        name = "PLCTYPE_" + name
+    try:
+        return getattr(pyads, name)
+    except AttributeError:
+        raise ValueError("unknown plc datatype %s" % name[8:])
+
+
+def read_records(path: str) -> List[Dict[str, Any]]:
+    """Read the records of a JSON, YAML or CSV file.
+
+    Reading YAML files requires PyYAML.
+
+    :param str path: path of the file, the format is taken from the extension
+
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline="") as f:
+        if extension == ".csv":
+            return [
+                {k.strip(): v.strip() for k, v in row.items() if k and v and v.strip()}
+                for row in csv.DictReader(f)
+            ]
+        if extension in (".yaml", ".yml"):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("PyYAML is required to read %s" % path)
+            data = yaml.safe_load(f)
+        elif extension == ".json":
+            data = json.load(f)
+        else:
+            raise TagError(["%s: unknown file format %s" % (path, extension)])
+
+    if isinstance(data, Mapping):
+        data = data.get("tags")
+    if not isinstance(data, list):
+        raise TagError(["%s: expected a list of tags" % path])
+    return data
+
+
+def validate(
+    records: Iterable[Any],
+    source: str = "",
+    scan_classes: Iterable[str] = SCAN_CLASSES,
+) -> List[Tag]:
+    """Check the records and convert them to tags.
+
+    :param records: dictionaries with the fields of the tags
+    :param str source: name of the file used in the messages
+    :param scan_classes: names of the valid scan classes
+    :raises TagError: with a message for every invalid field
+
+    """
+    tags: List[Tag] = []
+    errors: List[str] = []
+    names = set()
+    scan_classes = set(scan_classes)
+    fields = Tag._fields
+    defaults = Tag._field_defaults
+
+    for i, record in enumerate(records, 1):
+        where = "%s record %i" % (source, i) if source else "record %i" % i
+        if not isinstance(record, Mapping):
+            errors.append("%s: expected a mapping of fields" % where)
+            continue
+
+        values: Dict[str, Any] = {}
+        for key in record:
+            if key not in fields:
+                errors.append("%s: unknown field %s" % (where, key))
+        for key in ("name", "address", "type"):
+            if record.get(key) in (None, ""):
+                errors.append("%s: missing field %s" % (where, key))
+
+        name = str(record.get("name", ""))
+        if name in names:
+            errors.append("%s: duplicate name %s" % (where, name))
+        names.add(name)
+        values["name"] = name
+
+        address = record.get("address")
+        if isinstance(address, str) and address.strip().isdigit():
+            address = int(address)
+        elif isinstance(address, float) and address.is_integer():
+            address = int(address)
+        if address is not None and not isinstance(address, (int, str)):
+            errors.append("%s: invalid address %r" % (where, address))
+        values["address"] = address
+
+        try:
+            if "type" in record:
+                plc_type(str(record["type"]))
+        except ValueError as e:
+            errors.append("%s: %s" % (where, e))
+        values["type"] = str(record.get("type", "")).strip().upper()
+
+        scan = str(record.get("scan", defaults["scan"]))
+        if scan not in scan_classes:
+            errors.append("%s: unknown scan class %s" % (where, scan))
+        values["scan"] = scan
+
+        for key in ("deadband", "deadband_percent", "min_interval"):
+            try:
+                values[key] = float(record.get(key, defaults[key]))
+                if values[key] < 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                errors.append("%s: invalid %s %r" % (where, key, record[key]))
+
+        for key in ("screen", "widget", "mapper", "hint"):
+            values[key] = str(record.get(key, defaults[key]))
+
+        if not errors:
+            tags.append(Tag(**values))
+
+    if errors:
+        raise TagError(errors)
+    return tags
+
+
+def load_tags(path: str, cache_dir: Optional[str] = CACHE_DIR) -> List[Tag]:
+    """Load the tags of a file, using the cache if the file is unchanged.
+
+    :param str path: path of the JSON, YAML or CSV file
+    :param str cache_dir: directory of the cache, None disables caching
+    :raises TagError: if the file is invalid
+
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    version = (CACHE_VERSION, stat.st_mtime_ns, stat.st_size)
+
+    cache = None
+    if cache_dir is not None:
+        cache = os.path.join(cache_dir, "tags_%s_%s.pickle" % (
+            os.path.splitext(os.path.basename(path))[0],
+            hashlib.sha1(path.encode()).hexdigest()[:12],
+        ))
+        try:
+            with open(cache, "rb") as f:
+                cached_version, rows = pickle.load(f)
+            if cached_version == version:
+                return [Tag(*row) for row in rows]
+        except (OSError, ValueError, EOFError, TypeError, pickle.UnpicklingError):
+            pass
+
+    tags = validate(read_records(path), os.path.basename(path))
+
+    if cache is not None:
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        tmp = cache + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(
+                (version, [tuple(tag) for tag in tags]),
+                f, pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp, cache)
+    return tags
+
+
+class TagDatabase:
+    """Tags of an HMI and the mappers created from them.
+
+    The mappers of a screen are created by :py:meth:`build`, at the latest
+    when the screen is shown for the first time if it has been bound by
+    :py:meth:`bind`.
+
+    :param tags: declared tags
+    :param mapper_classes: mapper classes with the name used in the
+        ``mapper`` field as key
+    :param default_mapper: mapper class of tags without ``mapper`` field
+
+    """
+
+    def __init__(
+        self,
+        tags: Iterable[Tag],
+        mapper_classes: Mapping[str, Type[ADSMapper]] = None,
+        default_mapper: Type[ADSMapper] = ADSMapper,
+    ) -> None:
+        self.tags: Dict[str, Tag] = {tag.name: tag for tag in tags}
+        self.mapper_classes = dict(mapper_classes or {})
+        self.default_mapper = default_mapper
+        self._screens: Dict[str, List[Tag]] = {}
+        for tag in self.tags.values():
+            self._screens.setdefault(tag.screen, []).append(tag)
+        self._mappers: Dict[str, List[ADSMapper]] = {}
+        self._binders: Dict[str, "_ScreenBinder"] = {}
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        mapper_classes: Mapping[str, Type[ADSMapper]] = None,
+        default_mapper: Type[ADSMapper] = ADSMapper,
+        cache_dir: Optional[str] = CACHE_DIR,
+    ) -> "TagDatabase":
+        """Load the tags of a file, see :py:func:`load_tags`.
+
+        :param str path: path of the JSON, YAML or CSV file
+        :param mapper_classes: mapper classes with their name as key
+        :param default_mapper: mapper class of tags without ``mapper`` field
+        :param str cache_dir: directory of the cache, None disables caching
+
+        """
+        return cls(load_tags(path, cache_dir), mapper_classes, default_mapper)
+
+    @property
+    def screens(self) -> List[str]:
+        """Names of the screens."""
+        return list(self._screens)
+
+    def screen_tags(self, screen: str) -> List[Tag]:
+        """Return the tags of a screen.
+
+        :param str screen: name of the screen
+
+        """
+        return list(self._screens.get(screen, []))
+
+    def is_built(self, screen: str) -> bool:
+        """Return True if the mappers of a screen have been created.
+
+        :param str screen: name of the screen
+
+        """
+        return screen in self._mappers
+
+    def mappers(self, screen: str) -> List[ADSMapper]:
+        """Return the mappers of a screen created so far.
+
+        :param str screen: name of the screen
+
+        """
+        return list(self._mappers.get(screen, []))
+
+    def build(self, screen: str, root: QObject) -> List[ADSMapper]:
+        """Create the mappers of a screen, only once.
+
+        :param str screen: name of the screen
+        :param QObject root: widget of the screen, the widgets of the tags
+            are searched among its children by object name
+        :raises TagError: if a widget or mapper class is not found
+
+        """
+        mappers = self._mappers.get(screen)
+        if mappers is not None:
+            return mappers
+
+        errors = []
+        mappers = []
+        for tag in self._screens.get(screen, []):
+            widget = root.findChild(QObject, tag.widget) if tag.widget else root
+            cls = (
+                self.mapper_classes.get(tag.mapper) if tag.mapper
+                else self.default_mapper
+            )
+            if widget is None:
+                errors.append("tag %s: widget %s not found" % (tag.name, tag.widget))
+            elif cls is None:
+                errors.append("tag %s: unknown mapper %s" % (tag.name, tag.mapper))
+            else:
+                mappers.append(cls(
+                    tag.address, tag.datatype, widget, tag.hint or None,
+                    deadband=tag.deadband,
+                    deadbandPercent=tag.deadband_percent,
+                    minInterval=tag.min_interval,
+                ))
+        if errors:
+            raise TagError(errors)
+        self._mappers[screen] = mappers
+        return mappers
+
+    def bind(
+        self,
+        screen: str,
+        root: QObject,
+        scheduler: Any = None,
+        connector: Any = None,
+        callback: Callable[[str, List[ADSMapper]], None] = None,
+    ) -> None:
+        """Create the mappers of a screen when it is shown the first time.
+
+        :param str screen: name of the screen
+        :param QObject root: widget of the screen
+        :param scheduler: :py:class:`qthmi.ads.scheduler.PollScheduler` or
+            :py:class:`qthmi.ads.subscriptions.SubscriptionManager` the
+            mappers are added to in the scan class of their tag
+        :param qthmi.ads.connector.ADSConnector connector: connector
+            resolving the symbol names of the mappers
+        :param callback: function called with the screen name and the
+            mappers after they have been created
+
+        """
+
+        def create() -> None:
+            self._binders.pop(screen, None)
+            mappers = self.build(screen, root)
+            if connector is not None:
+                connector.resolve(mappers)
+            if scheduler is not None:
+                for tag, mapper in zip(self._screens.get(screen, []), mappers):
+                    scheduler.add(mapper, tag.scan)
+            if callback is not None:
+                callback(screen, mappers)
+
+        if self.is_built(screen) or root.isVisible():
+            create()
+            return
+        self._binders[screen] = _ScreenBinder(root, create)
+
+
+class _ScreenBinder(QObject):
+    # call a function when a widget is shown the first time
+
+    def __init__(self, widget: QObject, function: Callable[[], None]) -> None:
+        super(_ScreenBinder, self).__init__(widget)
+        self.function: Optional[Callable[[], None]] = function
+        widget.installEventFilter(self)
+
+    def eventFilter(self, obj: QObject, event: QEvent) -> bool:
+        if event.type() == QEvent.Show and self.function is not None:
+            function, self.function = self.function, None
+            obj.removeEventFilter(self)
+            function()
+        return False
@@ -0,0 +1,445 @@
+"""Benchmarks of the ADS access paths against a fake ADS device.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+The single value paths of :py:class:`ADSConnector` and :py:class:`ADSMapper`,
+the batched paths, polls of a :py:class:`TagTable`, concurrent reads of
+:py:class:`AsyncADSConnector` and reads through an :py:class:`ADSGateway`
+are run for 10, 1000 and 10000 mappers against an in-process
+:py:class:`FakeADSTarget`. The startup of an HMI with 5000 declared tags
+is measured with and without the compiled tag cache. The frame time of
+showing four poll cycles on 2000 widgets is measured with and without
+:py:class:`GuiDispatcher`. Requires pytest-benchmark, run with::
+
+    pytest qthmi/ads/test/bench_ads.py
+
+The latency injected per ADS request is set in milliseconds by the
+environment variable ``QTHMI_ADS_LATENCY``. Besides the timing table of
+pytest-benchmark ADS requests per second, values per second, p50/p99 latency
+of a single call and the memory allocated by one call are reported at the
+end of the session and stored in the ``extra_info`` of the benchmark json.
+
+"""
+import asyncio
+import json
+import os
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List
+
+import pyads
+import pytest
+from fake_target import FakeADSTarget
+from qthmi.ads.aio import AsyncADSConnector
+from qthmi.ads.batch import MAX_SUM_REQUESTS, ADSPollGroup, ADSWriteBatch
+from qthmi.ads.connector import ADSConnector
+from qthmi.ads.dispatch import GuiDispatcher
+from qthmi.ads.gateway import ADSGateway, GatewayConnector
+from qthmi.ads.gui import ADSMapper
+from qthmi.ads.planner import ADSBlockReadGroup
+from qthmi.ads.table import TagTable, TagView
+from qthmi.ads.tags import TagDatabase
+
+
+SIZES = [10, 1000, 10000]
+TAGS = 5000
+WIDGETS = 2000
+CYCLES_PER_FRAME = 4
+LATENCY = float(os.environ.get("QTHMI_ADS_LATENCY", "0")) / 1000.0
+
+
+class GuiObject:
+    """Stand-in for a widget."""
+
+
+class ValueMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: GuiObject, value: Any) -> None:
+        pass
+
+
+class ValueView(TagView):
+    __slots__ = ()
+
+    def mapAdsToGui(self, guiObject: GuiObject, value: Any) -> None:
+        pass
+
+
+class LabelMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: Any, value: Any) -> None:
+        guiObject.setText(str(value))
+
+
+class Latencies:
+    """Durations of single calls measured during a benchmark."""
+
+    def __init__(self) -> None:
+        self.samples: List[float] = []
+
+    def call(self, function: Callable[..., Any], *args: Any) -> Any:
+        start = time.perf_counter()
+        result = function(*args)
+        self.samples.append(time.perf_counter() - start)
+        return result
+
+    def percentile(self, p: float) -> float:
+        samples = sorted(self.samples)
+        if not samples:
+            return 0.0
+        return samples[min(int(len(samples) * p / 100.0), len(samples) - 1)]
+
+
+@pytest.fixture(scope="session")
+def target(fake_device: FakeADSTarget) -> FakeADSTarget:
+    fake_device.latency = LATENCY
+    return fake_device
+
+
+@pytest.fixture(scope="session")
+def connector(target: FakeADSTarget) -> Iterator[ADSConnector]:
+    connector = ADSConnector(
+        pyads.AmsAddr(target.ams_net_id), target.ams_port, symbol_cache=None
+    )
+    yield connector
+    connector.close()
+
+
+def make_mappers(count: int) -> List[ValueMapper]:
+    return [
+        ValueMapper(2 * i, pyads.PLCTYPE_INT, GuiObject()) for i in range(count)
+    ]
+
+
+def run(
+    benchmark: Any,
+    target: FakeADSTarget,
+    metrics: List[Dict[str, Any]],
+    function: Callable[[], Any],
+    latencies: Latencies,
+    count: int,
+) -> None:
+    """Benchmark a function processing *count* mappers and record metrics."""
+    tracemalloc.start()
+    function()
+    allocated = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies.samples.clear()
+    requests = target.requests
+    start = time.perf_counter()
+    rounds = max(2, 500 // count)
+    benchmark.pedantic(function, rounds=rounds, iterations=1)
+    elapsed = time.perf_counter() - start
+    requests = target.requests - requests
+
+    info = {
+        "name": benchmark.name.split("[")[0],
+        "mappers": count,
+        "requests_per_second": requests / elapsed,
+        "values_per_second": count * rounds / elapsed,
+        "p50": latencies.percentile(50),
+        "p99": latencies.percentile(99),
+        "allocated": allocated,
+    }
+    benchmark.extra_info.update(info)
+    metrics.append(info)
+
+
+@pytest.mark.parametrize("count", SIZES)
+def test_connector_read_from_plc(
+    benchmark: Any, target: FakeADSTarget, connector: ADSConnector,
+    ads_metrics: List[Dict[str, Any]], count: int,
+) -> None:
+    latencies = Latencies()
+
+    def read() -> None:
+        for i in range(count):
+            latencies.call(connector.read_from_plc, 2 * i, pyads.PLCTYPE_INT)
+
+    run(benchmark, target, ads_metrics, read, latencies, count)
+
+
+@pytest.mark.parametrize("count", SIZES)
+def test_connector_write_to_plc(
+    benchmark: Any, target: FakeADSTarget, connector: ADSConnector,
+    ads_metrics: List[Dict[str, Any]], count: int,
+) -> None:
+    latencies = Latencies()
+
+    def write() -> None:
+        for i in range(count):
+            latencies.call(connector.write_to_plc, 2 * i, i, pyads.PLCTYPE_INT)
+
+    run(benchmark, target, ads_metrics, write, latencies, count)
+
+
+@pytest.mark.parametrize("count", SIZES)
+def test_mapper_read(
+    benchmark: Any, target: FakeADSTarget, connector: ADSConnector,
+    ads_metrics: List[Dict[str, Any]], count: int,
+) -> None:
+    latencies = Latencies()
+    mappers = make_mappers(count)
+
+    def read() -> None:
+        for mapper in mappers:
+            latencies.call(mapper.read, connector.ams_addr)
+
+    run(benchmark, target, ads_metrics, read, latencies, count)
+
+
+@pytest.mark.parametrize("count", SIZES)
+def test_mapper_write(
+    benchmark: Any, target: FakeADSTarget, connector: ADSConnector,
+    ads_metrics: List[Dict[str, Any]], count: int,
+) -> None:
+    latencies = Latencies()
+    mappers = make_mappers(count)
+
+    def write() -> None:
+        for i, mapper in enumerate(mappers):
+            latencies.call(mapper.write, connector.ams_addr, i)
+
+    run(benchmark, target, ads_metrics, write, latencies, count)
+
+
+@pytest.mark.parametrize("count", SIZES)
+def test_connector_read_list_from_plc(
+    benchmark: Any, target: FakeADSTarget, connector: ADSConnector,
+    ads_metrics: List[Dict[str, Any]], count: int,
+) -> None:
+    latencies = Latencies()
+    items = [(2 * i, pyads.PLCTYPE_INT) for i in range(count)]
+    run(
+        benchmark, target, ads_metrics,
+        lambda: latencies.call(connector.read_list_from_plc, items),
+        latencies, count,
+    )
+
+
+@pytest.mark.parametrize("count", SIZES)
+def test_connector_write_list_to_plc(
+    benchmark: Any, target: FakeADSTarget, connector: ADSConnector,
+    ads_metrics: List[Dict[str, Any]], count: int,
+) -> None:
+    latencies = Latencies()
+    items = [(2 * i, i, pyads.PLCTYPE_INT) for i in range(count)]
+    run(
+        benchmark, target, ads_metrics,
+        lambda: latencies.call(connector.write_list_to_plc, items),
+        latencies, count,
+    )
+
+
+@pytest.mark.parametrize("count", SIZES)
+def test_poll_group_read(
+    benchmark: Any, target: FakeADSTarget, connector: ADSConnector,
+    ads_metrics: List[Dict[str, Any]], count: int,
+) -> None:
+    latencies = Latencies()
+    group = ADSPollGroup(make_mappers(count))
+    run(
+        benchmark, target, ads_metrics,
+        lambda: latencies.call(group.read, connector.ams_addr),
+        latencies, count,
+    )
+
+
+@pytest.mark.parametrize("count", SIZES)
+def test_tag_table_poll(
+    benchmark: Any, target: FakeADSTarget, connector: ADSConnector,
+    ads_metrics: List[Dict[str, Any]], count: int,
+) -> None:
+    latencies = Latencies()
+    table = TagTable()
+    for i in range(count):
+        ValueView(table, 2 * i, pyads.PLCTYPE_INT, GuiObject())
+    run(
+        benchmark, target, ads_metrics,
+        lambda: latencies.call(table.poll, connector.ams_addr),
+        latencies, count,
+    )
+
+
+@pytest.mark.parametrize("count", SIZES)
+def test_block_read_group_read(
+    benchmark: Any, target: FakeADSTarget, connector: ADSConnector,
+    ads_metrics: List[Dict[str, Any]], count: int,
+) -> None:
+    latencies = Latencies()
+    group = ADSBlockReadGroup(make_mappers(count))
+    run(
+        benchmark, target, ads_metrics,
+        lambda: latencies.call(group.read, connector.ams_addr),
+        latencies, count,
+    )
+
+
+@pytest.mark.parametrize("count", SIZES)
+def test_write_batch(
+    benchmark: Any, target: FakeADSTarget, connector: ADSConnector,
+    ads_metrics: List[Dict[str, Any]], count: int,
+) -> None:
+    latencies = Latencies()
+    mappers = make_mappers(count)
+
+    def write() -> None:
+        batch = ADSWriteBatch(connector.ams_addr)
+        for i, mapper in enumerate(mappers):
+            batch.write(mapper, i)
+        latencies.call(batch.flush)
+
+    run(benchmark, target, ads_metrics, write, latencies, count)
+
+
+@pytest.mark.parametrize("count", SIZES)
+def test_async_read_from_plc(
+    benchmark: Any, target: FakeADSTarget,
+    ads_metrics: List[Dict[str, Any]], count: int,
+) -> None:
+    latencies = Latencies()
+    loop = asyncio.new_event_loop()
+    connector = AsyncADSConnector(
+        pyads.AmsAddr(target.ams_net_id), target.ams_port, symbol_cache=None
+    )
+
+    async def read() -> None:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            connector.read_from_plc(2 * i, pyads.PLCTYPE_INT)
+            for i in range(count)
+        ))
+        latencies.samples.append(time.perf_counter() - start)
+
+    try:
+        run(
+            benchmark, target, ads_metrics,
+            lambda: loop.run_until_complete(read()), latencies, count,
+        )
+    finally:
+        loop.run_until_complete(connector.close())
+        loop.close()
+
+
+@pytest.mark.parametrize("count", SIZES)
+def test_gateway_read_list_from_plc(
+    benchmark: Any, target: FakeADSTarget, tmp_path: Any,
+    ads_metrics: List[Dict[str, Any]], count: int,
+) -> None:
+    latencies = Latencies()
+    items = [(2 * i, pyads.PLCTYPE_INT) for i in range(count)]
+    path = str(tmp_path / "gateway.sock")
+    with ADSGateway(
+        pyads.AmsAddr(target.ams_net_id), target.ams_port, path,
+        symbol_cache=None,
+    ) as gateway:
+        gateway.start()
+        connector = GatewayConnector(path)
+        try:
+            run(
+                benchmark, target, ads_metrics,
+                lambda: latencies.call(connector.read_list_from_plc, items),
+                latencies, count,
+            )
+        finally:
+            connector.close()
+
+
+@pytest.mark.parametrize("cached", [False, True])
+def test_tag_startup(
+    benchmark: Any, tmp_path: Any, ads_metrics: List[Dict[str, Any]],
+    cached: bool,
+) -> None:
+    path = tmp_path / "tags.json"
+    path.write_text(json.dumps([
+        {"name": "tag%i" % i, "address": 2 * i, "type": "INT",
+         "scan": "fast" if i % 10 == 0 else "normal",
+         "screen": "screen%i" % (i // 100), "widget": "widget%i" % i}
+        for i in range(TAGS)
+    ]))
+    cache_dir = str(tmp_path / "cache") if cached else None
+    TagDatabase.load(str(path), cache_dir=cache_dir)
+
+    start = time.perf_counter()
+    rounds = 20
+    benchmark.pedantic(
+        TagDatabase.load, (str(path),), {"cache_dir": cache_dir},
+        rounds=rounds, iterations=1,
+    )
+    elapsed = time.perf_counter() - start
+
+    info = {
+        "name": "test_tag_startup[%s]" % ("cached" if cached else "uncached"),
+        "mappers": TAGS,
+        "requests_per_second": 0.0,
+        "values_per_second": TAGS * rounds / elapsed,
+        "p50": elapsed / rounds,
+        "p99": elapsed / rounds,
+        "allocated": 0,
+    }
+    benchmark.extra_info.update(info)
+    ads_metrics.append(info)
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_gui_dispatch(
+    benchmark: Any, ads_metrics: List[Dict[str, Any]], batched: bool,
+) -> None:
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication, QGridLayout, QLabel, QWidget
+
+    app = QApplication.instance() or QApplication([])
+    window = QWidget()
+    layout = QGridLayout(window)
+    mappers = []
+    for i in range(WIDGETS):
+        label = QLabel(window)
+        layout.addWidget(label, i // 40, i % 40)
+        mappers.append(LabelMapper(2 * i, pyads.PLCTYPE_INT, label))
+    window.show()
+    app.processEvents()
+    dispatcher = GuiDispatcher()
+    latencies = Latencies()
+    cycle = [0]
+
+    def show() -> None:
+        # cycles of a fast scan class arriving within one frame interval, the
+        # values of a cycle arrive in one event per sum read request, the
+        # dispatcher holds them until the frame interval has passed
+        start = time.perf_counter()
+        for _ in range(CYCLES_PER_FRAME):
+            cycle[0] += 1
+            for i in range(0, WIDGETS, MAX_SUM_REQUESTS):
+                chunk = mappers[i:i + MAX_SUM_REQUESTS]
+                if batched:
+                    dispatcher.submit_many((m, cycle[0]) for m in chunk)
+                else:
+                    for mapper in chunk:
+                        mapper.update(cycle[0])
+                    app.processEvents()
+        dispatcher.flush()
+        app.processEvents()
+        latencies.samples.append(time.perf_counter() - start)
+
+    try:
+        start = time.perf_counter()
+        rounds = 20
+        benchmark.pedantic(show, rounds=rounds, iterations=1)
+        elapsed = time.perf_counter() - start
+    finally:
+        window.close()
+        window.deleteLater()
+        app.processEvents()
+
+    info = {
+        "name": "test_gui_dispatch[%s]" % ("batched" if batched else "direct"),
+        "mappers": WIDGETS,
+        "requests_per_second": 0.0,
+        "values_per_second": WIDGETS * rounds / elapsed,
+        "p50": latencies.percentile(50),
+        "p99": latencies.percentile(99),
+        "allocated": 0,
+    }
+    benchmark.extra_info.update(info)
+    ads_metrics.append(info)
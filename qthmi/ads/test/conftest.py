@@ -0,0 +1,82 @@
+"""Fixtures of the ADS tests and report of the ADS benchmarks.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+All tests and benchmarks of a session share one :py:class:`FakeADSTarget`,
+the tests get it with cleared memory by the ``target`` fixture.
+
+"""
+import os
+from typing import Any, Dict, Iterator, List
+
+import pyads
+import pytest
+from PyQt5.QtWidgets import QApplication
+from fake_target import FakeADSTarget
+from qthmi.ads.ports import close_port, open_port
+
+
+#: metrics of the benchmarks run in this session
+METRICS: List[Dict[str, Any]] = []
+
+
+@pytest.fixture(scope="session")
+def fake_device() -> Iterator[FakeADSTarget]:
+    """Fake ADS device running during the session."""
+    with FakeADSTarget() as target:
+        yield target
+
+
+@pytest.fixture
+def target(fake_device: FakeADSTarget) -> FakeADSTarget:
+    """Fake ADS device with cleared memory, no symbols, no datatypes and no
+    failing addresses."""
+    fake_device.memory[:] = bytes(len(fake_device.memory))
+    fake_device.symbols = {}
+    fake_device.datatypes = {}
+    fake_device.references = {}
+    fake_device.failing.clear()
+    fake_device.sources.clear()
+    fake_device.latency = 0.0
+    return fake_device
+
+
+@pytest.fixture
+def adr(target: FakeADSTarget) -> Iterator[pyads.AmsAddr]:
+    """Address of the fake ADS device, the shared port is open."""
+    open_port()
+    yield target.ams_addr
+    close_port()
+
+
+@pytest.fixture(scope="session")
+def qapp() -> QApplication:
+    """Application running the Qt event loop of the tests."""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture(scope="session")
+def ads_metrics() -> List[Dict[str, Any]]:
+    """List collecting the metrics of the benchmarks."""
+    return METRICS
+
+
+def pytest_terminal_summary(terminalreporter: Any) -> None:
+    if not METRICS:
+        return
+    terminalreporter.section("ADS benchmark metrics")
+    terminalreporter.write_line(
+        "%-42s %8s %10s %10s %10s %10s %12s" % (
+            "benchmark", "mappers", "req/s", "values/s",
+            "p50 [ms]", "p99 [ms]", "alloc [kB]",
+        )
+    )
+    for m in METRICS:
+        terminalreporter.write_line(
+            "%-42s %8i %10.0f %10.0f %10.3f %10.3f %12.1f" % (
+                m["name"], m["mappers"], m["requests_per_second"],
+                m["values_per_second"], m["p50"] * 1e3, m["p99"] * 1e3,
+                m["allocated"] / 1024.0,
+            )
+        )
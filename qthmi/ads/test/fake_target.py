@@ -0,0 +1,507 @@
+"""In-process fake ADS device for benchmarks and tests without a plc.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+The :py:class:`FakeADSTarget` is a small AMS/TCP server answering read,
+write, sum read, sum write, read state, symbol and datatype upload and
+variable handle requests from a plc memory image. A latency can be
+injected per request to emulate a real network, and addresses can be set to
+fail. On-change device notifications of the memory area are sent after
+every write request and by :py:meth:`FakeADSTarget.notify`.
+
+The test server of pyads is not used as it reads at most 4096 bytes per
+request, too few for large sum commands.
+
+Only Linux is supported, the route to the fake device is added to the ADS
+router of pyads.
+
+"""
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+import pyads
+from pyads import constants
+
+
+#: error codes returned by the fake device
+ERR_INVALID_GROUP = 0x702
+ERR_INVALID_OFFSET = 0x703
+ERR_SYMBOL_NOT_FOUND = 0x710
+ERR_INVALID_NOTIFICATION = 0x714
+ERR_TIMEOUT = 0x745
+
+ADSIGRP_SUMUP_READ = 0xF080
+ADSIGRP_SUMUP_WRITE = 0xF081
+ADSIGRP_SYM_HNDBYNAME = 0xF003
+ADSIGRP_SYM_VALBYHND = 0xF005
+ADSIGRP_SYM_RELEASEHND = 0xF006
+ADSIGRP_SYM_VERSION = 0xF008
+ADSIGRP_SYM_UPLOAD = 0xF00B
+ADSIGRP_SYM_DT_UPLOAD = 0xF00E
+ADSIGRP_SYM_UPLOADINFO2 = 0xF00F
+
+#: symbol of the fake device: (index group, index offset, size, type name)
+SYMBOL_TYPE = Tuple[int, int, int, str]
+
+#: member of a datatype: (name, offset, size, type name)
+MEMBER_TYPE = Tuple[str, int, int, str]
+
+#: delay in seconds of the first sample of a new notification
+NOTIFICATION_DELAY = 0.05
+
+_TCP_HEADER = struct.Struct("<HI")
+_AMS_HEADER = struct.Struct("<6sH6sHHHIII")
+
+#: difference between the FILETIME epoch 1601 and the unix epoch in 100 ns
+_FILETIME_EPOCH = 116444736000000000
+
+
+class _Notification(NamedTuple):
+    """Device notification registered by a client."""
+
+    connection: socket.socket
+    client: Tuple[bytes, int]  #: AMS net id and port of the client
+    device: Tuple[bytes, int]  #: AMS net id and port of the device
+    group: int
+    offset: int
+    length: int
+
+
+def _symbol_entry(name: str, symbol: SYMBOL_TYPE) -> bytes:
+    group, offset, size, type_name = symbol
+    body = name.encode() + b"\x00" + type_name.encode() + b"\x00" + b"\x00"
+    return struct.pack(
+        "<6I3H", 30 + len(body), group, offset, size, 0, 0,
+        len(name), len(type_name), 0,
+    ) + body
+
+
+def _datatype_entry(
+    name: str, size: int, members: List[MEMBER_TYPE], offset: int = 0,
+    type_name: str = "",
+) -> bytes:
+    body = name.encode() + b"\x00" + type_name.encode() + b"\x00" + b"\x00"
+    body += b"".join(
+        _datatype_entry(m_name, m_size, [], m_offset, m_type)
+        for m_name, m_offset, m_size, m_type in members
+    )
+    return struct.pack(
+        "<8I5H", 42 + len(body), 1, 0, 0, size, offset, 0, 0,
+        len(name), len(type_name), 0, 0, len(members),
+    ) + body
+
+
+class FakeADSTarget:
+    """Fake ADS device answering requests from a memory image.
+
+    :param int memory_size: size of the memory area in bytes
+    :param float latency: delay in seconds added to every request
+    :param symbols: symbol table of the device, name as key
+    :param datatypes: datatype table of the device, tuples of size and list
+        of members with the datatype name as key
+    :param str ams_net_id: AMS net id of the device
+    :param int ams_port: AMS port of the device
+    :param int tcp_port: TCP port of the test server
+    :param str ip_address: loopback address of the test server, the ADS
+        router connects to one device per ip address
+
+    :ivar bytearray memory: memory area, index group
+        ``INDEXGROUP_MEMORYBYTE`` and ``INDEXGROUP_MEMORYBIT``
+    :ivar failing: set of (index group, index offset) tuples answered
+        with a timeout error
+    :ivar references: variables only accessible by handle, e.g. references
+        and array elements, missing in the symbol table, name as key
+    :ivar int requests: number of answered requests
+    :ivar int notifications: number of sent notification samples
+    :ivar sources: AMS ports the requests have been sent from
+
+    Sample code::
+
+    >>> with FakeADSTarget(latency=0.001) as target:
+    >>>     connector = ADSConnector(pyads.AmsAddr(target.ams_net_id),
+    >>>                              target.ams_port)
+    >>>     connector.read_from_plc(0, pyads.PLCTYPE_INT)
+
+    """
+
+    def __init__(
+        self,
+        memory_size: int = 65536,
+        latency: float = 0.0,
+        symbols: Dict[str, SYMBOL_TYPE] = None,
+        datatypes: Dict[str, Tuple[int, List[MEMBER_TYPE]]] = None,
+        ams_net_id: str = "127.0.0.1.1.1",
+        ams_port: int = 851,
+        tcp_port: int = 48898,
+        ip_address: str = "127.0.0.1",
+    ) -> None:
+        self.memory = bytearray(memory_size)
+        self.latency = latency
+        self.symbols = symbols or {}
+        self.datatypes = datatypes or {}
+        self.references: Dict[str, SYMBOL_TYPE] = {}
+        self.ams_net_id = ams_net_id
+        self.ams_port = ams_port
+        self.tcp_port = tcp_port
+        self.ip_address = ip_address
+        self.failing: Set[Tuple[int, int]] = set()
+        self.requests = 0
+        self.notifications = 0
+        self.sources: Set[int] = set()
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._notifications: Dict[int, _Notification] = {}
+        self._sent: Dict[int, bytes] = {}
+        self._next_handle = 1
+        self._handles: Dict[int, SYMBOL_TYPE] = {}
+        self._server: Optional[socketserver.ThreadingTCPServer] = None
+        self._connections: Set[socket.socket] = set()
+
+    @property
+    def ams_addr(self) -> pyads.AmsAddr:
+        """AMS address of the fake device."""
+        return pyads.AmsAddr(self.ams_net_id, self.ams_port)
+
+    def __enter__(self) -> "FakeADSTarget":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type: object, exc_value: object, tb: object) -> None:
+        self.stop()
+
+    def start(self, timeout: float = 5.0) -> None:
+        """Start the server and add the route to the fake device.
+
+        :param float timeout: maximum time in seconds to wait for the server
+
+        """
+        target = self
+
+        class Handler(socketserver.BaseRequestHandler):
+
+            def handle(self) -> None:
+                target._serve(self.request)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._server = socketserver.ThreadingTCPServer(
+                    (self.ip_address, self.tcp_port), Handler
+                )
+                break
+            except OSError:
+                # port still in use by a previous server
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        self._server.daemon_threads = True
+        threading.Thread(
+            target=self._server.serve_forever, name="FakeADSTarget", daemon=True
+        ).start()
+        pyads.add_route(self.ams_addr, self.ip_address)
+
+    def stop(self) -> None:
+        """Stop the server and close the open connections, like a plc that
+        has been switched off.
+
+        The route is deleted, the ADS router of pyads does not reconnect a
+        closed connection otherwise. Requests fail with a connection error
+        until :py:meth:`start` adds the route again.
+
+        """
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        with self._lock:
+            connections, self._connections = self._connections, set()
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            connection.close()
+        pyads.delete_route(self.ams_addr)
+
+    def read(self, group: int, offset: int, length: int) -> Tuple[int, bytes]:
+        """Answer a read request.
+
+        :return: tuple of error code and data
+
+        """
+        if (group, offset) in self.failing:
+            return ERR_TIMEOUT, bytes(length)
+        if group == pyads.INDEXGROUP_MEMORYBYTE:
+            if offset + length > len(self.memory):
+                return ERR_INVALID_OFFSET, bytes(length)
+            return 0, bytes(self.memory[offset:offset + length])
+        if group == pyads.INDEXGROUP_MEMORYBIT:
+            byte, bit = divmod(offset, 8)
+            return 0, bytes([(self.memory[byte] >> bit) & 1]).ljust(length, b"\x00")
+        if group == ADSIGRP_SYM_VALBYHND:
+            if offset not in self._handles:
+                return ERR_SYMBOL_NOT_FOUND, bytes(length)
+            group, offset, _, _ = self._handles[offset]
+            return self.read(group, offset, length)
+        if group == ADSIGRP_SYM_VERSION:
+            return 0, b"\x01"[:length]
+        if group == ADSIGRP_SYM_UPLOADINFO2:
+            info = struct.pack(
+                "<6I", len(self.symbols), len(self._symbol_table()),
+                len(self.datatypes), len(self._datatype_table()), 0, 0,
+            )
+            return 0, info[:length]
+        if group == ADSIGRP_SYM_UPLOAD:
+            return 0, self._symbol_table()[:length]
+        if group == ADSIGRP_SYM_DT_UPLOAD:
+            return 0, self._datatype_table()[:length]
+        return ERR_INVALID_GROUP, bytes(length)
+
+    def write(self, group: int, offset: int, data: bytes) -> int:
+        """Answer a write request.
+
+        :return: error code
+
+        """
+        if (group, offset) in self.failing:
+            return ERR_TIMEOUT
+        if group == pyads.INDEXGROUP_MEMORYBYTE:
+            if offset + len(data) > len(self.memory):
+                return ERR_INVALID_OFFSET
+            self.memory[offset:offset + len(data)] = data
+            return 0
+        if group == pyads.INDEXGROUP_MEMORYBIT:
+            byte, bit = divmod(offset, 8)
+            if data[:1] != b"\x00":
+                self.memory[byte] |= 1 << bit
+            else:
+                self.memory[byte] &= ~(1 << bit) & 0xFF
+            return 0
+        if group == ADSIGRP_SYM_VALBYHND:
+            if offset not in self._handles:
+                return ERR_SYMBOL_NOT_FOUND
+            group, offset, _, _ = self._handles[offset]
+            return self.write(group, offset, data)
+        if group == ADSIGRP_SYM_RELEASEHND:
+            handle, = struct.unpack_from("<I", data)
+            if self._handles.pop(handle, None) is None:
+                return ERR_SYMBOL_NOT_FOUND
+            return 0
+        return ERR_INVALID_GROUP
+
+    def notify(self) -> int:
+        """Send the notifications of changed values.
+
+        Writes by ADS requests are notified automatically, call this after
+        changing :py:attr:`memory` directly.
+
+        :return: number of sent notification samples
+
+        """
+        with self._lock:
+            changed = []
+            for handle, notification in self._notifications.items():
+                err, data = self.read(
+                    notification.group, notification.offset, notification.length
+                )
+                if err or self._sent.get(handle) == data:
+                    continue
+                self._sent[handle] = data
+                changed.append((handle, notification, data))
+            self.notifications += len(changed)
+
+        timestamp = int(time.time() * 1e7) + _FILETIME_EPOCH
+        for handle, notification, data in changed:
+            sample = struct.pack("<II", handle, len(data)) + data
+            stamp = struct.pack("<QI", timestamp, 1) + sample
+            stream = struct.pack("<II", 4 + len(stamp), 1) + stamp
+            try:
+                self._send(
+                    notification.connection, notification.device,
+                    notification.client, constants.ADSCOMMAND_DEVICENOTE,
+                    4, 0, stream,
+                )
+            except OSError:
+                # the client is gone, its notifications are dropped with
+                # the connection
+                pass
+        return len(changed)
+
+    def _add_notification(
+        self,
+        data: bytes,
+        client: Tuple[bytes, int],
+        device: Tuple[bytes, int],
+        connection: socket.socket,
+    ) -> Tuple[int, bytes]:
+        group, offset, length = struct.unpack_from("<3I", data)
+        if (group, offset) in self.failing:
+            return ERR_TIMEOUT, struct.pack("<I", 0)
+        handle = self._next_handle
+        self._next_handle += 1
+        self._notifications[handle] = _Notification(
+            connection, client, device, group, offset, length
+        )
+        return 0, struct.pack("<I", handle)
+
+    def _symbol_table(self) -> bytes:
+        return b"".join(
+            _symbol_entry(name, symbol) for name, symbol in self.symbols.items()
+        )
+
+    def _datatype_table(self) -> bytes:
+        return b"".join(
+            _datatype_entry(name, size, members)
+            for name, (size, members) in self.datatypes.items()
+        )
+
+    def _read_write(self, group: int, offset: int, data: bytes) -> Tuple[int, bytes]:
+        count = offset
+        if group == ADSIGRP_SYM_HNDBYNAME:
+            name = data.rstrip(b"\x00").decode().upper()
+            variables = {
+                n.upper(): s for n, s in {**self.symbols, **self.references}.items()
+            }
+            if name not in variables:
+                return ERR_SYMBOL_NOT_FOUND, b""
+            handle = self._next_handle
+            self._next_handle += 1
+            self._handles[handle] = variables[name]
+            return 0, struct.pack("<I", handle)
+        if group == ADSIGRP_SUMUP_READ:
+            errors, results = [], []
+            for i in range(count):
+                g, o, n = struct.unpack_from("<3I", data, 12 * i)
+                err, result = self.read(g, o, n)
+                errors.append(err)
+                results.append(result)
+            return 0, struct.pack("<%iI" % count, *errors) + b"".join(results)
+        if group == ADSIGRP_SUMUP_WRITE:
+            position = 12 * count
+            errors = []
+            for i in range(count):
+                g, o, n = struct.unpack_from("<3I", data, 12 * i)
+                errors.append(self.write(g, o, data[position:position + n]))
+                position += n
+            return 0, struct.pack("<%iI" % count, *errors)
+        return ERR_INVALID_GROUP, b""
+
+    def _serve(self, connection: socket.socket) -> None:
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self._lock:
+            self._connections.add(connection)
+        try:
+            self._serve_requests(connection)
+        finally:
+            with self._lock:
+                self._connections.discard(connection)
+                for handle, notification in list(self._notifications.items()):
+                    if notification.connection is connection:
+                        del self._notifications[handle]
+                        self._sent.pop(handle, None)
+
+    def _serve_requests(self, connection: socket.socket) -> None:
+        while True:
+            header = _receive(connection, _TCP_HEADER.size)
+            if header is None:
+                return
+            packet = _receive(connection, _TCP_HEADER.unpack(header)[1])
+            if packet is None:
+                return
+            (target_id, target_port, source_id, source_port, command,
+             state, _, _, invoke_id) = _AMS_HEADER.unpack_from(packet)
+            data = packet[_AMS_HEADER.size:]
+            self.sources.add(source_port)
+
+            if self.latency:
+                time.sleep(self.latency)
+            response = self._handle(
+                command, data, (source_id, source_port),
+                (target_id, target_port), connection,
+            )
+            self._send(
+                connection, (target_id, target_port), (source_id, source_port),
+                command, state | 1, invoke_id, response,
+            )
+            if command in (
+                constants.ADSCOMMAND_WRITE, constants.ADSCOMMAND_READWRITE
+            ):
+                self.notify()
+            elif command == constants.ADSCOMMAND_ADDDEVICENOTE:
+                # the first sample follows after a cycle, the ADS router
+                # drops notifications arriving before it knows the handle
+                timer = threading.Timer(NOTIFICATION_DELAY, self.notify)
+                timer.daemon = True
+                timer.start()
+
+    def _send(
+        self,
+        connection: socket.socket,
+        source: Tuple[bytes, int],
+        target: Tuple[bytes, int],
+        command: int,
+        state: int,
+        invoke_id: int,
+        data: bytes,
+    ) -> None:
+        ams = _AMS_HEADER.pack(
+            target[0], target[1], source[0], source[1], command, state,
+            len(data), 0, invoke_id,
+        ) + data
+        with self._send_lock:
+            connection.sendall(_TCP_HEADER.pack(0, len(ams)) + ams)
+
+    def _handle(
+        self,
+        command: int,
+        data: bytes,
+        client: Tuple[bytes, int],
+        device: Tuple[bytes, int],
+        connection: socket.socket,
+    ) -> bytes:
+        with self._lock:
+            self.requests += 1
+            err, content = 0, b""
+            if command == constants.ADSCOMMAND_READ:
+                group, offset, length = struct.unpack_from("<3I", data)
+                err, result = self.read(group, offset, length)
+                content = struct.pack("<I", len(result)) + result
+            elif command == constants.ADSCOMMAND_WRITE:
+                group, offset, length = struct.unpack_from("<3I", data)
+                err = self.write(group, offset, data[12:12 + length])
+            elif command == constants.ADSCOMMAND_READWRITE:
+                group, offset, _, length = struct.unpack_from("<4I", data)
+                err, result = self._read_write(group, offset, data[16:16 + length])
+                content = struct.pack("<I", len(result)) + result
+            elif command == constants.ADSCOMMAND_READSTATE:
+                content = struct.pack("<HH", constants.ADSSTATE_RUN, 0)
+            elif command == constants.ADSCOMMAND_ADDDEVICENOTE:
+                err, content = self._add_notification(
+                    data, client, device, connection
+                )
+            elif command == constants.ADSCOMMAND_DELDEVICENOTE:
+                handle, = struct.unpack_from("<I", data)
+                if self._notifications.pop(handle, None) is None:
+                    err = ERR_INVALID_NOTIFICATION
+                self._sent.pop(handle, None)
+        return struct.pack("<I", err) + content
+
+
+def _receive(connection: socket.socket, size: int) -> Optional[bytes]:
+    # receive exactly size bytes, None if the connection was closed
+    data = b""
+    while len(data) < size:
+        try:
+            chunk = connection.recv(size - len(data))
+        except OSError:
+            return None
+        if not chunk:
+            return None
+        data += chunk
+    return data
@@ -6,14 +6,25 @@ Created on 25.03.2013
 import sys
 import pyads
 from PyQt5.QtWidgets import QDialog, QCheckBox, QVBoxLayout, QApplication
+from qthmi.ads.gui import ADSMapper
+from qthmi.ads.worker import ADSWorker
+
+
+class CheckBoxMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject, value):
+        guiObject.blockSignals(True)
+        guiObject.setChecked(bool(value))
+        guiObject.blockSignals(False)
 
 
 class MainForm(QDialog):
 
     def _initADS(self):
-        self.adsPort = pyads.open_port()
         self.adsAdr = pyads.get_local_address()
         self.adsAdr.port = 5000
+        self.worker = ADSWorker(self.adsAdr, self)
+        self.worker.start()
 
     def __init__(self, parent=None):
         super(MainForm, self).__init__(parent)
@@ -22,48 +33,30 @@ class MainForm(QDialog):
         self._initADS()
 
         # Elemente
-        bit1CheckBox = QCheckBox("Bit1")
-        (errCode, bit1) = pyads.read(
-            self.adsAdr, pyads.INDEXGROUP_MEMORYBIT, 100 * 8 + 0,
-            pyads.PLCTYPE_BOOL
-        )
-
-        if errCode == 0:
-            bit1CheckBox.setChecked(bit1)
-
-        bit2CheckBox = QCheckBox("Bit2")
-        (errCode, bit2) = pyads.read(
-            self.adsAdr, pyads.INDEXGROUP_MEMORYBIT, 100 * 8 + 1,
-            pyads.PLCTYPE_BOOL
-        )
-
-        if errCode == 0:
-            bit2CheckBox.setChecked(bit2)
-
-        bit3CheckBox = QCheckBox("Bit3")
-        (errCode, bit3) = pyads.read(
-            self.adsAdr, pyads.INDEXGROUP_MEMORYBIT, 100 * 8 + 2,
-            pyads.PLCTYPE_BOOL
-        )
-
-        if errCode == 0:
-            bit3CheckBox.setChecked(bit3)
-
-        bit4CheckBox = QCheckBox("Bit4")
-        (errCode, bit4) = pyads.read(
-            self.adsAdr, pyads.INDEXGROUP_MEMORYBIT, 100 * 8 + 3,
-            pyads.PLCTYPE_BOOL
-        )
-
-        if errCode == 0:
-            bit4CheckBox.setChecked(bit4)
+        self.bit1CheckBox = QCheckBox("Bit1")
+        self.bit2CheckBox = QCheckBox("Bit2")
+        self.bit3CheckBox = QCheckBox("Bit3")
+        self.bit4CheckBox = QCheckBox("Bit4")
+
+        self.bit1Mapper = CheckBoxMapper(
+            100 * 8 + 0, pyads.PLCTYPE_BOOL, self.bit1CheckBox)
+        self.bit2Mapper = CheckBoxMapper(
+            100 * 8 + 1, pyads.PLCTYPE_BOOL, self.bit2CheckBox)
+        self.bit3Mapper = CheckBoxMapper(
+            100 * 8 + 2, pyads.PLCTYPE_BOOL, self.bit3CheckBox)
+        self.bit4Mapper = CheckBoxMapper(
+            100 * 8 + 3, pyads.PLCTYPE_BOOL, self.bit4CheckBox)
+
+        # Werte im Hintergrund lesen
+        self.worker.read_all([self.bit1Mapper, self.bit2Mapper,
+                              self.bit3Mapper, self.bit4Mapper])
 
         # Layout
         layout = QVBoxLayout()
-        layout.addWidget(bit1CheckBox)
-        layout.addWidget(bit2CheckBox)
-        layout.addWidget(bit3CheckBox)
-        layout.addWidget(bit4CheckBox)
+        layout.addWidget(self.bit1CheckBox)
+        layout.addWidget(self.bit2CheckBox)
+        layout.addWidget(self.bit3CheckBox)
+        layout.addWidget(self.bit4CheckBox)
         self.setLayout(layout)
 
         # Signale
@@ -72,24 +65,21 @@ class MainForm(QDialog):
         self.bit3CheckBox.stateChanged.connect(self.bit3CheckBox_stateChanged)
         self.bit4CheckBox.stateChanged.connect(self.bit4CheckBox_stateChanged)
 
-    def __del__(self):
-        pyads.close_port()
+    def closeEvent(self, event):
+        self.worker.stop()
+        super(MainForm, self).closeEvent(event)
 
     def bit1CheckBox_stateChanged(self, state):
-        pyads.write(self.adsAdr, pyads.INDEXGROUP_MEMORYBIT,
-                    100 * 8 + 0, state, pyads.PLCTYPE_BOOL)
+        self.worker.write(self.bit1Mapper, bool(state))
 
     def bit2CheckBox_stateChanged(self, state):
-        pyads.write(self.adsAdr, pyads.INDEXGROUP_MEMORYBIT,
-                    100 * 8 + 1, state, pyads.PLCTYPE_BOOL)
+        self.worker.write(self.bit2Mapper, bool(state))
 
     def bit3CheckBox_stateChanged(self, state):
-        pyads.write(self.adsAdr, pyads.INDEXGROUP_MEMORYBIT,
-                    100 * 8 + 2, state, pyads.PLCTYPE_BOOL)
+        self.worker.write(self.bit3Mapper, bool(state))
 
     def bit4CheckBox_stateChanged(self, state):
-        pyads.write(self.adsAdr, pyads.INDEXGROUP_MEMORYBIT,
-                    100 * 8 + 3, state, pyads.PLCTYPE_BOOL)
+        self.worker.write(self.bit4Mapper, bool(state))
 
 
 if __name__ == "__main__":
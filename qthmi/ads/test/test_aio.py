@@ -0,0 +1,46 @@
+"""Tests of the asyncio client.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import asyncio
+import struct
+
+import pyads
+from fake_target import FakeADSTarget
+from qthmi.ads.aio import AsyncADSConnector
+
+
+def test_async_connector(target: FakeADSTarget) -> None:
+    struct.pack_into("<hh", target.memory, 0, 1, 2)
+
+    async def run() -> None:
+        async with AsyncADSConnector(
+            target.ams_addr, target.ams_port, symbol_cache=None
+        ) as plc:
+            assert await plc.read_from_plc(0, pyads.PLCTYPE_INT) == 1
+            await plc.write_list_to_plc([(4, 3, pyads.PLCTYPE_INT)])
+            assert await plc.read_list_from_plc([
+                (2, pyads.PLCTYPE_INT), (4, pyads.PLCTYPE_INT)
+            ]) == [2, 3]
+
+    asyncio.run(asyncio.wait_for(run(), 10.0))
+
+
+def test_subscribe(target: FakeADSTarget) -> None:
+    struct.pack_into("<h", target.memory, 0, 5)
+
+    async def run() -> None:
+        async with AsyncADSConnector(
+            target.ams_addr, target.ams_port, symbol_cache=None
+        ) as plc:
+            values = plc.subscribe(0, pyads.PLCTYPE_INT)
+            assert await values.__anext__() == 5
+            await plc.write_to_plc(0, 6, pyads.PLCTYPE_INT)
+            assert await values.__anext__() == 6
+            await values.aclose()
+
+    asyncio.run(asyncio.wait_for(run(), 10.0))
+    # the notification has been deleted
+    target.write(pyads.INDEXGROUP_MEMORYBYTE, 0, struct.pack("<h", 7))
+    assert target.notify() == 0
@@ -0,0 +1,99 @@
+"""Tests of the array and structure mappers.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import struct
+from typing import Any, Dict
+
+import numpy as np
+import pyads
+import pytest
+from fake_target import FakeADSTarget
+from qthmi.ads.arrays import ADSArrayMapper, ADSStructMapper
+from qthmi.ads.symbols import HandlePool, SymbolTable
+
+MEMORY = pyads.INDEXGROUP_MEMORYBYTE
+AXIS = np.dtype([("bEnable", "?"), ("fActPos", "<f8")], align=True)
+
+
+class GuiObject:
+    """Stand-in for a widget."""
+
+    value: Any = None
+
+
+class ArrayMapper(ADSArrayMapper):
+
+    def mapAdsToGui(self, guiObject: GuiObject, value: Any) -> None:
+        guiObject.value = value
+
+
+class StructMapper(ADSStructMapper):
+
+    def mapAdsToGui(self, guiObject: GuiObject, value: Any) -> None:
+        guiObject.value = value
+
+
+def test_decode(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    struct.pack_into("<6h", target.memory, 0, 1, 2, 3, 4, 5, 6)
+    struct.pack_into("<?7xd", target.memory, 16, True, 2.5)
+    plot = GuiObject()
+    array = ArrayMapper(0, "<i2", (2, 3), [plot])
+    axis = StructMapper(16, AXIS, [GuiObject()])
+
+    array.read(adr)
+    axis.read(adr)
+    assert plot.value.tolist() == [[1, 2, 3], [4, 5, 6]]
+    assert array.shape == (2, 3)
+    assert axis.field("fActPos") == 2.5
+    assert axis.field("bEnable")
+
+
+def test_write_part(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    struct.pack_into("<4f", target.memory, 0, 1, 2, 3, 4)
+    array = ArrayMapper(0, "<f4", 4, [GuiObject()])
+    axis = StructMapper(16, AXIS, [GuiObject()])
+
+    # parts are written without reading the block before
+    array.writeElement(adr, 2, 7.5)
+    axis.writeField(adr, "fActPos", 1.5)
+    assert struct.unpack_from("<4f", target.memory, 0) == (1, 2, 7.5, 4)
+    assert struct.unpack_from("<d", target.memory, 24) == (1.5,)
+    assert array.currentValue is None
+
+    array.read(adr)
+    shown = array.currentValue
+    array.writeElement(adr, 0, 5.0)
+    assert array.currentValue.tolist() == [5, 2, 7.5, 4]  # type: ignore
+    assert shown.tolist() == [1, 2, 7.5, 4]  # type: ignore
+    assert array.hasChanged(array.currentValue)
+
+
+def test_write_part_by_handle(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    target.references = {"MAIN.aValues": (MEMORY, 200, 8, "ARRAY [0..3] OF INT")}
+    struct.pack_into("<4h", target.memory, 200, 1, 2, 3, 4)
+    array = ArrayMapper("MAIN.aValues", "<i2", 4, [GuiObject()])
+    array.resolve(SymbolTable({}), HandlePool(adr))
+
+    # the handle addresses the whole array, there is no offset of an element
+    with pytest.raises(Exception, match="not been read"):
+        array.writeElement(adr, 1, 9)
+    array.read(adr)
+    array.writeElement(adr, 1, 9)
+    assert struct.unpack_from("<4h", target.memory, 200) == (1, 9, 3, 4)
+    assert array.currentValue.tolist() == [1, 9, 3, 4]  # type: ignore
+
+
+def test_key_objects(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    struct.pack_into("<?7xd", target.memory, 0, True, 3.0)
+    objects: Dict[str, GuiObject] = {"fActPos": GuiObject(), "bEnable": GuiObject()}
+    axis = StructMapper(0, AXIS, objects)
+    array = ArrayMapper(0, "<u1", 2, {1: GuiObject()})
+
+    axis.read(adr)
+    array.read(adr)
+    assert objects["fActPos"].value == 3.0
+    assert objects["bEnable"].value
+    assert array.keyObjects[1].value == 0
+    assert len(axis.guiObjects) == 2
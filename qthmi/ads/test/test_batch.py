@@ -0,0 +1,199 @@
+"""Tests of the ADS sum read and sum write requests.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import struct
+from typing import Any, List
+
+import pyads
+import pytest
+from fake_target import ERR_TIMEOUT, FakeADSTarget
+from qthmi.main.connector import ConnectionError
+from qthmi.ads import batch
+from qthmi.ads.batch import (
+    ERR_REQUEST_FAILED, ADSPollGroup, ADSWriteBatch, sum_read, sum_write
+)
+from qthmi.ads.connector import ADSConnector
+from qthmi.ads.gui import ADSMapper
+from qthmi.ads.quality import ERR_SYMBOL_NOT_FOUND, QUALITY_BAD, QUALITY_GOOD
+
+MEMORY = pyads.INDEXGROUP_MEMORYBYTE
+
+
+class GuiObject:
+    """Stand-in for a widget."""
+
+    value: Any = None
+
+
+class ValueMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: GuiObject, value: Any) -> None:
+        guiObject.value = value
+
+
+def make_mappers(count: int) -> List[ValueMapper]:
+    return [
+        ValueMapper(2 * i, pyads.PLCTYPE_INT, GuiObject()) for i in range(count)
+    ]
+
+
+def test_sum_read(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    struct.pack_into("<hhd", target.memory, 0, 7, -3, 2.5)
+    target.failing.add((MEMORY, 2))
+
+    results = sum_read(adr, [(MEMORY, 0, 2), (MEMORY, 2, 2), (MEMORY, 4, 8)])
+
+    assert [err for err, _ in results] == [0, ERR_TIMEOUT, 0]
+    assert bytes(results[0][1]) == struct.pack("<h", 7)
+    assert bytes(results[2][1]) == struct.pack("<d", 2.5)
+
+
+def test_sum_read_split(
+    target: FakeADSTarget, adr: pyads.AmsAddr, monkeypatch: Any
+) -> None:
+    target.memory[:64] = bytes(range(64))
+    requests = [(MEMORY, 8 * i, 8) for i in range(8)]
+    monkeypatch.setattr(batch, "MAX_SUM_RESPONSE", 30)
+
+    count = target.requests
+    results = sum_read(adr, requests)
+
+    # 12 bytes of error code and data per item, two items per request
+    assert target.requests - count == 4
+    assert [bytes(data) for _, data in results] == [
+        bytes(range(8 * i, 8 * i + 8)) for i in range(8)
+    ]
+
+
+def test_sum_read_response_limit(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    # responses beyond the frame of the ADS router of pyads are split
+    target.memory[:8000] = bytes(range(250)) * 32
+    requests = [(MEMORY, 0, 4000), (MEMORY, 4000, 4000)]
+
+    count = target.requests
+    results = sum_read(adr, requests)
+
+    assert target.requests - count == 2
+    assert b"".join(bytes(data) for _, data in results) == target.memory[:8000]
+
+
+def test_sum_write(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    target.failing.add((MEMORY, 2))
+
+    errors = sum_write(adr, [
+        (MEMORY, 0, struct.pack("<h", 5)),
+        (MEMORY, 2, struct.pack("<h", 6)),
+        (MEMORY, 4, struct.pack("<h", 7)),
+    ])
+
+    assert errors == [0, ERR_TIMEOUT, 0]
+    assert struct.unpack_from("<3h", target.memory) == (5, 0, 7)
+
+
+def test_poll_group(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    mappers = make_mappers(5)
+    struct.pack_into("<5h", target.memory, 0, 1, 2, 3, 4, 5)
+    group = ADSPollGroup(mappers, max_requests=2)
+
+    count = target.requests
+    assert group.read(adr) == [1, 2, 3, 4, 5]
+    assert target.requests - count == 3
+    assert [m.guiObjects.value for m in mappers] == [1, 2, 3, 4, 5]
+    assert all(m.quality == QUALITY_GOOD for m in mappers)
+
+
+def test_poll_group_item_error(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    mappers = make_mappers(3)
+    group = ADSPollGroup(mappers)
+    group.read(adr)
+    struct.pack_into("<3h", target.memory, 0, 1, 2, 3)
+    target.failing.add((MEMORY, 2))
+
+    assert group.read(adr) == [1, None, 3]
+    assert group.failed == [(mappers[1], ERR_TIMEOUT)]
+    assert mappers[1].quality == QUALITY_BAD
+    assert mappers[1].error == ERR_TIMEOUT
+    assert mappers[1].currentValue == 0
+    assert mappers[2].guiObjects.value == 3
+
+
+def test_poll_group_unresolved(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    struct.pack_into("<hh", target.memory, 0, 1, 2)
+    missing = ValueMapper("MAIN.missing", pyads.PLCTYPE_INT, GuiObject())
+    mappers = make_mappers(2)
+    group = ADSPollGroup([mappers[0], missing, mappers[1]])
+
+    assert group.read(adr) == [1, None, 2]
+    assert group.failed == [(missing, ERR_SYMBOL_NOT_FOUND)]
+    assert missing.quality == QUALITY_BAD
+    assert ADSPollGroup([missing]).read(adr) == [None]
+
+
+def test_write_batch(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    mappers = make_mappers(3)
+    target.failing.add((MEMORY, 2))
+
+    writes = ADSWriteBatch(adr)
+    for mapper, value in zip(mappers, (10, 20, 30)):
+        writes.write(mapper, value)
+    writes.write_to_plc(100, 2.5, pyads.PLCTYPE_LREAL)
+    with pytest.raises(ConnectionError):
+        writes.flush()
+
+    assert writes.errors == [(mappers[1], ERR_TIMEOUT)]
+    assert struct.unpack_from("<3h", target.memory) == (10, 0, 30)
+    assert struct.unpack_from("<d", target.memory, 100) == (2.5,)
+    assert mappers[2].currentValue == 30
+    assert len(writes) == 0
+
+
+class FailingBatch(ADSWriteBatch):
+    """Write batch whose first sum write request fails."""
+
+    failed = False
+
+    def _send(self, items: Any) -> List[int]:
+        if not self.failed:
+            self.failed = True
+            raise ConnectionError("Sum writing %i values" % len(items))
+        return super(FailingBatch, self)._send(items)
+
+
+def test_write_batch_failed_request(
+    target: FakeADSTarget, adr: pyads.AmsAddr
+) -> None:
+    mappers = make_mappers(4)
+    writes = FailingBatch(adr, max_requests=2)
+    for mapper, value in zip(mappers, (10, 20, 30, 40)):
+        writes.write(mapper, value)
+    with pytest.raises(ConnectionError, match="Sum writing 2 values"):
+        writes.flush()
+
+    # the request after the failed one is sent anyway
+    assert writes.errors == [
+        (mappers[0], ERR_REQUEST_FAILED), (mappers[1], ERR_REQUEST_FAILED)
+    ]
+    assert struct.unpack_from("<4h", target.memory) == (0, 0, 30, 40)
+    assert mappers[3].currentValue == 40
+    assert mappers[0].currentValue is None
+
+
+def test_connector_lists(target: FakeADSTarget) -> None:
+    connector = ADSConnector(target.ams_addr, target.ams_port, symbol_cache=None)
+    try:
+        items = [(2 * i, i, pyads.PLCTYPE_INT) for i in range(600)]
+        connector.write_list_to_plc(items)
+        values = connector.read_list_from_plc(
+            [(address, datatype) for address, _, datatype in items]
+        )
+        assert values == list(range(600))
+
+        target.failing.add((MEMORY, 4))
+        with pytest.raises(ConnectionError):
+            connector.read_list_from_plc(
+                [(0, pyads.PLCTYPE_INT), (4, pyads.PLCTYPE_INT)]
+            )
+    finally:
+        connector.close()
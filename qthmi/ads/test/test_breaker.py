@@ -0,0 +1,139 @@
+"""Tests of the circuit breaker.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import threading
+import time
+from typing import Any, Callable, List
+
+import pyads
+import pytest
+from fake_target import FakeADSTarget
+from qthmi.main.connector import ConnectionError
+from qthmi.ads.breaker import CircuitBreaker, CircuitOpenError, probe_device
+from qthmi.ads.connector import ADSConnector
+from qthmi.ads.gui import ADSMapper
+from qthmi.ads.ports import ADSError, close_port, open_port
+from qthmi.ads.quality import QUALITY_BAD, QUALITY_GOOD
+from qthmi.ads.scheduler import PollScheduler
+
+
+class ValueMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: Any, value: Any) -> None:
+        pass
+
+
+def wait(condition: Callable[[], bool]) -> bool:
+    deadline = time.monotonic() + 5.0
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def test_breaker_states() -> None:
+    probing = threading.Event()
+    answer = threading.Event()
+    results: List[bool] = [False, True]
+
+    def probe() -> None:
+        probing.set()
+        answer.wait(5.0)
+        answer.clear()
+        if not results.pop(0):
+            raise OSError("device not reachable")
+
+    def request() -> None:
+        raise ADSError(0x745)
+
+    breaker = CircuitBreaker(probe, failure_threshold=2, backoff=0.01)
+    for _ in range(2):
+        assert breaker.state == CircuitBreaker.CLOSED
+        with pytest.raises(ADSError):
+            breaker.call(request)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(request)
+
+    # the first probe fails, the breaker opens again
+    assert probing.wait(5.0)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.call(request)
+    probing.clear()
+    answer.set()
+    assert wait(lambda: probing.is_set() or breaker.state == CircuitBreaker.OPEN)
+
+    # the second probe succeeds
+    assert probing.wait(5.0)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    answer.set()
+    assert wait(lambda: breaker.state == CircuitBreaker.CLOSED)
+    assert breaker.failures == 0
+    assert breaker.call(lambda: 42) == 42
+
+
+def test_breaker_device_offline(target: FakeADSTarget) -> None:
+    connector = ADSConnector(target.ams_addr, target.ams_port, symbol_cache=None)
+    states: List[str] = []
+
+    def probe() -> None:
+        states.append(connector.breaker.state)
+        probe_device(connector.ams_addr)()
+
+    connector.breaker = CircuitBreaker(probe, failure_threshold=2, backoff=0.05)
+    try:
+        assert connector.read_from_plc(0, pyads.PLCTYPE_INT) == 0
+        target.stop()
+        try:
+            for _ in range(2):
+                with pytest.raises(ConnectionError):
+                    connector.read_from_plc(0, pyads.PLCTYPE_INT)
+            assert connector.breaker.state == CircuitBreaker.OPEN
+
+            count = target.requests
+            with pytest.raises(CircuitOpenError):
+                connector.read_from_plc(0, pyads.PLCTYPE_INT)
+            assert target.requests == count
+            assert wait(lambda: len(states) >= 2)
+        finally:
+            target.start()
+
+        assert wait(lambda: connector.breaker.state == CircuitBreaker.CLOSED)
+        assert set(states) == {CircuitBreaker.HALF_OPEN}
+        assert connector.read_from_plc(0, pyads.PLCTYPE_INT) == 0
+    finally:
+        connector.close()
+
+
+def test_scheduler_breaker(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    breaker = CircuitBreaker(probe_device(adr), failure_threshold=1)
+    scheduler = PollScheduler(adr, pause_hidden=False, breaker=breaker)
+    mapper = ValueMapper(0, pyads.PLCTYPE_INT, [])
+    scheduler.add(mapper, "fast")
+
+    scheduler.tick("fast")
+    assert mapper.quality == QUALITY_GOOD
+
+    breaker.failure()
+    count = target.requests
+    scheduler.tick("fast")
+
+    assert target.requests == count
+    assert scheduler.classes["fast"].stats.errors == 1
+    assert mapper.quality == QUALITY_BAD
+    breaker.reset()
+
+
+def test_probe_private_port(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    shared = open_port()
+    close_port()
+    breaker = CircuitBreaker(probe_device(adr), failure_threshold=1, backoff=0.01)
+
+    breaker.failure()
+    assert wait(lambda: breaker.state == CircuitBreaker.CLOSED)
+    # the probe does not wait for requests on the shared port
+    assert target.sources and shared not in target.sources
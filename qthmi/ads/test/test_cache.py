@@ -0,0 +1,129 @@
+"""Tests of the value cache.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import struct
+import threading
+import time
+from typing import Any
+
+import pyads
+import pytest
+from fake_target import FakeADSTarget
+from qthmi.main.connector import ConnectionError
+from qthmi.ads.cache import ValueCache
+from qthmi.ads.connector import ADSConnector
+from qthmi.ads.gui import ADSMapper
+
+MEMORY = pyads.INDEXGROUP_MEMORYBYTE
+INT = pyads.PLCTYPE_INT
+
+
+class ValueMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: Any, value: Any) -> None:
+        pass
+
+
+def test_refcount(adr: pyads.AmsAddr) -> None:
+    cache = ValueCache()
+    first = cache.acquire(adr, MEMORY, 0, INT)
+    assert cache.acquire(adr, MEMORY, 0, INT, ttl=0.05) is first
+    assert (first.refs, first.ttl) == (2, 0.05)
+
+    cache.release(adr, MEMORY, 0, INT)
+    assert len(cache) == 1
+    cache.release(adr, MEMORY, 0, INT)
+    assert len(cache) == 0
+
+
+def test_ttl(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    cache = ValueCache(ttl=0.05)
+    struct.pack_into("<h", target.memory, 0, 1)
+    assert cache.get(adr, MEMORY, 0, INT) == 1
+
+    struct.pack_into("<h", target.memory, 0, 2)
+    count = target.requests
+    assert cache.get(adr, MEMORY, 0, INT) == 1
+    assert target.requests == count
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    time.sleep(0.06)
+    assert cache.get(adr, MEMORY, 0, INT) == 2
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    cache.write(adr, MEMORY, 0, 3, INT)
+    assert cache.get(adr, MEMORY, 0, INT) == 3
+    assert struct.unpack_from("<h", target.memory) == (3,)
+
+
+def test_counters_threads(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    cache = ValueCache(ttl=10.0)
+    cache.get(adr, MEMORY, 0, INT)
+
+    def read() -> None:
+        for _ in range(1000):
+            cache.get(adr, MEMORY, 0, INT)
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert (cache.hits, cache.misses) == (4000, 1)
+
+
+def test_poll(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    cache = ValueCache(ttl=10.0)
+    mappers = [ValueMapper(0, INT, []), ValueMapper(0, INT, [])]
+    for mapper in mappers:
+        cache.attach(mapper, adr)
+    struct.pack_into("<h", target.memory, 0, 4)
+
+    assert cache.poll(adr) == 1
+    assert [m.currentValue for m in mappers] == [4, 4]
+    # fresh entries are not read again
+    assert cache.poll(adr) == 0
+
+    for mapper in mappers:
+        cache.detach(mapper, adr)
+    assert len(cache) == 0
+
+
+def test_mapper_read_through_cache(target: FakeADSTarget) -> None:
+    cache = ValueCache(ttl=10.0)
+    connector = ADSConnector(
+        target.ams_addr, target.ams_port, symbol_cache=None, cache=cache
+    )
+    try:
+        struct.pack_into("<h", target.memory, 0, 5)
+        assert connector.read_from_plc(0, INT) == 5
+        mapper = ValueMapper(0, INT, [])
+
+        count = target.requests
+        assert mapper.read(connector.ams_addr, connector.cache) == 5
+        assert target.requests == count
+    finally:
+        connector.close()
+
+
+def test_write_list_partly_failed(target: FakeADSTarget) -> None:
+    cache = ValueCache(ttl=10.0)
+    connector = ADSConnector(
+        target.ams_addr, target.ams_port, symbol_cache=None, cache=cache
+    )
+    try:
+        for offset in (0, 2):
+            assert cache.get(connector.ams_addr, MEMORY, offset, INT) == 0
+        target.failing.add((MEMORY, 2))
+        with pytest.raises(ConnectionError):
+            connector.write_list_to_plc([(0, 6, INT), (2, 7, INT)])
+
+        # the written value is cached, the failed one keeps the value read
+        count = target.requests
+        assert cache.get(connector.ams_addr, MEMORY, 0, INT) == 6
+        assert cache.get(connector.ams_addr, MEMORY, 2, INT) == 0
+        assert target.requests == count
+    finally:
+        connector.close()
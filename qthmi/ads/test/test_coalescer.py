@@ -0,0 +1,102 @@
+"""Tests of the write coalescer.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import struct
+import time
+from typing import Any, Callable, List
+
+import pyads
+from PyQt5.QtWidgets import QApplication
+from fake_target import FakeADSTarget
+from qthmi.ads.coalescer import ADSWriteCoalescer
+from qthmi.ads.gui import ADSMapper
+
+MEMORY = pyads.INDEXGROUP_MEMORYBYTE
+
+
+class ValueMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: Any, value: Any) -> None:
+        pass
+
+
+def wait(qapp: QApplication, condition: Callable[[], bool]) -> None:
+    deadline = time.monotonic() + 2.0
+    while not condition() and time.monotonic() < deadline:
+        qapp.processEvents()
+        time.sleep(0.005)
+
+
+def make_coalescer(adr: pyads.AmsAddr, errors: List[str]) -> ADSWriteCoalescer:
+    coalescer = ADSWriteCoalescer(adr, interval=10, retry_interval=20)
+    coalescer.error.connect(errors.append)
+    return coalescer
+
+
+def test_coalesce(
+    qapp: QApplication, target: FakeADSTarget, adr: pyads.AmsAddr
+) -> None:
+    mappers = [ValueMapper(2 * i, pyads.PLCTYPE_INT, []) for i in range(2)]
+    coalescer = make_coalescer(adr, [])
+
+    count = target.requests
+    for value in range(1, 101):
+        coalescer.write(mappers[0], value)
+    coalescer.write(mappers[1], -1)
+    assert len(coalescer) == 2
+    wait(qapp, lambda: len(coalescer) == 0)
+
+    assert target.requests - count == 1
+    assert struct.unpack_from("<2h", target.memory) == (100, -1)
+    assert (coalescer.requested, coalescer.sent) == (101, 2)
+
+
+def test_flush(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    coalescer = make_coalescer(adr, [])
+    coalescer.write_to_plc(4, 2.5, pyads.PLCTYPE_LREAL)
+
+    coalescer.flush()
+
+    assert struct.unpack_from("<d", target.memory, 4) == (2.5,)
+    assert not coalescer.timer.isActive()
+
+
+def test_retry(
+    qapp: QApplication, target: FakeADSTarget, adr: pyads.AmsAddr
+) -> None:
+    mappers = [ValueMapper(2 * i, pyads.PLCTYPE_INT, []) for i in range(2)]
+    errors: List[str] = []
+    coalescer = make_coalescer(adr, errors)
+    target.failing.add((MEMORY, 0))
+
+    coalescer.write(mappers[0], 5)
+    coalescer.write(mappers[1], 6)
+    coalescer.flush()
+    assert len(errors) == 1
+    assert len(coalescer) == 1
+    assert struct.unpack_from("<2h", target.memory) == (0, 6)
+
+    # a newer value replaces the failed one
+    coalescer.write(mappers[0], 7)
+    target.failing.clear()
+    wait(qapp, lambda: len(coalescer) == 0)
+    assert struct.unpack_from("<h", target.memory) == (7,)
+    assert coalescer.sent == 2
+
+
+def test_drop_invalid(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    errors: List[str] = []
+    coalescer = make_coalescer(adr, errors)
+    coalescer.write(ValueMapper(0, pyads.PLCTYPE_INT, []), 70000)
+    coalescer.write(ValueMapper("MAIN.missing", pyads.PLCTYPE_INT, []), 1)
+    coalescer.write(ValueMapper(2, pyads.PLCTYPE_INT, []), 8)
+
+    coalescer.flush()
+
+    assert len(errors) == 2
+    assert "MAIN.missing" in errors[1]
+    assert len(coalescer) == 0
+    assert struct.unpack_from("<2h", target.memory) == (0, 8)
+    assert coalescer.sent == 1
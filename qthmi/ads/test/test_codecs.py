@@ -0,0 +1,118 @@
+"""Tests of the precompiled value conversion.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import ctypes
+import struct
+from typing import Any
+
+import numpy as np
+import pyads
+import pytest
+from fake_target import FakeADSTarget
+from qthmi.ads import codecs
+from qthmi.ads.codecs import (
+    ArrayCodec, Codec, CtypesCodec, NumpyCodec, StringCodec, decode_many,
+    get_codec, read_value, register, write_value,
+)
+
+MEMORY = pyads.INDEXGROUP_MEMORYBYTE
+
+
+class Position(ctypes.Structure):
+    _pack_ = 1
+    _fields_ = [("x", ctypes.c_float), ("valid", ctypes.c_bool)]
+
+
+@pytest.mark.parametrize("datatype, value", [
+    (pyads.PLCTYPE_BOOL, True),
+    (pyads.PLCTYPE_USINT, 255),
+    (pyads.PLCTYPE_SINT, -128),
+    (pyads.PLCTYPE_INT, -2),
+    (pyads.PLCTYPE_UINT, 65535),
+    (pyads.PLCTYPE_DINT, -100000),
+    (pyads.PLCTYPE_UDINT, 4000000000),
+    (pyads.PLCTYPE_DWORD, 2 ** 31),
+    (pyads.PLCTYPE_REAL, 1.5),
+    (pyads.PLCTYPE_LREAL, 0.1),
+])
+def test_struct_codec(datatype: Any, value: Any) -> None:
+    codec = get_codec(datatype)
+    data = codec.encode(value)
+
+    assert type(codec) is Codec
+    assert data == bytes(datatype(value))
+    assert codec.size == ctypes.sizeof(datatype)
+    assert codec.decode(b"\xff" + data, 1) == value
+    assert codec.decode_many(data * 3, 3) == [value] * 3
+    assert get_codec(datatype) is codec
+
+
+def test_array_and_string_codec() -> None:
+    array = get_codec(pyads.PLCTYPE_INT * 3)
+    assert isinstance(array, ArrayCodec)
+    assert array.decode(array.encode([1, -2, 3])) == [1, -2, 3]
+    assert array.decode_many(array.encode([1, 2, 3]) * 2, 2) == [[1, 2, 3]] * 2
+
+    string = get_codec(pyads.PLCTYPE_STRING)
+    assert isinstance(string, StringCodec)
+    data = string.encode("Motor 1").ljust(string.size, b"\x00")
+    assert string.decode(data) == "Motor 1"
+    assert len(string.encode("x" * 2000)) == string.size
+
+
+def test_numpy_codec() -> None:
+    array = get_codec(np.dtype(("<f4", (2, 2))))
+    data = array.encode([[1, 2], [3, 4]])
+    assert isinstance(array, NumpyCodec)
+    assert array.size == 16
+    assert array.decode(b"\x00" * 4 + data, 4).tolist() == [[1, 2], [3, 4]]
+
+    dtype = np.dtype([("bEnable", "?"), ("nCount", "<i4")], align=True)
+    record = get_codec(dtype)
+    value = record.decode(record.encode((True, 7)))
+    assert (bool(value["bEnable"]), int(value["nCount"])) == (True, 7)
+
+    # the values view the buffer without a copy
+    buffer = bytearray(data)
+    view = array.decode(buffer)
+    buffer[:4] = struct.pack("<f", 9)
+    assert view[0, 0] == 9
+
+
+def test_fallback(monkeypatch: Any) -> None:
+    codec = get_codec(Position)
+    data = codec.encode(Position(2.5, True))
+    assert isinstance(codec, CtypesCodec)
+    assert codec.size == 5
+    position = codec.decode(b"\x00" + data, 1)
+    assert (position.x, position.valid) == (2.5, True)
+
+    # c_long has no standard size, it is 8 bytes on 64 bit Linux
+    monkeypatch.setattr(codecs, "_codecs", {})
+    native = get_codec(ctypes.c_long)
+    assert native.size == ctypes.sizeof(ctypes.c_long)
+    assert native.decode(bytes(ctypes.c_long(-3))) == -3
+
+    registered = Codec("<q")
+    register(ctypes.c_long, registered)
+    assert get_codec(ctypes.c_long) is registered
+
+
+def test_decode_many() -> None:
+    data = struct.pack("<hd?", 5, 2.5, True)
+    assert decode_many(
+        [(pyads.PLCTYPE_INT, 0), (pyads.PLCTYPE_LREAL, 2), (pyads.PLCTYPE_BOOL, 10)],
+        data,
+    ) == [5, 2.5, True]
+
+
+def test_read_write(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    write_value(adr, MEMORY, 4, 1.25, pyads.PLCTYPE_LREAL)
+    write_value(adr, MEMORY, 12, [1, 2], pyads.PLCTYPE_DINT * 2)
+
+    assert struct.unpack_from("<d2i", target.memory, 4) == (1.25, 1, 2)
+    assert read_value(adr, MEMORY, 4, pyads.PLCTYPE_LREAL) == 1.25
+    assert read_value(adr, MEMORY, 12, pyads.PLCTYPE_DINT * 2) == [1, 2]
+    assert read_value(adr, MEMORY, 12, np.dtype(("<i4", 2))).tolist() == [1, 2]
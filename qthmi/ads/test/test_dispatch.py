@@ -0,0 +1,52 @@
+"""Tests of the batched gui updates.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+from typing import Any, List
+
+import pyads
+from PyQt5.QtWidgets import QApplication
+from qthmi.ads.dispatch import GuiDispatcher
+from qthmi.ads.gui import ADSMapper
+
+
+class GuiObject:
+    """Stand-in for a widget."""
+
+
+class ValueMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: Any, value: Any) -> None:
+        if value is None:
+            raise ValueError("no value")
+
+
+def test_dispatcher(qapp: QApplication) -> None:
+    dispatcher = GuiDispatcher(min_interval=0)
+    mappers = [ValueMapper(2 * i, pyads.PLCTYPE_INT, GuiObject()) for i in range(3)]
+    dispatcher.submit(mappers[0], 1)
+    dispatcher.submit_many([(mappers[0], 2), (mappers[1], 3)], 100.0)
+    dispatcher.submit_error(mappers[2], 0x745)
+    assert len(dispatcher) == 3
+
+    dispatcher.flush()
+
+    assert [m.currentValue for m in mappers[:2]] == [2, 3]
+    assert mappers[1].timestamp == 100.0
+    assert mappers[2].error == 0x745
+    assert (dispatcher.updates, dispatcher.dropped) == (3, 1)
+
+
+def test_dispatcher_mapper_error(qapp: QApplication) -> None:
+    dispatcher = GuiDispatcher(min_interval=0)
+    messages: List[str] = []
+    dispatcher.error.connect(messages.append)
+    mappers = [ValueMapper(2 * i, pyads.PLCTYPE_INT, GuiObject()) for i in range(3)]
+
+    dispatcher.submit_many(zip(mappers, [1, None, 3]))
+    dispatcher.flush()
+
+    assert [m.currentValue for m in mappers] == [1, None, 3]
+    assert dispatcher.errors == 1
+    assert messages == ["Showing 1 values failed: no value"]
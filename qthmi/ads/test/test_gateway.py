@@ -0,0 +1,190 @@
+"""Tests of the ADS gateway.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import socket
+import struct
+import time
+from typing import Any, Callable, Iterator, List
+
+import pyads
+import pytest
+from fake_target import FakeADSTarget
+from qthmi.main.connector import ConnectionError
+from qthmi.ads.gateway import MAX_FRAME, ADSGateway, GatewayConnector
+from qthmi.ads.gui import ADSMapper
+
+MEMORY = pyads.INDEXGROUP_MEMORYBYTE
+INT = pyads.PLCTYPE_INT
+
+
+class ValueMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: Any, value: Any) -> None:
+        pass
+
+
+def wait(condition: Callable[[], bool]) -> bool:
+    deadline = time.monotonic() + 5.0
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+@pytest.fixture
+def gateway(target: FakeADSTarget, tmp_path: Any) -> Iterator[ADSGateway]:
+    gateway = ADSGateway(
+        target.ams_addr, target.ams_port, str(tmp_path / "gateway.sock"),
+        interval=0.02, symbol_cache=None,
+    )
+    gateway.start()
+    yield gateway
+    gateway.close()
+
+
+def test_read_write(target: FakeADSTarget, gateway: ADSGateway) -> None:
+    struct.pack_into("<hh", target.memory, 0, 1, 2)
+    connector = GatewayConnector(gateway.path)
+    try:
+        assert connector.ams_addr.netid == target.ams_net_id
+        assert connector.read_from_plc(0, INT) == 1
+        assert connector.read_list_from_plc([(0, INT), (2, INT)]) == [1, 2]
+
+        connector.write_to_plc(4, 3, INT)
+        connector.write_list_to_plc([(6, 4, INT), (8, 2.5, pyads.PLCTYPE_LREAL)])
+        assert struct.unpack_from("<3hd", target.memory, 2) == (2, 3, 4, 2.5)
+
+        mapper = ValueMapper(16, INT, [])
+        with connector.write_batch() as batch:
+            batch.write(mapper, 5)
+            batch.write_to_plc(18, 6, INT)
+        assert struct.unpack_from("<hh", target.memory, 16) == (5, 6)
+        assert mapper.currentValue == 5
+
+        target.failing.add((MEMORY, 20))
+        with pytest.raises(ConnectionError):
+            connector.read_from_plc(20, INT)
+    finally:
+        connector.close()
+
+
+def test_symbols(target: FakeADSTarget, gateway: ADSGateway) -> None:
+    target.symbols = {"MAIN.nValue": (MEMORY, 200, 2, "INT")}
+    struct.pack_into("<h", target.memory, 200, 42)
+    connector = GatewayConnector(gateway.path)
+    try:
+        mapper = ValueMapper("MAIN.nValue", INT, [])
+        connector.resolve([mapper])
+        assert (mapper.indexGroup, mapper.plcAdr) == (MEMORY, 200)
+        assert connector.read_from_plc("MAIN.nValue", INT) == 42
+        with pytest.raises(KeyError):
+            connector.resolve([ValueMapper("MAIN.nMissing", INT, [])])
+    finally:
+        connector.close()
+
+
+def test_subscribe(target: FakeADSTarget, gateway: ADSGateway) -> None:
+    struct.pack_into("<h", target.memory, 0, 1)
+    first = GatewayConnector(gateway.path)
+    second = GatewayConnector(gateway.path)
+    values: List[Any] = []
+    others: List[Any] = []
+    try:
+        first.subscribe(0, INT, values.append)
+        second.subscribe(0, INT, others.append)
+        assert gateway.subscriptions == 1
+        assert wait(lambda: values == [1] and others == [1])
+
+        # changes polled by the gateway
+        struct.pack_into("<h", target.memory, 0, 2)
+        assert wait(lambda: values == [1, 2] and others == [1, 2])
+
+        # values written by a client are published at once
+        second.write_to_plc(0, 3, INT)
+        assert wait(lambda: values[-1] == 3 and others[-1] == 3)
+        time.sleep(0.05)
+        assert values == [1, 2, 3]
+    finally:
+        first.close()
+        second.close()
+
+
+def test_disconnect(target: FakeADSTarget, gateway: ADSGateway) -> None:
+    connector = GatewayConnector(gateway.path)
+    connector.subscribe(0, INT, lambda value: None)
+    assert wait(lambda: gateway.clients == 1)
+
+    connector.close()
+    assert wait(lambda: gateway.clients == 0)
+    assert gateway.subscriptions == 0
+    assert len(gateway.cache) == 0
+    with pytest.raises(ConnectionError):
+        connector.read_from_plc(0, INT)
+
+    connector = GatewayConnector(gateway.path)
+    gateway.close()
+    with pytest.raises(ConnectionError):
+        connector.read_from_plc(0, INT)
+    connector.close()
+
+
+def test_malformed_frame(target: FakeADSTarget, gateway: ADSGateway) -> None:
+    struct.pack_into("<h", target.memory, 0, 1)
+    connector = GatewayConnector(gateway.path)
+    garbage = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    oversized = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        assert connector.read_from_plc(0, INT) == 1
+        garbage.connect(gateway.path)
+        garbage.sendall(struct.pack("!I", 4) + b"junk")
+        oversized.connect(gateway.path)
+        oversized.sendall(struct.pack("!I", MAX_FRAME + 1))
+
+        # the senders are dropped, the other clients are served on
+        assert garbage.recv(16) == b""
+        assert oversized.recv(16) == b""
+        assert connector.read_from_plc(0, INT) == 1
+        assert gateway.clients == 1
+    finally:
+        garbage.close()
+        oversized.close()
+        connector.close()
+
+
+def test_failing_callback(target: FakeADSTarget, gateway: ADSGateway) -> None:
+    values: List[Any] = []
+
+    def fail(value: Any) -> None:
+        raise RuntimeError("callback failed")
+
+    struct.pack_into("<h", target.memory, 0, 1)
+    connector = GatewayConnector(gateway.path)
+    try:
+        connector.subscribe(0, INT, fail)
+        connector.subscribe(0, INT, values.append)
+        assert wait(lambda: values == [1])
+
+        assert connector.callback_errors >= 1
+        assert "callback failed" in str(connector.last_error)
+        assert connector.read_from_plc(0, INT) == 1
+    finally:
+        connector.close()
+
+
+def test_gateway_closed(target: FakeADSTarget, gateway: ADSGateway) -> None:
+    connector = GatewayConnector(gateway.path, timeout=2.0)
+    gateway.close()
+    with pytest.raises(ConnectionError):
+        connector.read_from_plc(0, INT)
+    connector._thread.join(2.0)
+
+    # later calls fail at once instead of waiting for the timeout
+    start = time.monotonic()
+    for _ in range(3):
+        with pytest.raises(ConnectionError, match="closed the connection"):
+            connector.read_from_plc(0, INT)
+    assert time.monotonic() - start < 0.5
+    connector.close()
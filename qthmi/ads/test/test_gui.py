@@ -0,0 +1,77 @@
+"""Tests of the ADS mapper.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import time
+from typing import Any, Callable, List
+
+import pyads
+from PyQt5.QtWidgets import QApplication
+from qthmi.ads.gui import ADSMapper
+
+
+class GuiObject:
+    """Stand-in for a widget recording the shown values."""
+
+    def __init__(self) -> None:
+        self.values: List[Any] = []
+
+
+class ValueMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: GuiObject, value: Any) -> None:
+        guiObject.values.append(value)
+
+
+def wait(qapp: QApplication, condition: Callable[[], bool]) -> None:
+    deadline = time.monotonic() + 2.0
+    while not condition() and time.monotonic() < deadline:
+        qapp.processEvents()
+        time.sleep(0.005)
+
+
+def show(mapper: ValueMapper, values: List[Any]) -> List[Any]:
+    for value in values:
+        mapper.update(value)
+    return mapper.guiObjects.values
+
+
+def test_changed_only() -> None:
+    mapper = ValueMapper(0, pyads.PLCTYPE_INT, GuiObject())
+
+    assert show(mapper, [1, 1, 2, 2, 1]) == [1, 2, 1]
+    assert (mapper.deliveredUpdates, mapper.suppressedUpdates) == (3, 2)
+
+
+def test_deadband() -> None:
+    mapper = ValueMapper(0, pyads.PLCTYPE_LREAL, GuiObject(), deadband=0.5)
+
+    assert show(mapper, [1.0, 1.4, 1.6, 1.2, 0.5]) == [1.0, 1.6, 0.5]
+    assert mapper.suppressedUpdates == 2
+
+
+def test_deadband_percent() -> None:
+    mapper = ValueMapper(
+        0, pyads.PLCTYPE_LREAL, GuiObject(), deadbandPercent=10.0
+    )
+
+    assert show(mapper, [100.0, 105.0, 111.0, 101.0]) == [100.0, 111.0]
+    # integers are compared exactly
+    mapper = ValueMapper(0, pyads.PLCTYPE_INT, GuiObject(), deadband=5)
+    assert show(mapper, [1, 2]) == [1, 2]
+
+
+def test_min_interval(qapp: QApplication) -> None:
+    mapper = ValueMapper(0, pyads.PLCTYPE_INT, GuiObject(), minInterval=0.05)
+
+    assert show(mapper, [1, 2, 3]) == [1]
+    assert mapper.suppressedUpdates == 2
+
+    # the last change is shown when the interval is over without new reads
+    wait(qapp, lambda: len(mapper.guiObjects.values) == 2)
+    assert mapper.guiObjects.values == [1, 3]
+    assert mapper.deliveredUpdates == 2
+
+    time.sleep(0.06)
+    assert show(mapper, [4]) == [1, 3, 4]
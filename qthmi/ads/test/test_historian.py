@@ -0,0 +1,38 @@
+"""Tests of the historian.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import math
+import time
+from typing import Any
+
+import pyads
+from qthmi.ads.gui import ADSMapper
+from qthmi.ads.historian import Historian
+
+
+class ValueMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: Any, value: Any) -> None:
+        pass
+
+
+def test_attach(tmpdir: Any) -> None:
+    historian = Historian(str(tmpdir))
+    mapper = ValueMapper(0, pyads.PLCTYPE_INT, [])
+    name = historian.attach(mapper, "value")
+
+    now = time.time()
+    mapper.update(1, now - 1)
+    mapper.markBad(1861)
+    mapper.update(2, now + 1)
+    historian.close()
+
+    historian = Historian(str(tmpdir))
+    records = historian.query(name, now - 1, now + 2)
+    assert records["time"][[0, 2]].tolist() == [now - 1, now + 1]
+    assert now <= records["time"][1] < now + 1
+    assert records["value"][[0, 2]].tolist() == [1.0, 2.0]
+    assert math.isnan(records["value"][1])
+    historian.close()
@@ -0,0 +1,109 @@
+"""Tests of the instrumentation of the ADS communication.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+from typing import Any
+
+import pyads
+import pytest
+from PyQt5.QtWidgets import QApplication
+from fake_target import FakeADSTarget
+from qthmi.ads import metrics
+from qthmi.ads.codecs import read_value, write_value
+from qthmi.ads.overlay import StatsOverlay
+from qthmi.ads.ports import ADSError
+
+MEMORY = pyads.INDEXGROUP_MEMORYBYTE
+
+
+@pytest.fixture
+def registry(monkeypatch: Any) -> metrics.Registry:
+    """Enabled instrumentation recording in a new registry."""
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, "registry", registry)
+    monkeypatch.setattr(metrics, "enabled", True)
+    return registry
+
+
+def test_histogram() -> None:
+    histogram = metrics.Histogram((1, 2, 5))
+    for value in (0.5, 1, 1.5, 4, 10):
+        histogram.observe(value)
+
+    assert histogram.counts == [2, 1, 1, 1]
+    assert histogram.mean == 3.4
+    assert histogram.percentile(50) == 2
+    assert histogram.percentile(100) == float("inf")
+    assert histogram.cumulative()[-2:] == [(5, 4), (float("inf"), 5)]
+    assert metrics.Histogram().percentile(99) == 0.0
+
+
+def test_requests(
+    target: FakeADSTarget, adr: pyads.AmsAddr, registry: metrics.Registry
+) -> None:
+    with metrics.cycle("fast"):
+        write_value(adr, MEMORY, 0, 3, pyads.PLCTYPE_INT)
+        assert read_value(adr, MEMORY, 0, pyads.PLCTYPE_INT) == 3
+    target.failing.add((MEMORY, 2))
+    with pytest.raises(ADSError):
+        read_value(adr, MEMORY, 2, pyads.PLCTYPE_INT)
+
+    snapshot = registry.snapshot()
+    stats = snapshot["targets"][metrics.target_key(adr)]
+    assert (stats["requests"], stats["errors"]) == (3, 1)
+    assert (stats["bytes_read"], stats["bytes_written"]) == (2, 2)
+    assert snapshot["index_groups"][MEMORY]["requests"] == 3
+    assert snapshot["cycles"]["fast"]["mean_requests"] == 2
+
+
+def test_prometheus(adr: pyads.AmsAddr, registry: metrics.Registry) -> None:
+    registry.request(adr, MEMORY, 0.0002, bytes_read=4)
+    registry.request(adr, MEMORY, 0.02, error=True)
+    registry.queue_depth("historian", 3)
+    lines = registry.prometheus().splitlines()
+
+    label = 'target="%s"' % metrics.target_key(adr)
+    assert "# TYPE qthmi_ads_target_requests_total counter" in lines
+    assert "qthmi_ads_target_requests_total{%s} 2" % label in lines
+    assert "qthmi_ads_target_errors_total{%s} 1" % label in lines
+    assert 'qthmi_ads_index_group_read_bytes_total{index_group="0x4020"} 4' in lines
+    assert (
+        'qthmi_ads_target_request_seconds_bucket{%s,le="0.00025"} 1' % label
+        in lines
+    )
+    assert 'qthmi_ads_target_request_seconds_bucket{%s,le="+Inf"} 2' % label in lines
+    assert "qthmi_ads_dispatch_seconds_count 0" in lines
+    assert 'qthmi_ads_queue_depth{queue="historian"} 3' in lines
+
+
+def test_reset(adr: pyads.AmsAddr, registry: metrics.Registry) -> None:
+    targets = registry.targets
+    registry.request(adr, MEMORY, 0.001)
+    registry.dispatched(0.001)
+    registry.reset()
+
+    # the numbers are cleared in place, the lock is kept
+    assert registry.targets is targets
+    assert not targets
+    assert registry.dispatch.count == 0
+    registry.request(adr, MEMORY, 0.001)
+    assert registry.snapshot()["targets"][metrics.target_key(adr)]["requests"] == 1
+
+
+def test_overlay(
+    qapp: QApplication, adr: pyads.AmsAddr, registry: metrics.Registry
+) -> None:
+    overlay = StatsOverlay(registry=registry)
+    registry.request(adr, MEMORY, 0.002, error=True)
+    registry.queue_depth("notifications", 5)
+
+    text = overlay.format(registry.snapshot()).splitlines()
+    assert text[0].split() == ["target", "req/s", "p50", "ms", "p99", "ms", "errors"]
+    assert text[1].split()[0] == metrics.target_key(adr)
+    assert text[1].split()[-1] == "1"
+    assert text[-1] == "queues notifications 5"
+
+    metrics.disable()
+    overlay.refresh()
+    assert overlay.text().startswith("instrumentation disabled")
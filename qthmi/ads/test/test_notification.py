@@ -0,0 +1,78 @@
+"""Tests of the ADS device notifications.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import struct
+import time
+from typing import Any, Callable, List
+
+import pyads
+from PyQt5.QtWidgets import QApplication
+from fake_target import FakeADSTarget
+from qthmi.ads.gui import ADSMapper
+from qthmi.ads.notification import ADSNotificationGroup
+
+MEMORY = pyads.INDEXGROUP_MEMORYBYTE
+
+
+class ValueMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: Any, value: Any) -> None:
+        pass
+
+
+def make_mappers(count: int) -> List[ValueMapper]:
+    return [ValueMapper(2 * i, pyads.PLCTYPE_INT, []) for i in range(count)]
+
+
+def wait(app: QApplication, condition: Callable[[], bool]) -> bool:
+    deadline = time.monotonic() + 2.0
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        app.processEvents()
+        time.sleep(0.005)
+    return True
+
+
+def test_notification_group(
+    qapp: QApplication, target: FakeADSTarget, adr: pyads.AmsAddr
+) -> None:
+    struct.pack_into("<hh", target.memory, 0, 5, 6)
+    mappers = make_mappers(2)
+    group = ADSNotificationGroup(adr, mappers)
+    try:
+        assert group.mappers == mappers
+        assert not group.fallback.mappers
+        assert wait(qapp, lambda: [m.currentValue for m in mappers] == [5, 6])
+
+        pyads.write(adr, MEMORY, 2, 7, pyads.PLCTYPE_INT)
+        assert wait(qapp, lambda: mappers[1].currentValue == 7)
+        assert abs(mappers[1].timestamp - time.time()) < 1.0
+
+        group.remove(mappers[1])
+        sent = target.notifications
+        pyads.write(adr, MEMORY, 2, 8, pyads.PLCTYPE_INT)
+        assert target.notifications == sent
+    finally:
+        group.close()
+
+
+def test_notification_fallback(
+    qapp: QApplication, target: FakeADSTarget, adr: pyads.AmsAddr
+) -> None:
+    struct.pack_into("<3h", target.memory, 0, 1, 2, 3)
+    target.failing.add((MEMORY, 2))
+    mappers = make_mappers(3)
+    group = ADSNotificationGroup(adr, mappers, max_notifications=1)
+    try:
+        # refused by the device and beyond the maximum number
+        assert group.mappers == mappers[:1]
+        assert group.fallback.mappers == mappers[1:]
+
+        target.failing.clear()
+        assert group.poll() == [2, 3]
+        assert mappers[2].currentValue == 3
+    finally:
+        group.close()
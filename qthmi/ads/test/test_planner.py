@@ -0,0 +1,132 @@
+"""Tests of the block read planner.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import struct
+from typing import Any
+
+import pyads
+from pyads.constants import ADSIGRP_SYM_VALBYHND
+from fake_target import FakeADSTarget
+from qthmi.ads.batch import ADSPollGroup
+from qthmi.ads.connector import ADSConnector
+from qthmi.ads.gui import ADSMapper
+from qthmi.ads.planner import ADSBlockReadGroup, Slot, plan_blocks
+from qthmi.ads.quality import ERR_SYMBOL_NOT_FOUND, QUALITY_BAD, QUALITY_GOOD
+
+MEMORY = pyads.INDEXGROUP_MEMORYBYTE
+BITS = pyads.INDEXGROUP_MEMORYBIT
+
+
+class ValueMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: Any, value: Any) -> None:
+        pass
+
+
+def test_plan_blocks() -> None:
+    blocks = plan_blocks([
+        (MEMORY, 40, pyads.PLCTYPE_INT),
+        (MEMORY, 0, pyads.PLCTYPE_INT),
+        (MEMORY, 2, pyads.PLCTYPE_DINT),
+        (MEMORY, 22, pyads.PLCTYPE_BYTE),
+    ], max_gap=16)
+
+    assert [(b.index_group, b.start, b.length) for b in blocks] == [
+        (MEMORY, 0, 23), (MEMORY, 40, 2)
+    ]
+    assert blocks[0].slots == [
+        Slot(1, 0, pyads.PLCTYPE_INT, None),
+        Slot(2, 2, pyads.PLCTYPE_DINT, None),
+        Slot(3, 22, pyads.PLCTYPE_BYTE, None),
+    ]
+    assert blocks[1].slots == [Slot(0, 0, pyads.PLCTYPE_INT, None)]
+    assert [s.item for s in blocks[0].slots] == [1, 2, 3]
+
+
+def test_plan_blocks_bits() -> None:
+    blocks = plan_blocks([
+        (MEMORY, 2, pyads.PLCTYPE_INT),
+        (BITS, 8 * 3 + 5, pyads.PLCTYPE_BOOL),
+    ])
+
+    assert len(blocks) == 1
+    assert (blocks[0].start, blocks[0].length) == (2, 2)
+    assert blocks[0].slots[1] == Slot(1, 1, pyads.PLCTYPE_BOOL, 5)
+
+
+def test_plan_blocks_max_size() -> None:
+    items = [(MEMORY, 4 * i, pyads.PLCTYPE_DINT) for i in range(10)]
+    items.append((MEMORY, 100, pyads.PLCTYPE_INT))
+
+    blocks = plan_blocks(items, max_block_size=16)
+
+    assert [(b.start, b.length) for b in blocks] == [
+        (0, 16), (16, 16), (32, 8), (100, 2)
+    ]
+
+
+def test_plan_blocks_unresolved() -> None:
+    blocks = plan_blocks([
+        (MEMORY, None, pyads.PLCTYPE_INT),  # type: ignore
+        (MEMORY, 0, pyads.PLCTYPE_INT),
+    ])
+
+    assert len(blocks) == 1
+    assert blocks[0].slots == [Slot(1, 0, pyads.PLCTYPE_INT, None)]
+
+
+def test_plan_blocks_handles() -> None:
+    blocks = plan_blocks([
+        (ADSIGRP_SYM_VALBYHND, 1, pyads.PLCTYPE_INT),
+        (ADSIGRP_SYM_VALBYHND, 2, pyads.PLCTYPE_INT),
+    ])
+
+    # the offsets are variable handles, not memory addresses
+    assert [(b.start, b.length) for b in blocks] == [(1, 2), (2, 2)]
+
+
+def test_block_read_group(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    struct.pack_into("<hhih", target.memory, 0, 1, -2, 300000, 4)
+    target.memory[50] = 0b100
+    mappers = [
+        ValueMapper(0, pyads.PLCTYPE_INT, []),
+        ValueMapper(2, pyads.PLCTYPE_INT, []),
+        ValueMapper(4, pyads.PLCTYPE_DINT, []),
+        ValueMapper(8, pyads.PLCTYPE_INT, []),
+        ValueMapper(8 * 50 + 2, pyads.PLCTYPE_BOOL, []),
+        ValueMapper(8 * 50 + 3, pyads.PLCTYPE_BOOL, []),
+    ]
+    group = ADSBlockReadGroup(mappers)
+
+    count = target.requests
+    values = group.read(adr)
+
+    assert target.requests - count == 1
+    assert len(group.blocks) == 2
+    assert values == [1, -2, 300000, 4, True, False]
+    assert values == ADSPollGroup(mappers).read(adr)
+
+
+def test_block_read_group_resolve(target: FakeADSTarget) -> None:
+    target.symbols = {"MAIN.nValue": (MEMORY, 200, 2, "INT")}
+    struct.pack_into("<h", target.memory, 200, 42)
+    struct.pack_into("<h", target.memory, 0, 7)
+    symbol = ValueMapper("MAIN.nValue", pyads.PLCTYPE_INT, [])
+    address = ValueMapper(0, pyads.PLCTYPE_INT, [])
+    group = ADSBlockReadGroup([symbol, address])
+    connector = ADSConnector(target.ams_addr, target.ams_port, symbol_cache=None)
+    try:
+        assert group.read(connector.ams_addr) == [None, 7]
+        assert symbol.quality == QUALITY_BAD
+        assert symbol.error == ERR_SYMBOL_NOT_FOUND
+        assert len(group.blocks) == 1
+
+        connector.resolve([symbol])
+
+        assert group.read(connector.ams_addr) == [42, 7]
+        assert symbol.quality == QUALITY_GOOD
+        assert len(group.blocks) == 2
+    finally:
+        connector.close()
@@ -0,0 +1,62 @@
+"""Tests of the connection pool.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import struct
+from typing import Any
+
+import pyads
+from fake_target import FakeADSTarget
+from qthmi.ads.batch import ADSPollGroup
+from qthmi.ads.gui import ADSMapper
+from qthmi.ads.metrics import target_key
+from qthmi.ads.pool import ADSConnectionPool
+from qthmi.ads.ports import close_port, open_port
+
+
+class ValueMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: Any, value: Any) -> None:
+        pass
+
+
+def test_poll(target: FakeADSTarget) -> None:
+    struct.pack_into("<hh", target.memory, 0, 1, 2)
+    mappers = [ValueMapper(2 * i, pyads.PLCTYPE_INT, []) for i in range(2)]
+    shared = open_port()
+    try:
+        with ADSConnectionPool(max_workers=2) as pool:
+            pool.add_group(target.ams_addr, ADSPollGroup(mappers))
+            assert pool.poll() == {}
+            stats = pool.stats[target_key(target.ams_addr)]
+    finally:
+        close_port()
+
+    assert [m.currentValue for m in mappers] == [1, 2]
+    assert (stats.requests, stats.errors) == (1, 0)
+    # the worker threads read on private ports, not on the shared one
+    assert target.sources and shared not in target.sources
+
+
+def test_slow_target(target: FakeADSTarget) -> None:
+    struct.pack_into("<h", target.memory, 0, 1)
+    fast = ValueMapper(0, pyads.PLCTYPE_INT, [])
+    slow = ValueMapper(0, pyads.PLCTYPE_INT, [])
+    open_port()
+    try:
+        with FakeADSTarget(
+            latency=0.5, ams_net_id="127.0.0.2.1.1", ip_address="127.0.0.2"
+        ) as plc, ADSConnectionPool() as pool:
+            struct.pack_into("<h", plc.memory, 0, 2)
+            pool.add_group(plc.ams_addr, ADSPollGroup([slow]))
+            assert pool.poll(timeout=0.0) == {}
+
+            # a target added later gets a thread of its own
+            pool.add_group(target.ams_addr, ADSPollGroup([fast]))
+            pool.poll(timeout=0.2)
+            assert (fast.currentValue, slow.currentValue) == (1, None)
+            pool.poll()
+            assert slow.currentValue == 2
+    finally:
+        close_port()
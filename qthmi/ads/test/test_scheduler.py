@@ -0,0 +1,65 @@
+"""Tests of the poll scheduler.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import struct
+from typing import Any
+
+import pyads
+from fake_target import FakeADSTarget
+from qthmi.ads.gui import ADSMapper
+from qthmi.ads.scheduler import PollScheduler
+
+
+class ValueMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: Any, value: Any) -> None:
+        pass
+
+
+def test_scan_classes(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    scheduler = PollScheduler(adr, pause_hidden=False)
+    mappers = [ValueMapper(2 * i, pyads.PLCTYPE_INT, []) for i in range(3)]
+    for mapper in mappers:
+        scheduler.add(mapper, "fast")
+    scheduler.add(mappers[1], "slow")
+    scheduler.remove(mappers[2])
+    scheduler.remove(mappers[2])
+
+    assert scheduler.mappers("fast") == mappers[:1]
+    assert scheduler.mappers("slow") == mappers[1:2]
+
+    struct.pack_into("<hh", target.memory, 0, 1, 2)
+    scheduler.tick("slow")
+    assert [m.currentValue for m in mappers[:2]] == [None, 2]
+    assert scheduler.classes["slow"].stats.cycles == 1
+
+
+class Widget:
+    """Stand-in for a widget that can be hidden."""
+
+    def __init__(self, visible: bool) -> None:
+        self.visible = visible
+
+    def isVisible(self) -> bool:
+        return self.visible
+
+
+def test_pause_hidden(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    scheduler = PollScheduler(adr)
+    hidden = ValueMapper(0, pyads.PLCTYPE_INT, [Widget(False)])
+    recorded = ValueMapper(2, pyads.PLCTYPE_INT, [])
+    scheduler.add(hidden, "normal")
+    scheduler.add(recorded, "normal")
+    struct.pack_into("<hh", target.memory, 0, 1, 2)
+
+    # mappers without gui objects are read although the others are hidden
+    scheduler.tick("normal")
+    assert recorded.currentValue == 2
+    assert scheduler.classes["normal"].stats.cycles == 1
+
+    scheduler.remove(recorded)
+    scheduler.tick("normal")
+    assert scheduler.classes["normal"].stats.skipped == 1
+    assert hidden.currentValue is None
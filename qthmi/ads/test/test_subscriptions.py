@@ -0,0 +1,124 @@
+"""Tests of the subscription manager.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+from typing import Any, List
+
+import pyads
+from PyQt5 import sip
+from PyQt5.QtWidgets import QApplication, QTabWidget, QWidget
+from fake_target import FakeADSTarget
+from qthmi.ads.gui import ADSMapper
+from qthmi.ads.scheduler import PollScheduler
+from qthmi.ads.subscriptions import SubscriptionManager
+
+
+class ValueMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: Any, value: Any) -> None:
+        pass
+
+
+def make_manager(
+    target: FakeADSTarget, events: List[Any], hidden_class: str = None
+) -> SubscriptionManager:
+    scheduler = PollScheduler(target.ams_addr, pause_hidden=False)
+    manager = SubscriptionManager(scheduler, hidden_class)
+    manager.subscribed.connect(lambda m: events.append(("on", m)))
+    manager.unsubscribed.connect(lambda m: events.append(("off", m)))
+    return manager
+
+
+def test_references(qapp: QApplication, target: FakeADSTarget) -> None:
+    first, second = QWidget(), QWidget()
+    mapper = ValueMapper(0, pyads.PLCTYPE_INT, [first, second])
+    events: List[Any] = []
+    manager = make_manager(target, events)
+    manager.add(mapper, "fast")
+    assert not manager.is_subscribed(mapper)
+    assert manager.scheduler.mappers("fast") == []
+
+    first.show()
+    second.show()
+    assert events == [("on", mapper)]
+    assert manager.scheduler.mappers("fast") == [mapper]
+
+    # the mapper is subscribed while one of its gui objects is visible
+    first.hide()
+    assert manager.is_subscribed(mapper)
+    second.hide()
+    assert events == [("on", mapper), ("off", mapper)]
+    assert manager.subscriptions == 0
+    assert manager.scheduler.mappers("fast") == []
+
+
+def test_tabs(qapp: QApplication, target: FakeADSTarget) -> None:
+    tabs = QTabWidget()
+    pages = [QWidget(), QWidget()]
+    for page in pages:
+        tabs.addTab(page, "page")
+    mappers = [ValueMapper(2 * i, pyads.PLCTYPE_INT, page)
+               for i, page in enumerate(pages)]
+    events: List[Any] = []
+    manager = make_manager(target, events, hidden_class="slow")
+    for mapper in mappers:
+        manager.add(mapper)
+    tabs.show()
+    assert manager.scheduler.mappers("normal") == mappers[:1]
+    assert manager.scheduler.mappers("slow") == mappers[1:]
+
+    tabs.setCurrentIndex(1)
+    assert manager.scheduler.mappers("normal") == mappers[1:]
+    assert manager.scheduler.mappers("slow") == mappers[:1]
+    assert events == [("on", mappers[0]), ("off", mappers[0]), ("on", mappers[1])]
+    tabs.close()
+
+
+def test_remove(qapp: QApplication, target: FakeADSTarget) -> None:
+    widget = QWidget()
+    widget.show()
+    mapper = ValueMapper(0, pyads.PLCTYPE_INT, widget)
+    events: List[Any] = []
+    manager = make_manager(target, events, hidden_class="slow")
+    manager.add(mapper)
+
+    manager.remove(mapper)
+    assert events == [("on", mapper), ("off", mapper)]
+    assert manager.mappers == []
+    assert manager.scheduler.mappers("normal") == []
+    # removed gui objects are not watched anymore
+    widget.hide()
+    widget.show()
+    assert len(events) == 2
+
+
+def test_destroyed(qapp: QApplication, target: FakeADSTarget) -> None:
+    first, second = QWidget(), QWidget()
+    first.show()
+    second.show()
+    mapper = ValueMapper(0, pyads.PLCTYPE_INT, [first, second])
+    events: List[Any] = []
+    manager = make_manager(target, events)
+    manager.add(mapper)
+
+    sip.delete(first)
+    assert manager.is_subscribed(mapper)
+    sip.delete(second)
+    assert events == [("on", mapper), ("off", mapper)]
+    assert manager.subscriptions == 0
+
+    # the destroyed gui objects are forgotten
+    manager.remove(mapper)
+    assert manager.mappers == []
+
+
+def test_manager_deleted(qapp: QApplication, target: FakeADSTarget) -> None:
+    widget = QWidget()
+    widget.show()
+    manager = make_manager(target, [])
+    manager.add(ValueMapper(0, pyads.PLCTYPE_INT, [widget]))
+
+    # gui objects outliving the manager are not watched anymore
+    sip.delete(manager)
+    sip.delete(widget)
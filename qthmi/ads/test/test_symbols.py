@@ -0,0 +1,85 @@
+"""Tests of the symbol name addressing.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import struct
+from typing import Any
+
+import pyads
+import pytest
+from fake_target import FakeADSTarget
+from qthmi.ads.connector import ADSConnector
+from qthmi.ads.gui import ADSMapper
+from qthmi.ads.symbols import SymbolTable
+
+MEMORY = pyads.INDEXGROUP_MEMORYBYTE
+
+
+class ValueMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: Any, value: Any) -> None:
+        pass
+
+
+@pytest.fixture
+def plc(target: FakeADSTarget) -> FakeADSTarget:
+    target.symbols = {"MAIN.fbAxis": (MEMORY, 100, 16, "FB_Axis")}
+    target.datatypes = {
+        "FB_Axis": (16, [
+            ("stStatus", 0, 4, "ST_Status"), ("fActPos", 8, 8, "LREAL"),
+        ]),
+        "ST_Status": (4, [("bReady", 2, 1, "BOOL")]),
+    }
+    target.references = {"MAIN.aValues[2]": (MEMORY, 204, 2, "INT")}
+    return target
+
+
+def test_resolve_members(plc: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    symbols = SymbolTable.load(adr, None)
+
+    assert symbols.resolve("MAIN.fbAxis") == (MEMORY, 100)
+    assert symbols.resolve("MAIN.fbAxis.fActPos") == (MEMORY, 108)
+    assert symbols.resolve("main.fbaxis.ststatus.bready") == (MEMORY, 102)
+    assert "MAIN.fbAxis.fActPos" in symbols
+    assert "MAIN.fbAxis.fSetPos" not in symbols
+    with pytest.raises(KeyError):
+        symbols.resolve("MAIN.fbAxis.fActPos.bValid")
+
+
+def test_symbol_cache(plc: FakeADSTarget, adr: pyads.AmsAddr, tmp_path: Any) -> None:
+    loaded = SymbolTable.load(adr, str(tmp_path))
+    count = plc.requests
+    cached = SymbolTable.load(adr, str(tmp_path))
+
+    # only the upload info is read
+    assert plc.requests - count == 2
+    assert cached.symbols == loaded.symbols
+    assert cached.datatypes == loaded.datatypes
+
+
+def test_connector_symbols(plc: FakeADSTarget) -> None:
+    struct.pack_into("<d", plc.memory, 108, 12.5)
+    struct.pack_into("<h", plc.memory, 204, 3)
+    connector = ADSConnector(plc.ams_addr, plc.ams_port, symbol_cache=None)
+    try:
+        assert connector.read_from_plc(
+            "MAIN.fbAxis.fActPos", pyads.PLCTYPE_LREAL
+        ) == 12.5
+        assert len(connector.handles) == 0
+
+        # array elements are not in the symbol table, a handle is used
+        assert connector.read_from_plc("MAIN.aValues[2]", pyads.PLCTYPE_INT) == 3
+        connector.write_to_plc("MAIN.aValues[2]", 4, pyads.PLCTYPE_INT)
+        assert struct.unpack_from("<h", plc.memory, 204) == (4,)
+        assert len(connector.handles) == 1
+
+        mappers = [
+            ValueMapper("MAIN.fbAxis.fActPos", pyads.PLCTYPE_LREAL, []),
+            ValueMapper("MAIN.aValues[2]", pyads.PLCTYPE_INT, []),
+        ]
+        connector.resolve(mappers)
+        assert [m.read(connector.ams_addr) for m in mappers] == [12.5, 4]
+    finally:
+        connector.close()
+    assert len(connector.handles) == 0
@@ -0,0 +1,121 @@
+"""Tests of the columnar tag table.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import math
+import struct
+from typing import Any, List
+
+import pyads
+import pytest
+from fake_target import ERR_TIMEOUT, FakeADSTarget
+from qthmi.ads.quality import QUALITY_BAD, QUALITY_GOOD
+from qthmi.ads.table import TagTable, TagView
+from qthmi.ads.trend import TrendRecorder
+
+MEMORY = pyads.INDEXGROUP_MEMORYBYTE
+
+
+class GuiObject:
+    """Stand-in for a widget."""
+
+    value: Any = None
+
+
+class ValueView(TagView):
+
+    __slots__ = ()
+
+    def mapAdsToGui(self, guiObject: GuiObject, value: Any) -> None:
+        guiObject.value = value
+
+
+def make_views(table: TagTable, count: int) -> List[ValueView]:
+    return [
+        ValueView(table, 2 * i, pyads.PLCTYPE_INT, GuiObject()) for i in range(count)
+    ]
+
+
+def test_add_remove() -> None:
+    table = TagTable(capacity=2)
+    views = make_views(table, 3)
+
+    assert (len(table), table.capacity) == (3, 4)
+    assert table.offset[:3].tolist() == [0, 2, 4]
+    assert views[2].plcDataType == pyads.PLCTYPE_INT
+    assert not hasattr(views[0], "__dict__")
+    with pytest.raises(ValueError):
+        table.add(0, pyads.PLCTYPE_STRING)
+
+    views[1].remove()
+    assert len(table) == 2
+    assert table.views[1] is None
+    assert ValueView(table, 10, pyads.PLCTYPE_INT, GuiObject()).slot == 1
+    # the removed view does not access the tag reusing its slot
+    with pytest.raises(ValueError):
+        views[1].currentValue
+    views[1].remove()
+    assert len(table) == 3
+
+
+def test_poll(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    table = TagTable()
+    views = make_views(table, 3)
+    struct.pack_into("<3h", target.memory, 0, 1, 2, 3)
+
+    assert table.poll(adr).tolist() == [0, 1, 2]
+    assert [v.guiObjects.value for v in views] == [1, 2, 3]
+    assert views[0].quality == QUALITY_GOOD
+
+    struct.pack_into("<h", target.memory, 2, 5)
+    target.failing.add((MEMORY, 4))
+    assert table.poll(adr).tolist() == [1]
+    assert views[1].guiObjects.value == 5
+    assert (views[2].quality, views[2].error) == (QUALITY_BAD, ERR_TIMEOUT)
+    assert views[2].currentValue == 3
+
+
+def test_listeners(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    table = TagTable()
+    view = make_views(table, 1)[0]
+    recorder = TrendRecorder(max_signals=1)
+    struct.pack_into("<h", target.memory, 0, 4)
+
+    name = recorder.attach(view)
+    table.poll(adr)
+    # the listeners get every value, the view only the changed ones
+    table.poll(adr)
+    read = view.timestamp
+    view.update(6)
+    target.failing.add((MEMORY, 0))
+    table.poll(adr)
+
+    assert name == "0"
+    times, values = recorder[name].data()
+    assert times[1] == read
+    assert values[:3].tolist() == [4, 4, 6]
+    assert math.isnan(values[3])
+    assert view.quality == QUALITY_BAD
+
+    recorder.detach(name)
+    table.poll(adr)
+    assert len(recorder[name]) == 4
+    assert not table.listened[view.slot]
+
+
+def test_write(target: FakeADSTarget, adr: pyads.AmsAddr) -> None:
+    table = TagTable()
+    view = make_views(table, 1)[0]
+    target.failing.add((MEMORY, 0))
+    table.poll(adr)
+    assert view.quality == QUALITY_BAD
+    target.failing.clear()
+
+    view.write(adr, 7)
+    assert struct.unpack_from("<h", target.memory) == (7,)
+    assert view.sample == (7, view.timestamp, QUALITY_GOOD, 0)
+    assert view.timestamp is not None
+    # the written value is shown by the next poll
+    table.poll(adr)
+    assert view.guiObjects.value == 7
@@ -0,0 +1,88 @@
+"""Tests of the declarative tag configuration.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import json
+from typing import Any
+
+import pyads
+import pytest
+from PyQt5.QtWidgets import QApplication, QWidget
+from qthmi.ads.gui import ADSMapper
+from qthmi.ads.scheduler import PollScheduler
+from qthmi.ads.tags import Tag, TagDatabase, TagError, load_tags, validate
+
+
+class ValueMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: Any, value: Any) -> None:
+        pass
+
+
+def test_validate() -> None:
+    tags = validate([
+        {"name": "speed", "address": "MAIN.fSpeed", "type": "lreal"},
+        {"name": "alarm", "address": "12", "type": "BOOL", "scan": "fast"},
+    ])
+
+    assert tags == [
+        Tag("speed", "MAIN.fSpeed", "LREAL"),
+        Tag("alarm", 12, "BOOL", "fast"),
+    ]
+    assert tags[0].datatype == pyads.PLCTYPE_LREAL
+
+
+def test_validate_errors() -> None:
+    with pytest.raises(TagError) as info:
+        validate([
+            {"name": "a", "address": 0, "type": "INT", "colour": "red"},
+            {"name": "a", "type": "WORDS"},
+            {"name": "b", "address": 2, "type": "INT", "scan": "hourly"},
+            {"name": "c", "address": 4, "type": "REAL", "deadband": -1},
+            "d",
+        ], "tags.json")
+
+    assert info.value.errors == [
+        "tags.json record 1: unknown field colour",
+        "tags.json record 2: missing field address",
+        "tags.json record 2: duplicate name a",
+        "tags.json record 2: unknown plc datatype WORDS",
+        "tags.json record 3: unknown scan class hourly",
+        "tags.json record 4: invalid deadband -1",
+        "tags.json record 5: expected a mapping of fields",
+    ]
+
+
+def test_load_tags(tmp_path: Any) -> None:
+    path = tmp_path / "tags.json"
+    path.write_text(json.dumps({"tags": [
+        {"name": "speed", "address": 0, "type": "INT", "screen": "main"},
+    ]}))
+    cache_dir = str(tmp_path / "cache")
+
+    tags = load_tags(str(path), cache_dir)
+    assert tags == load_tags(str(path), cache_dir)
+    assert tags == [Tag("speed", 0, "INT", screen="main")]
+
+    path.write_text("[{\"name\": \"speed\"}]")
+    with pytest.raises(TagError):
+        load_tags(str(path), cache_dir)
+
+
+def test_bind_screen_without_tags(qapp: QApplication) -> None:
+    tags = TagDatabase(
+        [Tag("speed", 0, "INT", screen="main")], default_mapper=ValueMapper
+    )
+    scheduler = PollScheduler(pyads.AmsAddr("127.0.0.1.1.1", 851))
+    root = QWidget()
+
+    tags.bind("main", root, scheduler)
+    tags.bind("settings", root, scheduler)
+    assert not tags.is_built("main")
+
+    root.show()
+    assert len(scheduler.mappers("normal")) == 1
+    assert tags.mappers("settings") == []
+    tags.bind("settings", root, scheduler)
+    assert tags.is_built("settings")
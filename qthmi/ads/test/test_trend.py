@@ -0,0 +1,63 @@
+"""Tests of the trend recorder.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import math
+import time
+from typing import Any
+
+import numpy as np
+import pyads
+from qthmi.ads.gui import ADSMapper
+from qthmi.ads.trend import TrendRecorder, decimate_minmax
+
+
+class ValueMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: Any, value: Any) -> None:
+        pass
+
+
+def test_attach() -> None:
+    recorder = TrendRecorder(max_signals=1)
+    mapper = ValueMapper(0, pyads.PLCTYPE_INT, [])
+    name = recorder.attach(mapper, "value")
+
+    now = time.time()
+    mapper.update(1, now - 2)
+    mapper.update(1, now - 1)
+    mapper.markBad(1861)
+    mapper.update(2, now + 1)
+
+    times, values = recorder[name].data()
+    assert times[[0, 1, 3]].tolist() == [now - 2, now - 1, now + 1]
+    # the failed read is stamped with the time it was reported
+    assert now <= times[2] < now + 1
+    assert values[[0, 1, 3]].tolist() == [1.0, 1.0, 2.0]
+    assert math.isnan(values[2])
+
+    recorder.detach(name)
+    mapper.update(3, now + 2)
+    assert len(recorder[name]) == 4
+
+
+def test_decimate_minmax() -> None:
+    times = np.arange(8, dtype=np.float64)
+    values = np.array([1, 5, 2, 7, 3, 4, 0, 6], np.float64)
+
+    times, values = decimate_minmax(times, values, 2)
+
+    assert times.tolist() == [0, 0, 4, 4]
+    assert values.tolist() == [1, 7, 0, 6]
+
+
+def test_decimate_gaps() -> None:
+    times = np.arange(8, dtype=np.float64)
+    values = np.array([1, 5, 2, np.nan, 3, 4, 0, 6], np.float64)
+
+    times, values = decimate_minmax(times, values, 2)
+
+    assert times.tolist() == [0, 0, 4, 4]
+    assert np.isnan(values[:2]).all()
+    assert values[2:].tolist() == [0, 6]
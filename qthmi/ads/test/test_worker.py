@@ -0,0 +1,67 @@
+"""Tests of the ADS worker thread.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+"""
+import struct
+import time
+from typing import Any
+
+import pyads
+from PyQt5.QtWidgets import QApplication
+from fake_target import FakeADSTarget
+from qthmi.ads.gui import ADSMapper
+from qthmi.ads.ports import close_port, open_port
+from qthmi.ads.worker import ADSWorker
+
+
+class ValueMapper(ADSMapper):
+
+    def mapAdsToGui(self, guiObject: Any, value: Any) -> None:
+        pass
+
+
+def test_worker(qapp: QApplication, target: FakeADSTarget) -> None:
+    struct.pack_into("<hh", target.memory, 0, 1, 2)
+    mappers = [ValueMapper(2 * i, pyads.PLCTYPE_INT, []) for i in range(2)]
+    worker = ADSWorker(target.ams_addr)
+    worker.start()
+    try:
+        worker.read_all(mappers)
+        deadline = time.monotonic() + 2.0
+        while mappers[1].currentValue != 2 and time.monotonic() < deadline:
+            qapp.processEvents()
+            time.sleep(0.005)
+        assert [m.currentValue for m in mappers] == [1, 2]
+    finally:
+        worker.stop(2.0)
+
+
+def test_worker_stop_flushes_writes(target: FakeADSTarget) -> None:
+    mappers = [ValueMapper(2 * i, pyads.PLCTYPE_INT, []) for i in range(3)]
+    worker = ADSWorker(target.ams_addr)
+    target.latency = 0.05
+    worker.start()
+    # the first write keeps the thread busy while the others are queued
+    worker.write(mappers[0], 10)
+    time.sleep(0.01)
+    worker.write(mappers[1], 20)
+    worker.write(mappers[2], 30)
+    worker.stop(2.0)
+
+    assert struct.unpack_from("<3h", target.memory) == (10, 20, 30)
+
+
+def test_worker_private_port(qapp: QApplication, target: FakeADSTarget) -> None:
+    mapper = ValueMapper(0, pyads.PLCTYPE_INT, [])
+    shared = open_port()
+    worker = ADSWorker(target.ams_addr)
+    worker.start()
+    try:
+        worker.write(mapper, 5)
+        worker.stop(2.0)
+    finally:
+        close_port()
+
+    # the requests of the gui thread do not wait for the worker thread
+    assert target.sources and shared not in target.sources
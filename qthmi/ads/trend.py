@@ -0,0 +1,379 @@
+"""Recording and plotting of value trends.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+The :py:class:`TrendRecorder` stores the values of mappers in preallocated
+ring buffers, one per signal, so recording does not allocate memory per
+sample. The memory of all buffers is limited, older samples are
+overwritten or spilled to disk. Samples are stored with the timestamp of the
+read, failed reads are stored as NaN and shown as gaps.
+
+The :py:class:`TrendPlot` shows the latest time window of the signals on a
+matplotlib canvas. The samples are reduced to a minimum and a maximum per
+pixel column by :py:func:`decimate_minmax` and only the lines are redrawn on
+refresh by means of blitting, the axes are drawn only if the value range
+changes.
+
+"""
+import os
+import time
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+from .gui import ADSMapper, VALUE_TYPE
+from .quality import Sample
+
+if TYPE_CHECKING:
+    from .table import TagView  # noqa: F401
+
+
+#: size of a sample in bytes, time stamp and value
+SAMPLE_SIZE = 16
+
+#: dtype of samples spilled to disk
+SAMPLE_DTYPE = np.dtype([("time", "<f8"), ("value", "<f8")])
+
+#: default memory limit of a recorder in bytes
+MEMORY_LIMIT = 64 * 1024 * 1024
+
+
+class RingBuffer:
+    """Preallocated buffer of the latest samples of a signal.
+
+    If a spill file is given, the oldest quarter of the samples is appended
+    to the file whenever the buffer is full. Otherwise the oldest sample is
+    overwritten.
+
+    :param int capacity: number of samples
+    :param str spill_path: path of the spill file
+
+    """
+
+    def __init__(self, capacity: int, spill_path: str = None) -> None:
+        if capacity < 1:
+            raise ValueError("Capacity of a ring buffer must be positive")
+        self.capacity = capacity
+        self.spill_path = spill_path
+        self.spilled = 0
+        self.times = np.zeros(capacity, np.float64)
+        self.values = np.zeros(capacity, np.float64)
+        self._start = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, value: float, timestamp: Optional[float] = None) -> None:
+        """Add a sample.
+
+        :param float value: value of the sample
+        :param float timestamp: time stamp in seconds since the epoch, the
+            current time by default
+
+        """
+        if self._count == self.capacity:
+            if self.spill_path is not None:
+                self.spill(max(self.capacity // 4, 1))
+            else:
+                self._start = (self._start + 1) % self.capacity
+                self._count -= 1
+
+        i = (self._start + self._count) % self.capacity
+        self.times[i] = time.time() if timestamp is None else timestamp
+        self.values[i] = value
+        self._count += 1
+
+    def spill(self, count: int) -> None:
+        """Append the oldest samples to the spill file and remove them.
+
+        :param int count: number of samples
+
+        """
+        times, values = self._segments(count)
+        samples = np.empty(len(times), SAMPLE_DTYPE)
+        samples["time"] = times
+        samples["value"] = values
+        with open(self.spill_path, "ab") as f:  # type: ignore
+            samples.tofile(f)
+        self.spilled += len(samples)
+        self._start = (self._start + len(samples)) % self.capacity
+        self._count -= len(samples)
+
+    def clear(self) -> None:
+        """Remove all samples from the buffer."""
+        self._start = 0
+        self._count = 0
+
+    def data(self, since: float = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return time stamps and values in chronological order.
+
+        :param float since: only return samples not older than this time stamp
+        :return: tuple of time stamp and value arrays
+
+        """
+        first = 0
+        if since is not None and self._count:
+            first = self._search(since)
+        times, values = self._segments(self._count, first)
+        return times, values
+
+    def _segments(
+        self, count: int, first: int = 0
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # samples [first, count) in chronological order, copies only if
+        # the range wraps around the end of the arrays
+        begin = (self._start + first) % self.capacity
+        end = begin + max(count - first, 0)
+        if end <= self.capacity:
+            return self.times[begin:end], self.values[begin:end]
+        end -= self.capacity
+        return (
+            np.concatenate((self.times[begin:], self.times[:end])),
+            np.concatenate((self.values[begin:], self.values[:end])),
+        )
+
+    def _search(self, timestamp: float) -> int:
+        # index of the first sample not older than timestamp
+        tail = min(self._count, self.capacity - self._start)
+        first = self.times[self._start:self._start + tail]
+        if first.size and first[-1] >= timestamp:
+            return int(np.searchsorted(first, timestamp))
+        second = self.times[:self._count - tail]
+        return tail + int(np.searchsorted(second, timestamp))
+
+
+def read_spill(path: str) -> np.ndarray:
+    """Read samples spilled to disk.
+
+    :param str path: path of the spill file
+    :return: array of samples with the fields ``time`` and ``value``
+
+    """
+    return np.fromfile(path, SAMPLE_DTYPE)
+
+
+def decimate_minmax(
+    times: np.ndarray, values: np.ndarray, bins: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Reduce samples to the minimum and maximum of each bin.
+
+    Peaks are preserved, unlike plain subsampling. The samples are divided
+    into *bins* bins of equal sample count, typically one per pixel column
+    of the plot. Bins containing NaN, failed reads, stay NaN, so the gaps
+    remain visible.
+
+    :param times: time stamps in chronological order
+    :param values: values of the samples
+    :param int bins: number of bins
+    :return: tuple of time stamps and values, two samples per bin
+
+    """
+    if bins < 1 or len(values) <= 2 * bins:
+        return times, values
+    edges = np.linspace(0, len(values), bins + 1).astype(np.intp)[:-1]
+    result_times = np.repeat(times[edges], 2)
+    result_values = np.empty(2 * bins, values.dtype)
+    result_values[0::2] = np.minimum.reduceat(values, edges)
+    result_values[1::2] = np.maximum.reduceat(values, edges)
+    return result_times, result_values
+
+
+class TrendRecorder:
+    """Record the values of signals in ring buffers.
+
+    The memory limit is divided equally between ``max_signals`` signals.
+
+    :param int memory_limit: maximum memory of all ring buffers in bytes
+    :param int max_signals: maximum number of signals
+    :param str spill_dir: directory for spilling old samples to disk, by
+        default old samples are dropped
+
+    Sample code::
+
+    >>> recorder = TrendRecorder(max_signals=50)
+    >>> recorder.attach(positionMapper, "position")
+    >>> times, values = recorder["position"].data(since=time.time() - 10)
+
+    """
+
+    def __init__(
+        self,
+        memory_limit: int = MEMORY_LIMIT,
+        max_signals: int = 50,
+        spill_dir: str = None,
+    ) -> None:
+        self.memory_limit = memory_limit
+        self.max_signals = max_signals
+        self.spill_dir = spill_dir
+        self.buffers: Dict[str, RingBuffer] = {}
+        self._listeners: Dict[str, Tuple[Union[ADSMapper, "TagView"], Any]] = {}
+
+    @property
+    def capacity(self) -> int:
+        """Number of samples per signal."""
+        return self.memory_limit // (SAMPLE_SIZE * self.max_signals)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.buffers
+
+    def __getitem__(self, name: str) -> RingBuffer:
+        return self.buffers[name]
+
+    @property
+    def names(self) -> List[str]:
+        """Names of all signals."""
+        return list(self.buffers)
+
+    def add_signal(self, name: str) -> RingBuffer:
+        """Add a signal and allocate its ring buffer.
+
+        :param str name: name of the signal
+
+        """
+        if name in self.buffers:
+            return self.buffers[name]
+        if len(self.buffers) >= self.max_signals:
+            raise ValueError(
+                "Maximum number of %i signals exceeded" % self.max_signals
+            )
+        spill_path = None
+        if self.spill_dir is not None:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            spill_path = os.path.join(self.spill_dir, "%s.trend" % name)
+        buffer = self.buffers[name] = RingBuffer(self.capacity, spill_path)
+        return buffer
+
+    def remove_signal(self, name: str) -> None:
+        """Remove a signal and detach its mapper.
+
+        :param str name: name of the signal
+
+        """
+        self.detach(name)
+        self.buffers.pop(name, None)
+
+    def record(
+        self, name: str, value: VALUE_TYPE, timestamp: Optional[float] = None
+    ) -> None:
+        """Add a sample to a signal.
+
+        :param str name: name of the signal
+        :param value: value of the sample, None is ignored
+        :param float timestamp: time stamp in seconds since the epoch
+
+        """
+        if value is None:
+            return
+        self.buffers[name].append(float(value), timestamp)  # type: ignore
+
+    def attach(
+        self, mapper: Union[ADSMapper, "TagView"], name: Optional[str] = None
+    ) -> str:
+        """Record every value read by a mapper, failed reads as NaN.
+
+        :param mapper: :py:class:`ADSMapper` or tag view to record
+        :param str name: name of the signal, the symbol name or address of
+            the mapper by default
+        :return: name of the signal
+
+        """
+        if name is None:
+            name = mapper.symbol or str(mapper.plcAdr)
+        self.add_signal(name)
+        buffer = self.buffers[name]
+
+        def listener(sample: Sample) -> None:
+            value = float(sample.value) if sample.good else np.nan
+            buffer.append(value, sample.timestamp)
+
+        mapper.addListener(listener)
+        self._listeners[name] = (mapper, listener)
+        return name
+
+    def detach(self, name: str) -> None:
+        """Stop recording the mapper of a signal.
+
+        :param str name: name of the signal
+
+        """
+        if name in self._listeners:
+            mapper, listener = self._listeners.pop(name)
+            mapper.removeListener(listener)
+
+
+class TrendPlot:
+    """Plot of the latest values of recorded signals on a matplotlib canvas.
+
+    The x axis shows the time in seconds relative to now, so the axes only
+    need to be drawn again if the value range changes. Call
+    :py:meth:`refresh` cyclically, e.g. by a QTimer.
+
+    :param TrendRecorder recorder: recorder of the signals
+    :param canvas: matplotlib canvas, e.g. ``FigureCanvasQTAgg``
+    :param names: names of the signals to plot, all signals by default
+    :param float window: time window in seconds
+
+    Sample code::
+
+    >>> canvas = FigureCanvasQTAgg(Figure())
+    >>> plot = TrendPlot(recorder, canvas, window=30)
+    >>> timer.timeout.connect(plot.refresh)
+
+    """
+
+    def __init__(
+        self,
+        recorder: TrendRecorder,
+        canvas: Any,
+        names: Iterable[str] = None,
+        window: float = 10.0,
+    ) -> None:
+        self.recorder = recorder
+        self.canvas = canvas
+        self.window = window
+        self.names = list(recorder.names if names is None else names)
+
+        figure = canvas.figure
+        self.axes = figure.axes[0] if figure.axes else figure.add_subplot(1, 1, 1)
+        self.axes.set_xlim(-window, 0)
+        self.lines = {
+            name: self.axes.plot([], [], label=name, animated=True)[0]
+            for name in self.names
+        }
+        self.axes.legend(loc="upper left")
+        self._background: Any = None
+        canvas.mpl_connect("draw_event", self._on_draw)
+
+    def refresh(self) -> None:
+        """Redraw the lines with the latest samples."""
+        if self._background is None:
+            self.canvas.draw()
+            return
+
+        now = time.time()
+        bins = max(int(self.axes.bbox.width), 1)
+        low, high = np.inf, -np.inf
+        for name, line in self.lines.items():
+            times, values = self.recorder[name].data(since=now - self.window)
+            times, values = decimate_minmax(times, values, bins)
+            line.set_data(times - now, values)
+            if len(values) and not np.isnan(values).all():
+                low = min(low, float(np.nanmin(values)))
+                high = max(high, float(np.nanmax(values)))
+
+        bottom, top = self.axes.get_ylim()
+        if low < bottom or high > top:
+            margin = (high - low) * 0.1 or 1.0
+            self.axes.set_ylim(low - margin, high + margin)
+            self.canvas.draw()
+            return
+
+        self.canvas.restore_region(self._background)
+        for line in self.lines.values():
+            self.axes.draw_artist(line)
+        self.canvas.blit(self.axes.bbox)
+
+    def _on_draw(self, event: Any) -> None:
+        self._background = self.canvas.copy_from_bbox(self.axes.bbox)
+        for line in self.lines.values():
+            self.axes.draw_artist(line)
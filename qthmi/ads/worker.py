@@ -0,0 +1,257 @@
+"""Background thread for ADS communication.
+
+:license: MIT, see license file or https://opensource.org/licenses/MIT
+
+All ADS requests of the :py:class:`ADSWorker` are sent from a dedicated
+thread, so a slow or unreachable plc never blocks the Qt event loop. Results
+are handed back to the gui thread by a queued Qt signal and shown on the gui
+objects by :py:meth:`ADSMapper.update`.
+
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pyads
+from PyQt5.QtCore import QObject, Qt, pyqtSignal
+from . import metrics
+from .batch import (
+    MAX_SUM_REQUESTS, data_size, decode, encode, index_group, sum_read, sum_write
+)
+from .gui import ADSMapper, VALUE_TYPE
+from .ports import ADSError, PrivatePorts
+
+
+#: key of a plc value: (index group, address, datatype)
+KEY_TYPE = Tuple[int, int, Any]
+
+
+class ADSWorker(QObject):
+    """Worker thread for the ADS communication.
+
+    Read and write jobs are queued by the gui thread and processed by the
+    worker thread. Pending reads of the same address are coalesced into one
+    job and all pending reads are sent in ADS sum read requests. If a newer
+    value for an address arrives before the gui thread has shown the last
+    one, the stale value is dropped. Mappers that could not be read are
+    marked bad in the gui thread.
+
+    Write jobs are processed before read jobs in the order they were queued
+    and sent in ADS sum write requests. If a newer value for an address is
+    queued before the last one has been sent, only the newer one is written.
+    The worker thread uses a private port to the ADS router, so its requests
+    do not collide with requests of the gui thread, see
+    :py:class:`qthmi.ads.ports.PrivatePorts`.
+
+    :param pyads.AmsAddr adsAdr: address to the ADS device
+    :param QObject parent: parent object
+
+    Sample code::
+
+    >>> worker = ADSWorker(adsAdr)
+    >>> worker.error.connect(statusBar.showMessage)
+    >>> worker.start()
+    >>> timer.timeout.connect(lambda: worker.read_all(mappers))
+    >>> checkBox.stateChanged.connect(lambda state: worker.write(mapper, state))
+
+    """
+
+    error = pyqtSignal(str)
+    resultsReady = pyqtSignal()
+
+    def __init__(self, adsAdr: pyads.AmsAddr, parent: QObject = None) -> None:
+        super(ADSWorker, self).__init__(parent)
+        self.adsAdr = adsAdr
+
+        self._reads: Dict[KEY_TYPE, List[ADSMapper]] = OrderedDict()
+        self._writes: Dict[KEY_TYPE, VALUE_TYPE] = OrderedDict()
+        # (value, timestamp, error code, mappers) per address
+        self._results: Dict[
+            KEY_TYPE, Tuple[VALUE_TYPE, float, int, List[ADSMapper]]
+        ] = {}
+        self._scheduled = False
+        self._running = False
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+        self.resultsReady.connect(self._dispatch, Qt.QueuedConnection)
+
+    def start(self) -> None:
+        """Start the worker thread."""
+        if self._thread is not None:
+            return
+        self._running = True
+        self._thread = threading.Thread(
+            target=self._run, name="ADSWorker", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float = None) -> None:
+        """Stop the worker thread after the current job is finished.
+
+        Queued writes are still sent, queued reads are dropped.
+
+        :param float timeout: maximum time in seconds to wait for the thread
+
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def read(self, mapper: ADSMapper) -> None:
+        """Queue reading the value of a mapper.
+
+        :param ADSMapper mapper: mapper to read
+
+        """
+        key = (mapper.indexGroup, mapper.plcAdr, mapper.plcDataType)
+        with self._condition:
+            mappers = self._reads.setdefault(key, [])
+            if mapper not in mappers:
+                mappers.append(mapper)
+            self._condition.notify()
+
+    def read_all(self, mappers: List[ADSMapper]) -> None:
+        """Queue reading the values of several mappers.
+
+        :param mappers: mappers to read
+
+        """
+        for mapper in mappers:
+            self.read(mapper)
+
+    def write(self, mapper: ADSMapper, value: VALUE_TYPE) -> None:
+        """Queue writing a value to the plc address of a mapper.
+
+        :param ADSMapper mapper: mapper to write
+        :param value: value to be written
+
+        """
+        mapper.currentValue = value
+        self._queue_write(
+            (mapper.indexGroup, mapper.plcAdr, mapper.plcDataType), value
+        )
+
+    def write_to_plc(self, address: int, value: VALUE_TYPE, datatype: Any) -> None:
+        """Queue writing a value to a plc address.
+
+        :param int address: memory address
+        :param value: value to be written
+        :param datatype: ``c`` datatype, a PLCTYPE constant
+
+        """
+        self._queue_write((index_group(datatype), address, datatype), value)
+
+    def _queue_write(self, key: KEY_TYPE, value: VALUE_TYPE) -> None:
+        with self._condition:
+            # a newer value moves the address to the end of the queue
+            self._writes.pop(key, None)
+            self._writes[key] = value
+            self._condition.notify()
+
+    def _run(self) -> None:
+        ports = PrivatePorts()
+        ports.open()
+        try:
+            while True:
+                with self._condition:
+                    while self._running and not (self._reads or self._writes):
+                        self._condition.wait()
+                    writes, self._writes = self._writes, OrderedDict()
+                    reads, self._reads = self._reads, OrderedDict()
+                    if not self._running:
+                        # values set by the user must not get lost
+                        if writes:
+                            self._write(writes)
+                        break
+
+                if metrics.enabled:
+                    metrics.registry.queue_depth("worker_writes", len(writes))
+                    metrics.registry.queue_depth("worker_reads", len(reads))
+                with metrics.cycle("worker"):
+                    if writes:
+                        self._write(writes)
+                    if reads:
+                        self._read(reads)
+        finally:
+            ports.close()
+
+    def _write(self, writes: Dict[KEY_TYPE, VALUE_TYPE]) -> None:
+        keys = list(writes)
+        for start in range(0, len(keys), MAX_SUM_REQUESTS):
+            chunk = keys[start:start + MAX_SUM_REQUESTS]
+            try:
+                results = sum_write(self.adsAdr, [
+                    (ig, address, encode(dt, writes[ig, address, dt]))
+                    for ig, address, dt in chunk
+                ])
+            except ADSError as e:
+                self.error.emit(
+                    "Sum writing %i values (ErrorCode %i)" %
+                    (len(chunk), e.err_code)
+                )
+                continue
+
+            for (_, address, _), err in zip(chunk, results):
+                if err:
+                    self.error.emit(
+                        "Writing on address %i (ErrorCode %i)" % (address, err)
+                    )
+
+    def _read(self, reads: Dict[KEY_TYPE, List[ADSMapper]]) -> None:
+        keys = list(reads)
+        for start in range(0, len(keys), MAX_SUM_REQUESTS):
+            chunk = keys[start:start + MAX_SUM_REQUESTS]
+            results: Sequence[Tuple[int, Optional[memoryview]]]
+            try:
+                results = sum_read(
+                    self.adsAdr,
+                    [(ig, address, data_size(dt)) for ig, address, dt in chunk],
+                )
+            except ADSError as e:
+                self.error.emit(
+                    "Sum reading %i addresses (ErrorCode %i)" %
+                    (len(chunk), e.err_code)
+                )
+                results = [(e.err_code, None)] * len(chunk)
+            now = time.time()
+
+            values: Dict[KEY_TYPE, Tuple[VALUE_TYPE, float, int, List[ADSMapper]]] = {}
+            for key, (err, data) in zip(chunk, results):
+                if err or data is None:
+                    # the mappers are marked bad, the others are shown
+                    if data is not None:
+                        self.error.emit(
+                            "Reading from address %i (ErrorCode %i)" % (key[1], err)
+                        )
+                    values[key] = (None, now, err, reads[key])
+                else:
+                    values[key] = (decode(key[2], data), now, 0, reads[key])
+
+            with self._condition:
+                # newer values replace stale ones not shown yet
+                for key, (value, timestamp, err, mappers) in values.items():
+                    if key in self._results:
+                        stale = self._results[key][3]
+                        mappers += [m for m in stale if m not in mappers]
+                    self._results[key] = (value, timestamp, err, mappers)
+                if self._scheduled or not self._results:
+                    continue
+                self._scheduled = True
+            self.resultsReady.emit()
+
+    def _dispatch(self) -> None:
+        with self._condition:
+            results, self._results = self._results, {}
+            self._scheduled = False
+
+        for value, timestamp, err, mappers in results.values():
+            for mapper in mappers:
+                if err:
+                    mapper.markBad(err)
+                else:
+                    mapper.update(value, timestamp)